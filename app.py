@@ -2,189 +2,2661 @@ import os
 import re
 import os
 import re
+import atexit
+import bisect
+import hashlib
+import hmac
+import json
+import mimetypes
+import multiprocessing
+import queue
 import random
-from datetime import datetime, date
+import socket
+import tempfile
+import threading
+import time
+import unicodedata
+import uuid
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import wraps
+from types import MappingProxyType, SimpleNamespace
+from urllib.parse import urlsplit
+from datetime import datetime, date, timedelta
 from flask import (
     Flask, render_template, request, redirect,
-    url_for, flash, jsonify, session
+    url_for, flash, jsonify, session, abort, Response, stream_with_context,
+    send_from_directory
 )
 # Add these two lines to load the .env file
 from dotenv import load_dotenv
 load_dotenv()
 
+from flask.sessions import SecureCookieSessionInterface
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import (
     LoginManager, UserMixin, login_user, login_required,
     logout_user, current_user
 )
+from sqlalchemy import and_, func, inspect, or_, text, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.security import generate_password_hash, check_password_hash
+import numpy as np
 import requests
+from PIL import Image, UnidentifiedImageError
+
+import photo_variants
+from requests.adapters import HTTPAdapter
 
 # -------------------------------------------------------------------
 # Configuration
 # -------------------------------------------------------------------
 app = Flask(__name__)
 
-# Now the os.getenv calls below will find the variables from your .env file
-app.config['SECRET_KEY'] = os.getenv('HAPPYTRAILS_SECRET_KEY', 'happytrailssecretkey')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///happytrails.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Now the os.getenv calls below will find the variables from your .env file
+app.config['SECRET_KEY'] = os.getenv('HAPPYTRAILS_SECRET_KEY', 'happytrailssecretkey')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///happytrails.db')
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# How long browsers and proxies may reuse /api/search responses before revalidating
+app.config['SEARCH_CACHE_SECONDS'] = int(os.getenv('SEARCH_CACHE_SECONDS', '30'))
+# How long seats chosen on the seat map stay reserved while the traveller pays
+app.config['SEAT_HOLD_MINUTES'] = int(os.getenv('SEAT_HOLD_MINUTES', '10'))
+
+# Initialize database
+db = SQLAlchemy(app)
+login_manager = LoginManager(app)
+login_manager.login_view = 'login'
+
+# Google Maps API Key - Replace with your actual API key
+GOOGLE_MAPS_API_KEY = "YOUR_GOOGLE_MAPS_API_KEY"
+# OpenWeatherMap API Key - Replace with your actual API key
+WEATHER_API_KEY = os.getenv('WEATHER_API_KEY', "YOUR_OPENWEATHER_API_KEY")
+app.config['WEATHER_API_URL'] = os.getenv('WEATHER_API_URL', 'https://api.openweathermap.org/data/2.5/weather')
+# Weather is cached per city: fresh for WEATHER_CACHE_TTL seconds, then served
+# stale (while refreshing) for WEATHER_STALE_TTL more; failures for WEATHER_ERROR_TTL
+app.config['WEATHER_CACHE_TTL'] = int(os.getenv('WEATHER_CACHE_TTL', '600'))
+app.config['WEATHER_STALE_TTL'] = int(os.getenv('WEATHER_STALE_TTL', '3600'))
+app.config['WEATHER_ERROR_TTL'] = int(os.getenv('WEATHER_ERROR_TTL', '60'))
+# Background jobs (weather prefetch, expired hold cleanup); set to 0 to turn them off
+app.config['SCHEDULER_ENABLED'] = os.getenv('HAPPYTRAILS_SCHEDULER', '1') != '0'
+app.config['WEATHER_PREFETCH_SECONDS'] = int(os.getenv('WEATHER_PREFETCH_SECONDS', '60'))
+# How often live bus positions are sampled and pushed to /api/bus_stream listeners
+app.config['BUS_FEED_SECONDS'] = float(os.getenv('BUS_FEED_SECONDS', '5'))
+# Each stream listener holds a worker thread; hosts that can't keep long-lived
+# connections open (serverless) set this to 0 and pages poll instead
+app.config['BUS_STREAM_ENABLED'] = os.getenv('BUS_STREAM_ENABLED', '1') != '0'
+# Buses post GPS pings with this bearer token; ingestion is off while it's unset
+app.config['GPS_INGEST_TOKEN'] = os.getenv('GPS_INGEST_TOKEN', '')
+# Latest points kept in memory per bus, and the spacing of the points saved to bus_position
+app.config['GPS_BUFFER_SIZE'] = int(os.getenv('GPS_BUFFER_SIZE', '120'))
+app.config['GPS_HISTORY_SECONDS'] = int(os.getenv('GPS_HISTORY_SECONDS', '30'))
+# Per-bus traffic delays are reused for this long; buses this late are marked Delayed
+app.config['TRAFFIC_CACHE_SECONDS'] = int(os.getenv('TRAFFIC_CACHE_SECONDS', '30'))
+app.config['DELAYED_AFTER_MINUTES'] = int(os.getenv('DELAYED_AFTER_MINUTES', '5'))
+# Rendered content pages kept in memory, up to this many bytes of HTML
+app.config['PAGE_CACHE_BYTES'] = int(os.getenv('PAGE_CACHE_BYTES', str(16 * 1024 * 1024)))
+# Uploaded gallery photos (originals and resized copies) and the largest upload accepted
+app.config['GALLERY_STORAGE_DIR'] = os.getenv('GALLERY_STORAGE_DIR', os.path.join(app.instance_path, 'gallery'))
+app.config['GALLERY_MAX_UPLOAD_MB'] = int(os.getenv('GALLERY_MAX_UPLOAD_MB', '25'))
+# Worker processes resizing uploaded photos
+app.config['GALLERY_IMAGE_WORKERS'] = int(os.getenv('GALLERY_IMAGE_WORKERS', '2'))
+
+# Database Models
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    first_name = db.Column(db.String(50), nullable=False)
+    last_name = db.Column(db.String(50), nullable=False)
+    email = db.Column(db.String(100), unique=True, nullable=False)
+    phone = db.Column(db.String(20), nullable=False)
+    password_hash = db.Column(db.String(200), nullable=False)
+    bookings = db.relationship('Booking', backref='user', lazy=True)
+
+    def set_password(self, password):
+        self.password_hash = generate_password_hash(password)
+
+    def check_password(self, password):
+        return check_password_hash(self.password_hash, password)
+
+class Bus(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    bus_number = db.Column(db.String(20), nullable=False)
+    from_location = db.Column(db.String(100), nullable=False)
+    to_location = db.Column(db.String(100), nullable=False)
+    departure_time = db.Column(db.String(20), nullable=False)
+    arrival_time = db.Column(db.String(20), nullable=False)
+    status = db.Column(db.String(20), default='On Time')
+    capacity = db.Column(db.Integer, default=40)
+    price = db.Column(db.Float, nullable=False)
+    bus_type = db.Column(db.String(50), default='Standard')  # Standard, Deluxe, Premium
+    amenities = db.Column(db.String(200), default='Air Conditioning, Comfortable Seats')
+    bookings = db.relationship('Booking', backref='bus', lazy=True)
+
+    # Minutes since midnight, derived from the display strings above (see bus_schedule_minutes)
+    departure_minutes = db.Column(db.Integer)
+    arrival_minutes = db.Column(db.Integer)
+    duration_minutes = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index('ix_bus_route_departure', 'from_location', 'to_location', 'departure_minutes'),
+        db.Index('ix_bus_route_price', 'from_location', 'to_location', 'price'),
+        db.Index('ix_bus_route_duration', 'from_location', 'to_location', 'duration_minutes'),
+    )
+    
+    def available_seats(self, travel_date=None):
+        travel_date = travel_date or date.today()
+        inventory = SeatInventory.query.filter_by(bus_id=self.id, travel_date=travel_date).first()
+        return self.capacity - (inventory.booked_seats if inventory else 0)
+
+class BusStop(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    location = db.Column(db.String(200), nullable=False)
+    is_pickup = db.Column(db.Boolean, default=True)
+    is_dropoff = db.Column(db.Boolean, default=True)
+    city = db.Column(db.String(100), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_bus_stop_city', 'city'),
+    )
+
+class Booking(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    bus_id = db.Column(db.Integer, db.ForeignKey('bus.id'), nullable=False)
+    booking_date = db.Column(db.DateTime, default=datetime.utcnow)
+    travel_date = db.Column(db.Date, nullable=False)
+    seats = db.Column(db.Integer, default=1)
+    total_price = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20), default='Confirmed')
+    pickup_point = db.Column(db.String(100), nullable=True)
+    dropoff_point = db.Column(db.String(100), nullable=True)
+    seat_numbers = db.Column(db.String(100), nullable=True)  # Comma-separated seat numbers
+    payment_method = db.Column(db.String(50), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_booking_bus_date_status', 'bus_id', 'travel_date', 'status'),
+        db.Index('ix_booking_user_date_id', 'user_id', 'booking_date', 'id'),
+    )
+
+class SeatInventory(db.Model):
+    """Confirmed seat count and occupancy bitmap per bus and travel date.
+
+    Kept in step with bookings by confirm_booking/cancel_booking so that
+    availability is a single indexed lookup instead of a scan of Booking.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    bus_id = db.Column(db.Integer, db.ForeignKey('bus.id'), nullable=False)
+    travel_date = db.Column(db.Date, nullable=False)
+    booked_seats = db.Column(db.Integer, nullable=False, default=0)
+    seat_map = db.Column(db.LargeBinary, nullable=True)  # SeatMap bitmap of taken seats
+
+    __table_args__ = (
+        db.UniqueConstraint('bus_id', 'travel_date', name='uq_seat_inventory_bus_date'),
+    )
+
+class SeatHold(db.Model):
+    """Short-lived claim on one seat while a traveller pays for it.
+
+    Once the booking is confirmed the hold loses its expiry and keeps
+    the seat for booking_id, so the unique key also stops double sales.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    bus_id = db.Column(db.Integer, db.ForeignKey('bus.id'), nullable=False)
+    travel_date = db.Column(db.Date, nullable=False)
+    seat_number = db.Column(db.String(10), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=True)  # None once the seat is sold
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('bus_id', 'travel_date', 'seat_number', name='uq_seat_hold_seat'),
+        db.Index('ix_seat_hold_booking', 'booking_id'),
+    )
+
+class BusPosition(db.Model):
+    """GPS history, one point per bus every GPS_HISTORY_SECONDS at most."""
+    id = db.Column(db.Integer, primary_key=True)
+    bus_id = db.Column(db.Integer, db.ForeignKey('bus.id'), nullable=False)
+    recorded_at = db.Column(db.DateTime, nullable=False)
+    lat = db.Column(db.Float, nullable=False)
+    lng = db.Column(db.Float, nullable=False)
+    speed = db.Column(db.Float, nullable=True)  # km/h
+    heading = db.Column(db.Float, nullable=True)  # degrees from north
+
+    __table_args__ = (
+        db.Index('ix_bus_position_bus_recorded', 'bus_id', 'recorded_at'),
+    )
+
+class GalleryPhoto(db.Model):
+    """A travel gallery photo. Uploads are stored by content hash (see
+    PhotoStore) and go pending -> ready once their sizes are made; the
+    sample photos link to images hosted elsewhere instead."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # None for sample photos
+    content_hash = db.Column(db.String(64), nullable=True)  # sha256 of the original upload
+    image_url = db.Column(db.String(500), nullable=True)  # Sample photos hosted elsewhere
+    photographer = db.Column(db.String(100), nullable=True)  # Credit when there is no uploader
+    destination = db.Column(db.String(100), nullable=False)
+    photo_type = db.Column(db.String(50), nullable=False)
+    season = db.Column(db.String(20), nullable=False)
+    caption = db.Column(db.String(500), nullable=False)
+    location = db.Column(db.String(200), nullable=True)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    size_bytes = db.Column(db.Integer, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, ready, failed
+    variant_widths = db.Column(db.String(100), nullable=True)  # Comma-separated, once ready
+    likes = db.Column(db.Integer, nullable=False, default=0)
+    views = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    ready_at = db.Column(db.DateTime, nullable=True)
+    user = db.relationship('User')
+
+    __table_args__ = (
+        db.Index('ix_gallery_photo_hash', 'content_hash'),
+        db.Index('ix_gallery_photo_status_ready', 'status', 'ready_at'),
+        # One per /api/gallery sort order, with id to break ties for keyset pagination
+        db.Index('ix_gallery_photo_latest', 'status', 'created_at', 'id'),
+        db.Index('ix_gallery_photo_popular', 'status', 'likes', 'id'),
+        db.Index('ix_gallery_photo_views', 'status', 'views', 'id'),
+    )
+
+class GalleryFacetCount(db.Model):
+    """Ready gallery photos per destination, type and season.
+
+    Bumped as each photo becomes ready (count_gallery_photo), so the
+    gallery's filter counts never need a scan of gallery_photo.
+    """
+    facet = db.Column(db.String(20), primary_key=True)  # destination, type or season
+    value = db.Column(db.String(100), primary_key=True)
+    photos = db.Column(db.Integer, nullable=False, default=0)
+
+class GalleryTotal(db.Model):
+    """Summed likes and views of the ready gallery photos, one row per counter.
+
+    Bumped with the facet counts (count_gallery_photo), so the gallery's
+    header never sums over gallery_photo. Anything that changes a ready
+    photo's likes or views must bump these in the same transaction.
+    """
+    name = db.Column(db.String(20), primary_key=True)  # likes or views
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class SchemaVersion(db.Model):
+    """One row per applied migration (see MIGRATIONS)."""
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SchedulerLease(db.Model):
+    """Which process currently runs the exclusive background jobs."""
+    name = db.Column(db.String(50), primary_key=True)
+    owner = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+@login_manager.user_loader
+def load_user(user_id):
+    return User.query.get(int(user_id))
+
+# Outbound HTTP
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+class CircuitBreaker:
+    """Stops calling an upstream after repeated failures.
+
+    closed: calls go through. After `failure_threshold` failures in a row
+    it opens and calls fail immediately. After `reset_timeout` seconds one
+    trial call is let through (half-open); success closes it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+class OutboundClient:
+    """Shared HTTP client for third-party APIs.
+
+    One requests.Session keeps pooled keep-alive connections per host.
+    Every call has connect/read timeouts and a few retries with jittered
+    exponential backoff, all behind a per-host CircuitBreaker, so a slow
+    upstream can't tie up worker threads. Each failed attempt counts
+    against the breaker, and a whole call, retries included, gives up
+    after `total_timeout` seconds.
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=5, total_timeout=10, retries=2, backoff=0.25,
+                 pool_connections=10, pool_maxsize=20, failure_threshold=5, reset_timeout=30):
+        self.timeout = (connect_timeout, read_timeout)
+        self.total_timeout = total_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[host]
+
+    def get_json(self, url, params=None):
+        """GET url and decode the JSON body; 5xx, timeouts and connection errors are retried."""
+        host = urlsplit(url).netloc
+        breaker = self.breaker(host)
+        deadline = time.monotonic() + self.total_timeout
+        error = None
+        for attempt in range(self.retries + 1):
+            remaining = deadline - time.monotonic()
+            # Stop retrying once the time budget is spent or our own failures opened the breaker
+            if remaining <= 0 or not breaker.allow():
+                break
+            try:
+                response = self.session.get(url, params=params,
+                                            timeout=tuple(min(limit, remaining) for limit in self.timeout))
+                if response.status_code >= 500:
+                    raise requests.HTTPError(f"{response.status_code} from {url}", response=response)
+                data = response.json()
+            except (requests.RequestException, ValueError) as e:
+                error = e
+                breaker.record_failure()
+                if attempt < self.retries:
+                    # Full jitter, never sleeping past the deadline
+                    time.sleep(min(random.uniform(0, self.backoff * 2 ** attempt),
+                                   max(0, deadline - time.monotonic())))
+                continue
+            breaker.record_success()
+            return data
+        if error is None:
+            raise CircuitOpenError(f"{host} is failing, not calling it for now")
+        raise error
+
+    def stats(self):
+        with self._lock:
+            return {host: {'state': breaker.state, 'failures': breaker.failures}
+                    for host, breaker in self._breakers.items()}
+
+http_client = OutboundClient(
+    connect_timeout=float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05')),
+    read_timeout=float(os.getenv('HTTP_READ_TIMEOUT', '5')),
+    total_timeout=float(os.getenv('HTTP_TOTAL_TIMEOUT', '10')),
+    retries=int(os.getenv('HTTP_RETRIES', '2')),
+)
+
+# Helper function to get weather data
+def fetch_weather_data(city):
+    """Ask OpenWeatherMap for the current weather; None if the city isn't known."""
+    params = {'units': 'metric', 'appid': WEATHER_API_KEY}
+    # Small hill towns are looked up by where our routes start/end, by name otherwise
+    coordinates = route_city_coordinates().get(city)
+    if coordinates:
+        params['lat'], params['lon'] = coordinates
+    else:
+        params['q'] = city
+    data = http_client.get_json(app.config['WEATHER_API_URL'], params=params)
+    if str(data.get("cod")) == "200":
+        return {
+            "temperature": data["main"]["temp"],
+            "feels_like": data["main"].get("feels_like"),
+            "condition": data["weather"][0].get("main"),
+            "description": data["weather"][0]["description"],
+            "icon": data["weather"][0]["icon"],
+            "humidity": data["main"]["humidity"],
+            "pressure": data["main"].get("pressure"),
+            "visibility": data.get("visibility"),
+            "wind_speed": data["wind"]["speed"],
+            "sunrise": data.get("sys", {}).get("sunrise"),
+            "sunset": data.get("sys", {}).get("sunset"),
+        }
+    return None
+
+def route_city_coordinates():
+    """{city: [lat, lng]} taken from the ends of the Route Explorer routes."""
+    coordinates = {}
+    for route in ROUTE_EXPLORER_ROUTES:
+        coordinates.setdefault(route['from'], route['coordinates'][0])
+        coordinates.setdefault(route['to'], route['coordinates'][-1])
+    return coordinates
+
+class WeatherCache:
+    """Per-city weather cache with stale-while-revalidate and request coalescing.
+
+    - younger than `ttl`: served from memory
+    - up to `stale_ttl` past that: served as-is while one background
+      thread refreshes it
+    - missing or older: fetched, with concurrent callers for the same city
+      waiting on the one upstream call instead of making their own
+    Failed fetches are remembered for `error_ttl` seconds (keeping any
+    previous value) so an upstream outage isn't retried on every request.
+    """
+
+    def __init__(self, fetch, ttl=600, stale_ttl=3600, error_ttl=60, maxsize=256, wait_timeout=10):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.error_ttl = error_ttl
+        self.maxsize = maxsize
+        self.wait_timeout = wait_timeout
+        self._entries = {}  # city -> (value, fresh_until, stale_until)
+        self._inflight = {}  # city -> threading.Event set when the fetch finishes
+        self._lock = threading.Lock()
+        self.hits = self.stale_hits = self.misses = self.errors = 0
+
+    def get(self, city):
+        now = time.monotonic()
+        entry = self._entries.get(city)
+        if entry is not None:
+            value, fresh_until, stale_until = entry
+            if now < fresh_until:
+                self.hits += 1
+                return value
+            if now < stale_until:
+                self.stale_hits += 1
+                self._refresh_in_background(city)
+                return value
+        self.misses += 1
+        return self.refresh(city)
+
+    def refresh(self, city):
+        """Fetch city now (joining a fetch already in flight) and return the result."""
+        with self._lock:
+            done = self._inflight.get(city)
+            leader = done is None
+            if leader:
+                done = self._inflight[city] = threading.Event()
+        if not leader:
+            done.wait(self.wait_timeout)
+            entry = self._entries.get(city)
+            return entry[0] if entry else None
+
+        try:
+            value = self._fetch(city)
+            failed = value is None
+        except Exception as e:
+            print(f"Error fetching weather data: {e}")
+            value, failed = None, True
+        now = time.monotonic()
+        with self._lock:
+            if failed:
+                self.errors += 1
+                previous = self._entries.get(city)
+                if previous is not None and now < previous[2]:
+                    value = previous[0]
+                self._entries[city] = (value, now + self.error_ttl, now + self.error_ttl)
+            else:
+                self._entries[city] = (value, now + self.ttl, now + self.ttl + self.stale_ttl)
+            if len(self._entries) > self.maxsize:
+                oldest = min(self._entries, key=lambda key: self._entries[key][2])
+                del self._entries[oldest]
+            del self._inflight[city]
+        done.set()
+        return value
+
+    def expires_in(self, city):
+        """Seconds until city's entry goes stale (negative if already stale or missing)."""
+        entry = self._entries.get(city)
+        return entry[1] - time.monotonic() if entry else -1
+
+    def _refresh_in_background(self, city):
+        if city not in self._inflight:
+            threading.Thread(target=self.refresh, args=(city,), daemon=True).start()
+
+    def stats(self):
+        return {'size': len(self._entries), 'hits': self.hits, 'stale_hits': self.stale_hits,
+                'misses': self.misses, 'errors': self.errors}
+
+weather_cache = WeatherCache(
+    fetch_weather_data,
+    ttl=app.config['WEATHER_CACHE_TTL'],
+    stale_ttl=app.config['WEATHER_STALE_TTL'],
+    error_ttl=app.config['WEATHER_ERROR_TTL'],
+)
+
+def get_weather_data(city):
+    return weather_cache.get(city)
+
+# Seat inventory helpers
+SEAT_COLUMNS = 'ABCD'  # Two seats either side of the aisle, as laid out in select_seats.html
+SEAT_MAP_RETRIES = 5
+
+class SeatInventoryBusy(Exception):
+    """Raised when concurrent bookings keep winning the seat-map compare-and-swap."""
+
+def seat_index(seat_number):
+    """Map a seat label such as '3C' to its bit position (row by row, left to right)."""
+    row, column = int(seat_number[:-1]), seat_number[-1].upper()
+    return (row - 1) * len(SEAT_COLUMNS) + SEAT_COLUMNS.index(column)
+
+def seat_label(index):
+    row, column = divmod(index, len(SEAT_COLUMNS))
+    return f"{row + 1}{SEAT_COLUMNS[column]}"
+
+def is_valid_seat(seat_number, capacity):
+    if not re.fullmatch(rf'[1-9]\d*[{SEAT_COLUMNS}]', seat_number or ''):
+        return False
+    return seat_index(seat_number) < capacity
+
+class SeatMap:
+    """Occupancy bitmap for one bus on one date - bit i set means seat i is taken.
+
+    `seat_number in seat_map` works like the old list of booked seats,
+    but each check is a single bit test.
+    """
+    __slots__ = ('capacity', 'bits')
+
+    def __init__(self, capacity, bits=0):
+        self.capacity = capacity
+        self.bits = bits
+
+    @classmethod
+    def from_bytes(cls, capacity, data):
+        return cls(capacity, int.from_bytes(data or b'', 'little'))
+
+    def to_bytes(self):
+        return self.bits.to_bytes((self.capacity + 7) // 8, 'little')
+
+    def _bit(self, seat):
+        index = seat if isinstance(seat, int) else seat_index(seat)
+        if not 0 <= index < self.capacity:
+            raise ValueError(f"Seat {seat} does not exist on a {self.capacity}-seat bus")
+        return 1 << index
+
+    def __contains__(self, seat):
+        try:
+            return bool(self.bits & self._bit(seat))
+        except (ValueError, IndexError):
+            return False
+
+    def mark(self, seats):
+        for seat in seats:
+            self.bits |= self._bit(seat)
+
+    def release(self, seats):
+        for seat in seats:
+            self.bits &= ~self._bit(seat)
+
+    def taken_count(self):
+        return bin(self.bits).count('1')
+
+    def free_count(self):
+        return self.capacity - self.taken_count()
+
+    def first_free_run(self, count):
+        """Labels of the first `count` adjacent free seats, or None.
+
+        Groups that fit in a row are kept to one row; larger groups may
+        wrap onto the next one.
+        """
+        if count < 1 or count > self.capacity:
+            return None
+        free = ~self.bits & ((1 << self.capacity) - 1)
+        run = free
+        for shift in range(1, count):
+            run &= free >> shift
+        if count <= len(SEAT_COLUMNS):
+            last_start = len(SEAT_COLUMNS) - count
+            row_starts = 0
+            for index in range(0, self.capacity, len(SEAT_COLUMNS)):
+                row_starts |= ((1 << (last_start + 1)) - 1) << index
+            run &= row_starts
+        if not run:
+            return None
+        start = (run & -run).bit_length() - 1
+        return [seat_label(index) for index in range(start, start + count)]
+
+    def to_json(self):
+        return {'capacity': self.capacity, 'columns': SEAT_COLUMNS, 'taken': self.to_bytes().hex()}
+
+def seat_map_query(bus_id, travel_date):
+    return db.session.query(SeatInventory.seat_map).filter_by(bus_id=bus_id, travel_date=travel_date)
+
+def seat_map_for(bus, travel_date):
+    """Load the occupancy bitmap for a bus on a date with one indexed lookup."""
+    return SeatMap.from_bytes(bus.capacity, seat_map_query(bus.id, travel_date).scalar())
+
+def update_seat_inventory(bus_id, travel_date, seat_numbers, booked=True, seats=None):
+    """Mark seats as booked (or released) for a bus on a date. Caller commits.
+
+    `seats` overrides the counter change for bookings that predate seat numbers.
+
+    The bitmap and counter change together in one UPDATE guarded on the
+    bitmap we read (compare-and-swap), retried if a concurrent booking got
+    in first, so no row or table locks are held.
+    """
+    capacity = db.session.query(Bus.capacity).filter_by(id=bus_id).scalar()
+    seats = len(seat_numbers) if seats is None else seats
+    delta = seats if booked else -seats
+    for _ in range(SEAT_MAP_RETRIES):
+        current = db.session.query(SeatInventory.id, SeatInventory.seat_map).filter_by(
+            bus_id=bus_id, travel_date=travel_date).first()
+        seat_map = SeatMap.from_bytes(capacity, current.seat_map if current else None)
+        if booked:
+            seat_map.mark(seat_numbers)
+        else:
+            seat_map.release(seat_numbers)
+
+        if current is None:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(SeatInventory(bus_id=bus_id, travel_date=travel_date,
+                                                 booked_seats=max(delta, 0),
+                                                 seat_map=seat_map.to_bytes()))
+                return
+            except IntegrityError:
+                continue  # Another request created the row first
+
+        updated = SeatInventory.query.filter_by(id=current.id, seat_map=current.seat_map).update({
+            SeatInventory.seat_map: seat_map.to_bytes(),
+            SeatInventory.booked_seats: SeatInventory.booked_seats + delta,
+        }, synchronize_session=False)
+        if updated:
+            return
+    raise SeatInventoryBusy(f"Seat inventory for bus {bus_id} on {travel_date} is busy, please retry")
+
+def _upsert(model):
+    """Dialect-specific INSERT so ON CONFLICT clauses work on SQLite and Postgres."""
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def acquire_seat_holds(bus_id, travel_date, seat_numbers, user_id):
+    """Reserve seats for user_id for SEAT_HOLD_MINUTES. Caller commits.
+
+    All seats are claimed with one INSERT .. ON CONFLICT DO UPDATE that only
+    takes over a row when the existing hold has expired or already belongs to
+    this user, so two travellers racing for a seat can't both win. Returns
+    False (after rolling back) if any seat is held or sold to someone else.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(minutes=app.config['SEAT_HOLD_MINUTES'])
+
+    # Let go of anything this user held earlier in the funnel for this trip
+    SeatHold.query.filter(
+        SeatHold.bus_id == bus_id, SeatHold.travel_date == travel_date,
+        SeatHold.user_id == user_id, SeatHold.expires_at.isnot(None),
+        SeatHold.seat_number.notin_(seat_numbers),
+    ).delete(synchronize_session=False)
+
+    stmt = _upsert(SeatHold).values([
+        {'bus_id': bus_id, 'travel_date': travel_date, 'seat_number': seat_number,
+         'user_id': user_id, 'expires_at': expires_at}
+        for seat_number in seat_numbers
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['bus_id', 'travel_date', 'seat_number'],
+        set_={'user_id': stmt.excluded.user_id, 'expires_at': stmt.excluded.expires_at},
+        where=or_(SeatHold.expires_at < now,
+                  and_(SeatHold.user_id == user_id, SeatHold.expires_at.isnot(None))),
+    )
+    if db.session.execute(stmt).rowcount != len(seat_numbers):
+        db.session.rollback()
+        return False
+    return True
+
+def claim_seat_holds(bus_id, travel_date, seat_numbers, user_id, booking_id):
+    """Turn the user's live holds into permanent ones for booking_id. Caller commits.
+
+    A single conditional UPDATE; returns False if any hold has lapsed or
+    been taken over, in which case the seats must not be sold.
+    """
+    claimed = SeatHold.query.filter(
+        SeatHold.bus_id == bus_id, SeatHold.travel_date == travel_date,
+        SeatHold.seat_number.in_(seat_numbers), SeatHold.user_id == user_id,
+        SeatHold.expires_at >= datetime.utcnow(),
+    ).update({SeatHold.expires_at: None, SeatHold.booking_id: booking_id},
+             synchronize_session=False)
+    return claimed == len(seat_numbers)
+
+def held_seats_query(bus_id, travel_date, exclude_user_id=None):
+    query = db.session.query(SeatHold.seat_number).filter(
+        SeatHold.bus_id == bus_id, SeatHold.travel_date == travel_date,
+        SeatHold.expires_at >= datetime.utcnow(),
+    )
+    if exclude_user_id is not None:
+        query = query.filter(SeatHold.user_id != exclude_user_id)
+    return query
+
+def held_seats(bus_id, travel_date, exclude_user_id=None):
+    """Seats currently on hold for other travellers (expired holds don't count)."""
+    return [seat_number for (seat_number,) in held_seats_query(bus_id, travel_date, exclude_user_id)]
+
+def seats_available(buses, travel_date):
+    """Return {bus_id: free seats} for all buses on travel_date in one query."""
+    bus_ids = [bus.id for bus in buses]
+    booked = {}
+    if bus_ids:
+        booked = dict(
+            db.session.query(SeatInventory.bus_id, SeatInventory.booked_seats)
+            .filter(SeatInventory.bus_id.in_(bus_ids), SeatInventory.travel_date == travel_date)
+            .all()
+        )
+    return {bus.id: bus.capacity - booked.get(bus.id, 0) for bus in buses}
+
+def rebuild_seat_inventory():
+    """Recompute every counter and bitmap from confirmed bookings."""
+    SeatInventory.query.delete()
+    capacities = dict(db.session.query(Bus.id, Bus.capacity).all())
+    inventories = {}
+    confirmed = (
+        db.session.query(Booking.bus_id, Booking.travel_date, Booking.seats, Booking.seat_numbers)
+        .filter(Booking.status == 'Confirmed')
+        .yield_per(1000)
+    )
+    for bus_id, travel_date, seats, seat_numbers in confirmed:
+        key = (bus_id, travel_date)
+        if key not in inventories:
+            inventories[key] = [0, SeatMap(capacities.get(bus_id, 40))]
+        inventories[key][0] += seats or 0
+        if seat_numbers:
+            inventories[key][1].mark(seat_numbers.split(','))
+    for (bus_id, travel_date), (booked_seats, seat_map) in inventories.items():
+        db.session.add(SeatInventory(bus_id=bus_id, travel_date=travel_date,
+                                     booked_seats=booked_seats, seat_map=seat_map.to_bytes()))
+    db.session.commit()
+
+# Reference data change tracking
+# Bus and BusStop rows rarely change, so in-process indexes and caches built
+# from them are only refreshed when a commit actually writes those tables.
+# Listeners get {(model name, id): snapshot, or None if the row was deleted}.
+reference_data_listeners = []
+
+def on_reference_data_change(func):
+    reference_data_listeners.append(func)
+    return func
+
+def row_snapshot(obj):
+    """Detached, read-only copy of a model's columns, safe to keep across requests."""
+    return SimpleNamespace(**{column.key: getattr(obj, column.key) for column in obj.__table__.columns})
+
+# Rewritten every minute by update_bus_status; nothing built from reference data uses it
+LIVE_BUS_COLUMNS = frozenset({'status'})
+
+def changed_columns(obj):
+    return {attr.key for attr in inspect(obj).attrs if attr.history.has_changes()}
+
+@db.event.listens_for(db.session, 'after_flush')
+def _collect_reference_changes(session, flush_context):
+    changes = session.info.setdefault('reference_changes', {})
+    for obj in session.new | session.dirty:
+        if isinstance(obj, (Bus, BusStop)) and session.is_modified(obj):
+            if isinstance(obj, Bus) and obj not in session.new and changed_columns(obj) <= LIVE_BUS_COLUMNS:
+                continue
+            changes[(type(obj).__name__, obj.id)] = row_snapshot(obj)
+    for obj in session.deleted:
+        if isinstance(obj, (Bus, BusStop)):
+            changes[(type(obj).__name__, obj.id)] = None
+
+@db.event.listens_for(db.session, 'after_commit')
+def _publish_reference_changes(session):
+    changes = session.info.pop('reference_changes', None)
+    if changes:
+        for listener in reference_data_listeners:
+            listener(changes)
+
+@db.event.listens_for(db.session, 'after_rollback')
+def _discard_reference_changes(session):
+    session.info.pop('reference_changes', None)
+
+# Journey planner
+def parse_clock(value):
+    """'08:00 AM' (or '14:30') -> minutes since midnight."""
+    value = value.strip().upper()
+    # Blank input falls through to strptime, which raises ValueError like any bad time
+    parsed = datetime.strptime(value, '%I:%M %p' if value.endswith('M') else '%H:%M')
+    return parsed.hour * 60 + parsed.minute
+
+def format_clock(minutes):
+    """Minutes since midnight -> '08:00 AM'; trips past midnight wrap around."""
+    hours, minutes = divmod(int(minutes) % (24 * 60), 60)
+    return f"{(hours % 12) or 12:02d}:{minutes:02d} {'AM' if hours < 12 else 'PM'}"
+
+def format_duration(minutes):
+    hours, minutes = divmod(int(minutes), 60)
+    if not hours:
+        return f"{minutes}m"
+    return f"{hours}h {minutes}m" if minutes else f"{hours}h"
+
+def bus_schedule_minutes(departure_time, arrival_time):
+    """Numeric schedule columns for a bus from its '08:00 AM' style times."""
+    departure = parse_clock(departure_time)
+    arrival = parse_clock(arrival_time)
+    return {
+        'departure_minutes': departure,
+        'arrival_minutes': arrival,
+        'duration_minutes': (arrival - departure) % (24 * 60),  # Arrivals after midnight wrap
+    }
+
+@db.event.listens_for(Bus, 'before_insert')
+@db.event.listens_for(Bus, 'before_update')
+def _sync_bus_schedule_minutes(mapper, connection, bus):
+    for column_name, value in bus_schedule_minutes(bus.departure_time, bus.arrival_time).items():
+        setattr(bus, column_name, value)
+
+Connection = namedtuple('Connection', 'departure arrival from_location to_location bus_id bus_number price')
+
+def bus_connection(bus):
+    departure = bus.departure_minutes
+    return Connection(departure, departure + bus.duration_minutes, bus.from_location,
+                      bus.to_location, bus.id, bus.bus_number, bus.price)
+
+class JourneyPlanner:
+    """Multi-leg journeys over the daily timetable (Connection Scan Algorithm).
+
+    Every Bus row is one connection. They are kept in memory sorted by
+    departure, so a query is a single pass over that list with no SQL.
+    The index is patched bus by bus as rows change instead of rebuilt.
+    """
+
+    def __init__(self, min_transfer_minutes=10, max_legs=4):
+        self.min_transfer_minutes = min_transfer_minutes
+        self.max_legs = max_legs
+        self._lock = threading.Lock()
+        self._connections = []
+        self._by_bus = {}
+
+    def load(self, buses):
+        connections = {bus.id: bus_connection(bus) for bus in buses}
+        with self._lock:
+            self._by_bus = connections
+            self._connections = sorted(connections.values())
+
+    def update(self, bus):
+        with self._lock:
+            connections = self._without(bus.id)
+            connection = bus_connection(bus)
+            self._by_bus[bus.id] = connection
+            bisect.insort(connections, connection)
+            self._connections = connections
+
+    def remove(self, bus_id):
+        with self._lock:
+            self._connections = self._without(bus_id)
+
+    def _without(self, bus_id):
+        # Work on a copy so queries already scanning the old list are unaffected
+        connections = list(self._connections)
+        old = self._by_bus.pop(bus_id, None)
+        if old is not None:
+            connections.remove(old)
+        return connections
+
+    def plan(self, origin, destination, earliest_departure=0):
+        """Return {'earliest_arrival': itinerary, 'fewest_transfers': itinerary}.
+
+        Either value is None when the destination can't be reached. Each
+        itinerary is a dict with its legs (Connections), times and total price.
+        """
+        connections = self._connections  # Updates swap in new lists, so no lock needed
+        # reached[k][stop] = (arrival, connection) using exactly k legs
+        reached = [{origin: (earliest_departure, None)}] + [{} for _ in range(self.max_legs)]
+        start = bisect.bisect_left(connections, (earliest_departure,))
+        for connection in connections[start:]:
+            for legs in range(1, self.max_legs + 1):
+                previous = reached[legs - 1].get(connection.from_location)
+                if previous is None:
+                    continue
+                ready = previous[0] + (self.min_transfer_minutes if previous[1] else 0)
+                best = reached[legs].get(connection.to_location)
+                if connection.departure >= ready and (best is None or connection.arrival < best[0]):
+                    reached[legs][connection.to_location] = (connection.arrival, connection)
+
+        itineraries = [self._itinerary(reached, legs, destination)
+                       for legs in range(1, self.max_legs + 1)
+                       if destination in reached[legs]]
+        if not itineraries:
+            return {'earliest_arrival': None, 'fewest_transfers': None}
+        return {
+            'earliest_arrival': min(itineraries, key=lambda trip: (trip['arrival'], trip['transfers'])),
+            'fewest_transfers': itineraries[0],
+        }
+
+    @staticmethod
+    def _itinerary(reached, legs, destination):
+        trip, stop = [], destination
+        for count in range(legs, 0, -1):
+            connection = reached[count][stop][1]
+            trip.append(connection)
+            stop = connection.from_location
+        trip.reverse()
+        return {
+            'legs': trip,
+            'departure': trip[0].departure,
+            'arrival': trip[-1].arrival,
+            'transfers': legs - 1,
+            'price': sum(leg.price for leg in trip),
+        }
+
+journey_planner = JourneyPlanner()
+app.jinja_env.globals['format_clock'] = format_clock
+app.jinja_env.filters['duration'] = format_duration
+
+@on_reference_data_change
+def _refresh_journey_planner(changes):
+    for (model, bus_id), snapshot in changes.items():
+        if model != 'Bus':
+            continue
+        if snapshot is None:
+            journey_planner.remove(bus_id)
+        else:
+            journey_planner.update(snapshot)
+
+# Reference data cache
+class LRUCache:
+    """Thread-safe, size-bounded LRU cache with hit/miss counters.
+
+    Bounded by entry count, and optionally by total weight (e.g. bytes)
+    when entries are set with a weight and `maxweight` is given.
+    """
+
+    def __init__(self, maxsize=256, maxweight=None):
+        self.maxsize = maxsize
+        self.maxweight = maxweight
+        self.weight = 0
+        self._data = OrderedDict()
+        self._weights = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, weight=1):
+        if self.maxweight is not None and weight > self.maxweight:
+            return  # would push out everything else
+        with self._lock:
+            self.weight += weight - self._weights.get(key, 0)
+            self._data[key] = value
+            self._weights[key] = weight
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize or (self.maxweight is not None and self.weight > self.maxweight):
+                oldest, _ = self._data.popitem(last=False)
+                self.weight -= self._weights.pop(oldest)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, predicate=None):
+        """Drop every key, or only the keys for which predicate(key) is true."""
+        with self._lock:
+            if predicate is None:
+                self._data.clear()
+                self._weights.clear()
+                self.weight = 0
+                return
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+                self.weight -= self._weights.pop(key)
+
+    def stats(self):
+        with self._lock:
+            stats = {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits,
+                     'misses': self.misses, 'evictions': self.evictions}
+            if self.maxweight is not None:
+                stats.update(weight=self.weight, maxweight=self.maxweight)
+            return stats
+
+# Buses by city pair and stops by city, as read-only snapshots. Entries are
+# dropped when this process commits a Bus/BusStop write; other workers only
+# pick up such (rare, admin-side) edits on restart. Bus.status is the
+# exception: it is live data, so pages read it through live_bus_statuses().
+reference_cache = LRUCache(maxsize=int(os.getenv('REFERENCE_CACHE_SIZE', '512')))
+
+@on_reference_data_change
+def _invalidate_reference_cache(changes):
+    changed_models = {model for model, _ in changes}
+    if 'Bus' in changed_models:
+        reference_cache.invalidate(lambda key: key[0] in ('bus', 'buses'))
+    if 'BusStop' in changed_models:
+        reference_cache.invalidate(lambda key: key[0] == 'stops')
+
+def cached_bus(bus_id):
+    """Snapshot of one bus, or None if it doesn't exist."""
+    def load():
+        bus = db.session.get(Bus, bus_id)
+        return row_snapshot(bus) if bus else None
+    return reference_cache.get_or_load(('bus', bus_id), load)
+
+def cached_stops(city, kind):
+    """Pickup ('is_pickup') or drop-off ('is_dropoff') stops for a city."""
+    def load():
+        stops = BusStop.query.filter_by(city=city, **{kind: True}).order_by(BusStop.id).all()
+        return tuple(row_snapshot(stop) for stop in stops)
+    return reference_cache.get_or_load(('stops', city, kind), load)
+
+def served_cities():
+    """Every city some bus starts or ends in."""
+    def load():
+        pairs = db.session.query(Bus.from_location, Bus.to_location).distinct()
+        return frozenset(city for pair in pairs for city in pair)
+    return reference_cache.get_or_load(('buses', 'cities'), load)
+
+def fleet_ids():
+    """Ids of every bus, in order."""
+    def load():
+        return tuple(bus_id for (bus_id,) in db.session.query(Bus.id).order_by(Bus.id))
+    return reference_cache.get_or_load(('buses', 'ids'), load)
+
+BUS_STATUS_SECONDS = 15
+_bus_statuses = ({}, float('-inf'))  # ({bus_id: status}, monotonic time read)
+
+def live_bus_statuses():
+    """{bus_id: status} from the bus table, re-read at most every BUS_STATUS_SECONDS.
+
+    update_bus_status rewrites statuses every minute without invalidating
+    the cached snapshots, so every worker sees them within seconds.
+    """
+    global _bus_statuses
+    statuses, read_at = _bus_statuses
+    if time.monotonic() - read_at > BUS_STATUS_SECONDS:
+        statuses = dict(db.session.query(Bus.id, Bus.status))
+        _bus_statuses = (statuses, time.monotonic())
+    return statuses
+
+def with_live_status(buses):
+    """Copies of cached bus snapshots carrying their current status."""
+    statuses = live_bus_statuses()
+    return [SimpleNamespace(**{**vars(bus), 'status': statuses.get(bus.id, bus.status)}) for bus in buses]
+
+# Location autocomplete
+def normalize_search_text(value):
+    """Lower-case, strip accents and punctuation: 'Solán  Mall-Road' -> 'solan mall road'."""
+    value = unicodedata.normalize('NFKD', value)
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(re.findall(r'\w+', value.casefold()))
+
+class PrefixIndex:
+    """Sorted-array prefix index over place names.
+
+    Every word of a name is a key, so 'mall' finds 'Solan Mall Road'.
+    A lookup is a bisect plus a scan of the matching keys, entirely in memory.
+    """
+
+    def __init__(self, entries=()):
+        # entries: dicts with 'label', 'city', 'kind' and 'popularity'
+        self.entries = list(entries)
+        keys = []
+        for position, entry in enumerate(self.entries):
+            words = normalize_search_text(entry['label']).split()
+            for start in range(len(words)):
+                keys.append((' '.join(words[start:]), position))
+        keys.sort()
+        self._keys = [key for key, _ in keys]
+        self._positions = [position for _, position in keys]
+
+    def search(self, query, limit=8):
+        prefix = normalize_search_text(query)
+        if not prefix:
+            return []
+        matches = set()
+        index = bisect.bisect_left(self._keys, prefix)
+        while index < len(self._keys) and self._keys[index].startswith(prefix):
+            matches.add(self._positions[index])
+            index += 1
+        ranked = sorted(matches, key=lambda position: (-self.entries[position]['popularity'],
+                                                       self.entries[position]['label']))
+        return [self.entries[position] for position in ranked[:limit]]
+
+def build_location_index():
+    """Cities, bus stops and Route Explorer stops, ranked by how often they're used."""
+    entries = {}
+
+    def add(label, city, kind, popularity):
+        key = normalize_search_text(label)
+        if key in entries:
+            entries[key]['popularity'] += popularity
+        else:
+            entries[key] = {'label': label, 'city': city, 'kind': kind, 'popularity': popularity}
+
+    bookings_per_bus = dict(db.session.query(Booking.bus_id, func.count(Booking.id))
+                            .group_by(Booking.bus_id).all())
+    city_popularity = Counter()
+    for bus_id, from_location, to_location in db.session.query(Bus.id, Bus.from_location, Bus.to_location):
+        for city in (from_location, to_location):
+            city_popularity[city] += 1 + bookings_per_bus.get(bus_id, 0)
+    for city, popularity in city_popularity.items():
+        add(city, city, 'city', popularity)
+
+    stop_popularity = Counter()
+    for column in (Booking.pickup_point, Booking.dropoff_point):
+        stop_popularity.update(dict(db.session.query(column, func.count(Booking.id)).group_by(column).all()))
+    for name, city in db.session.query(BusStop.name, BusStop.city):
+        add(name, city, 'stop', 1 + stop_popularity.get(name, 0))
+
+    for route in ROUTE_EXPLORER_ROUTES:
+        for stop in route['stops_data']:
+            # Route stops don't record a city; credit the nearer end of the route
+            lat, lng = stop['coordinates']
+            start, end = route['coordinates'][0], route['coordinates'][-1]
+            nearer_start = (lat - start[0]) ** 2 + (lng - start[1]) ** 2 <= (lat - end[0]) ** 2 + (lng - end[1]) ** 2
+            add(stop['name'], route['from'] if nearer_start else route['to'], 'route_stop', 0)
+
+    return PrefixIndex(entries.values())
+
+class LocationAutocomplete:
+    """Holds the current PrefixIndex and rebuilds it off the keystroke path.
+
+    The index is built at startup, then rebuilt on a background thread after
+    Bus/BusStop writes and once it is `max_age` seconds old, so booking-driven
+    popularity stays current. A rebuild swaps the new index in with one
+    assignment; searches only ever read whichever index is current.
+    """
+
+    def __init__(self, max_age=600, retry_after=60):
+        self.max_age = max_age
+        self.retry_after = retry_after
+        self._index = PrefixIndex()
+        self._built_at = 0
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._dirty = False  # Data changed while a rebuild was running
+
+    def rebuild(self):
+        """Build a fresh index from the database and swap it in. Needs an app context."""
+        index = build_location_index()
+        self._index = index
+        self._built_at = time.monotonic()
+
+    def invalidate(self):
+        if self._built_at:  # Before the startup build there is nothing stale to replace
+            self._rebuild_in_background()
+
+    def search(self, query, limit=8):
+        if not self._rebuilding and time.monotonic() - self._built_at > self.max_age:
+            self._rebuild_in_background()
+        return self._index.search(query, limit)
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._rebuilding:
+                self._dirty = True
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_until_clean, name='autocomplete', daemon=True).start()
+
+    def _rebuild_until_clean(self):
+        while True:
+            try:
+                with app.app_context():
+                    self.rebuild()
+            except Exception as e:
+                # Keep serving the old index; try again in retry_after seconds
+                print(f"Error rebuilding autocomplete index: {e}")
+                self._built_at = time.monotonic() - self.max_age + self.retry_after
+            with self._lock:
+                if not self._dirty:
+                    self._rebuilding = False
+                    return
+                self._dirty = False
+
+location_autocomplete = LocationAutocomplete()
+
+@on_reference_data_change
+def _invalidate_location_autocomplete(changes):
+    location_autocomplete.invalidate()
+
+# Schema migrations
+# db.create_all() only creates missing tables, so changes to existing tables
+# (new columns, indexes, backfills) go here as numbered steps. Each one runs
+# once per database and is recorded in schema_version; write them so they are
+# safe to re-run against a freshly created schema.
+MIGRATIONS = []
+
+def migration(version, description):
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return func
+    return register
+
+def table_columns(table_name):
+    return {column['name'] for column in inspect(db.engine).get_columns(table_name)}
+
+def add_column(table_name, column_name, column_type):
+    if column_name not in table_columns(table_name):
+        db.session.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}'))
+        db.session.commit()
+
+def create_indexes(*names):
+    """Create the named model indexes if missing.
+
+    Names a later migration has since replaced are skipped, so old
+    migrations keep working on new databases.
+    """
+    indexes = {index.name: index for table in db.metadata.tables.values() for index in table.indexes}
+    for name in names:
+        if name in indexes:
+            indexes[name].create(db.engine, checkfirst=True)
+
+def drop_index(name):
+    db.session.execute(text(f'DROP INDEX IF EXISTS {name}'))
+    db.session.commit()
+
+def run_migrations():
+    applied = {version for (version,) in db.session.query(SchemaVersion.version)}
+    for version, description, func in MIGRATIONS:
+        if version in applied:
+            continue
+        func()
+        db.session.add(SchemaVersion(version=version, description=description))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker applied it at the same moment
+            db.session.rollback()
+            continue
+        print(f"Applied migration {version}: {description}")
+
+@migration(1, 'Rebuild seat_inventory with occupancy bitmaps')
+def _rebuild_seat_inventory_table():
+    # SeatInventory is derived from Booking, so a table from before the
+    # seat_map column existed is simply dropped and rebuilt
+    if 'seat_map' not in table_columns('seat_inventory'):
+        SeatInventory.__table__.drop(db.engine)
+        SeatInventory.__table__.create(db.engine)
+    if Booking.query.first():
+        rebuild_seat_inventory()
+
+@migration(2, 'Add indexes for search, seat map, my bookings and stop lookups')
+def _add_hot_path_indexes():
+    create_indexes('ix_bus_route', 'ix_bus_stop_city', 'ix_booking_bus_date_status',
+                   'ix_booking_user_date', 'ix_seat_hold_booking')
+
+@migration(3, 'Extend the my bookings index with id for keyset pagination')
+def _extend_my_bookings_index():
+    drop_index('ix_booking_user_date')
+    create_indexes('ix_booking_user_date_id')
+
+@migration(4, 'Add numeric departure/arrival/duration columns to bus')
+def _add_bus_minutes_columns():
+    for column_name in ('departure_minutes', 'arrival_minutes', 'duration_minutes'):
+        add_column('bus', column_name, 'INTEGER')
+    for bus_id, departure_time, arrival_time in db.session.query(
+            Bus.id, Bus.departure_time, Bus.arrival_time).all():
+        Bus.query.filter_by(id=bus_id).update(
+            bus_schedule_minutes(departure_time, arrival_time), synchronize_session=False)
+    db.session.commit()
+    drop_index('ix_bus_route')
+    create_indexes('ix_bus_route_departure', 'ix_bus_route_price', 'ix_bus_route_duration')
+
+@migration(5, 'Let gallery_photo hold sample photos; add gallery sort indexes and facet counts')
+def _extend_gallery_photo():
+    if 'image_url' not in table_columns('gallery_photo'):
+        # SQLite can't relax NOT NULL in place, so uploads are copied into a rebuilt table
+        drop_index('ix_gallery_photo_hash')
+        drop_index('ix_gallery_photo_status_ready')
+        db.session.execute(text('ALTER TABLE gallery_photo RENAME TO gallery_photo_old'))
+        db.session.commit()
+        GalleryPhoto.__table__.create(db.engine)
+        columns = ', '.join(sorted(table_columns('gallery_photo_old')))
+        db.session.execute(text(f'INSERT INTO gallery_photo ({columns}) SELECT {columns} FROM gallery_photo_old'))
+        db.session.execute(text('DROP TABLE gallery_photo_old'))
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(text("SELECT setval(pg_get_serial_sequence('gallery_photo', 'id'), "
+                                    "COALESCE(MAX(id), 0) + 1, false) FROM gallery_photo"))
+        db.session.commit()
+    create_indexes('ix_gallery_photo_latest', 'ix_gallery_photo_popular', 'ix_gallery_photo_views')
+    # Uploads used to keep the upload form's lowercase destination
+    for destination in db.session.query(GalleryPhoto.destination).distinct().all():
+        canonical = destination[0].title()
+        if canonical != destination[0]:
+            GalleryPhoto.query.filter_by(destination=destination[0]).update(
+                {'destination': canonical}, synchronize_session=False)
+    db.session.commit()
+    rebuild_gallery_facets()
+
+@migration(6, 'Seed the travel gallery with its sample photos')
+def _seed_gallery_photos():
+    if GalleryPhoto.query.filter(GalleryPhoto.image_url.isnot(None)).first():
+        return
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'travel_gallery.json')
+    with open(path, encoding='utf-8') as f:
+        samples = json.load(f)['photos']
+    now = datetime.utcnow()
+    for sample in samples:
+        photo = GalleryPhoto(image_url=sample['image'], photographer=sample['photographer'],
+                             destination=sample['destination'], photo_type=sample['type'],
+                             season=sample['season'], caption=sample['location'],
+                             location=sample['location'], likes=sample['likes'], views=sample['views'],
+                             status='ready', created_at=datetime.fromisoformat(sample['date']), ready_at=now)
+        db.session.add(photo)
+        count_gallery_photo(photo)
+    db.session.commit()
+
+@migration(7, 'Precompute gallery like and view totals')
+def _count_gallery_totals():
+    rebuild_gallery_facets()
+
+# Queries behind the busiest pages, checked by `flask --app app explain-hot-queries`
+HOT_QUERIES = {
+    'bus_results': lambda: bus_search_query('Solan', 'Barog', sort='departure'),
+    'bus_results_by_price': lambda: bus_search_query('Solan', 'Barog', sort='price'),
+    'bus_results_by_duration': lambda: bus_search_query('Solan', 'Barog', sort='duration'),
+    'select_bus': lambda: BusStop.query.filter_by(city='Solan', is_pickup=True),
+    'select_seats': lambda: seat_map_query(1, date.today()),
+    'select_seats_holds': lambda: held_seats_query(1, date.today(), exclude_user_id=1),
+    'my_bookings': lambda: my_bookings_page_query(1),
+    'my_bookings_next_page': lambda: my_bookings_page_query(1, (datetime.utcnow(), 1)),
+    'seat_inventory': lambda: SeatInventory.query.filter_by(bus_id=1, travel_date=date.today()),
+    'seat_holds': lambda: SeatHold.query.filter_by(bus_id=1, travel_date=date.today()),
+    'gallery_latest': lambda: gallery_page_query(sort='latest'),
+    'gallery_latest_next_page': lambda: gallery_page_query(sort='latest', cursor='2026-01-01T00:00:00_1'),
+    'gallery_popular': lambda: gallery_page_query(sort='popular'),
+    'gallery_popular_next_page': lambda: gallery_page_query(sort='popular', cursor='10_1'),
+    'gallery_views': lambda: gallery_page_query(sort='views'),
+    'gallery_views_next_page': lambda: gallery_page_query(sort='views', cursor='10_1'),
+    'gallery_filtered': lambda: gallery_page_query({'destination': 'Shimla', 'season': 'winter'}),
+}
+
+def explain_query(query):
+    """Return the database's query plan for an ORM query as a list of lines."""
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    connection = db.session.connection()
+    if db.engine.dialect.name == 'postgresql':
+        # Tiny tables make Postgres prefer sequential scans; ask whether an index *can* be used
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        rows = connection.exec_driver_sql('EXPLAIN ' + str(compiled), compiled.params)
+        return [row[0] for row in rows]
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params)
+    return [row[-1] for row in rows]
+
+def is_full_scan(plan_line):
+    if plan_line.lstrip(' ->').startswith('Seq Scan'):
+        return True
+    return plan_line.startswith('SCAN ') and 'INDEX' not in plan_line
+
+def plan_problems(plan):
+    """Lines of a query plan that mean a full table scan or a sort."""
+    return [line for line in plan if is_full_scan(line) or 'TEMP B-TREE' in line]
+
+@app.cli.command('explain-hot-queries')
+def explain_hot_queries():
+    """Fail if any hot query needs a full table scan or a sort."""
+    failures = 0
+    for name, build_query in HOT_QUERIES.items():
+        plan = explain_query(build_query())
+        bad = plan_problems(plan)
+        failures += bool(bad)
+        print(f"{'FAIL' if bad else 'ok  '} {name}: {' | '.join(line.strip() for line in plan)}")
+    db.session.rollback()
+    if failures:
+        raise SystemExit(1)
+
+# Background jobs
+class Scheduler:
+    """Runs registered jobs every `interval` seconds on one daemon thread.
+
+    Each run is pushed out by up to `jitter` (a fraction of the interval) so
+    workers started together don't all hit the same upstream at once.
+    Exclusive jobs only run in the process holding the database lease, which
+    it renews while alive; if it dies another process takes over once the
+    lease expires. Non-exclusive jobs (warming this process's own caches)
+    run in every process.
+    """
+
+    def __init__(self, lease_name='scheduler', lease_seconds=90, tick=1.0):
+        self.lease_name = lease_name
+        self.lease_seconds = lease_seconds
+        self.tick = tick
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.jobs = {}
+        self.is_leader = False
+        self._lease_checked = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def job(self, interval, jitter=0.1, exclusive=True, run_at_start=True):
+        """Decorator registering func as a periodic job."""
+        def register(func):
+            first = time.time() + (random.uniform(0, jitter * interval) if run_at_start else interval)
+            self.jobs[func.__name__] = SimpleNamespace(
+                name=func.__name__, func=func, interval=interval, jitter=jitter,
+                exclusive=exclusive, next_run=first, last_run=None, last_duration=None,
+                last_error=None, runs=0, failures=0)
+            return func
+        return register
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='scheduler', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self.is_leader:
+            with app.app_context():
+                SchedulerLease.query.filter_by(name=self.lease_name, owner=self.owner).delete()
+                db.session.commit()
+            self.is_leader = False
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.run_pending()
+            self._stop.wait(self.tick)
+
+    def run_pending(self, now=None):
+        """Run every job that is due; returns the names that ran."""
+        now = now or time.time()
+        due = [job for job in self.jobs.values() if job.next_run <= now]
+        if not due:
+            return []
+        with app.app_context():
+            if any(job.exclusive for job in due) or now - self._lease_checked > self.lease_seconds / 3:
+                self._renew_lease(now)
+            ran = []
+            for job in due:
+                if job.exclusive and not self.is_leader:
+                    # Check again next interval in case the leader went away
+                    job.next_run = now + job.interval
+                    continue
+                self._run(job)
+                ran.append(job.name)
+            return ran
+
+    def _run(self, job):
+        started = time.time()
+        try:
+            job.func()
+            job.last_error = None
+        except Exception as e:
+            db.session.rollback()
+            job.failures += 1
+            job.last_error = f'{type(e).__name__}: {e}'
+            print(f"Background job {job.name} failed: {e}")
+        finally:
+            db.session.remove()
+        job.runs += 1
+        job.last_run = started
+        job.last_duration = time.time() - started
+        job.next_run = time.time() + job.interval * (1 + random.uniform(0, job.jitter))
+
+    def _renew_lease(self, now):
+        """Take or extend the lease; another owner keeps it until it expires."""
+        self._lease_checked = now
+        utcnow = datetime.utcnow()
+        stmt = _upsert(SchedulerLease).values(
+            name=self.lease_name, owner=self.owner,
+            expires_at=utcnow + timedelta(seconds=self.lease_seconds))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['name'],
+            set_={'owner': stmt.excluded.owner, 'expires_at': stmt.excluded.expires_at},
+            where=or_(SchedulerLease.owner == self.owner, SchedulerLease.expires_at < utcnow),
+        )
+        try:
+            db.session.execute(stmt)
+            owner = db.session.query(SchedulerLease.owner).filter_by(name=self.lease_name).scalar()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Could not renew scheduler lease: {e}")
+            owner = None
+        self.is_leader = owner == self.owner
+
+    def status(self):
+        def stamp(seconds):
+            return datetime.utcfromtimestamp(seconds).isoformat(timespec='seconds') + 'Z' if seconds else None
+        return {
+            'owner': self.owner,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'leader': self.is_leader,
+            'jobs': {job.name: {
+                'interval': job.interval,
+                'exclusive': job.exclusive,
+                'last_run': stamp(job.last_run),
+                'last_duration': round(job.last_duration, 3) if job.last_duration is not None else None,
+                'next_run': stamp(job.next_run),
+                'runs': job.runs,
+                'failures': job.failures,
+                'last_error': job.last_error,
+            } for job in self.jobs.values()},
+        }
+
+scheduler = Scheduler()
+
+# Weather lives in this process's cache, so every process warms its own
+@scheduler.job(interval=app.config['WEATHER_PREFETCH_SECONDS'], exclusive=False)
+def prefetch_weather():
+    """Refresh each served city's weather before it goes stale."""
+    # Two intervals of headroom, since jitter can push the next run back
+    lead = 2 * app.config['WEATHER_PREFETCH_SECONDS']
+    for city in sorted(served_cities()):
+        if weather_cache.expires_in(city) < lead:
+            weather_cache.refresh(city)
+
+@scheduler.job(interval=300)
+def purge_expired_seat_holds():
+    """Delete holds whose payment window passed; sold seats (no expiry) stay."""
+    SeatHold.query.filter(SeatHold.expires_at < datetime.utcnow()).delete(synchronize_session=False)
+    db.session.commit()
+
+# GPS positions
+class GpsPoint:
+    __slots__ = ('recorded_at', 'lat', 'lng', 'speed', 'heading')
+
+    def __init__(self, recorded_at, lat, lng, speed=None, heading=None):
+        self.recorded_at = recorded_at  # unix seconds
+        self.lat = lat
+        self.lng = lng
+        self.speed = speed
+        self.heading = heading
+
+class PositionRing:
+    """The latest `size` points of one bus in a fixed list, overwriting the oldest."""
+    __slots__ = ('points', 'next', 'count')
+
+    def __init__(self, size):
+        self.points = [None] * size
+        self.next = 0
+        self.count = 0
+
+    def append(self, point):
+        self.points[self.next] = point
+        self.next = (self.next + 1) % len(self.points)
+        self.count = min(self.count + 1, len(self.points))
+
+    def latest(self):
+        return self.points[self.next - 1] if self.count else None
+
+    def recent(self, limit=None):
+        """Newest first."""
+        limit = self.count if limit is None else min(limit, self.count)
+        return [self.points[(self.next - 1 - i) % len(self.points)] for i in range(limit)]
+
+class PositionStore:
+    """Latest GPS points per bus, in memory, plus a downsampled history queue.
+
+    Every accepted ping goes into the bus's ring; one every `history_seconds`
+    is also queued for bus_position and written in bulk by flush().
+    Pings older than the bus's latest point are ignored.
+    """
+
+    def __init__(self, size=120, history_seconds=30, flush_at=1000):
+        self.size = size
+        self.history_seconds = history_seconds
+        self.flush_at = flush_at
+        self._rings = {}
+        self._last_saved = {}  # bus_id -> recorded_at of the last point queued for history
+        self._pending = []
+        self._lock = threading.Lock()
+        self.accepted = self.stale = self.saved = 0
+
+    def add(self, bus_id, point):
+        with self._lock:
+            ring = self._rings.get(bus_id)
+            if ring is None:
+                ring = self._rings[bus_id] = PositionRing(self.size)
+            latest = ring.latest()
+            if latest is not None and point.recorded_at <= latest.recorded_at:
+                self.stale += 1
+                return False
+            ring.append(point)
+            self.accepted += 1
+            if point.recorded_at - self._last_saved.get(bus_id, 0) >= self.history_seconds:
+                self._last_saved[bus_id] = point.recorded_at
+                self._pending.append({
+                    'bus_id': bus_id, 'recorded_at': datetime.utcfromtimestamp(point.recorded_at),
+                    'lat': point.lat, 'lng': point.lng, 'speed': point.speed, 'heading': point.heading,
+                })
+            return True
+
+    def latest(self, bus_id):
+        ring = self._rings.get(bus_id)
+        return ring.latest() if ring else None
+
+    def recent(self, bus_id, limit=None):
+        with self._lock:
+            ring = self._rings.get(bus_id)
+            return ring.recent(limit) if ring else []
+
+    def observed_speed(self, bus_id, window=60):
+        """km/h between the latest point and one about `window` seconds before it."""
+        points = self.recent(bus_id)
+        if len(points) < 2:
+            return None
+        latest = points[0]
+        earlier = next((p for p in points[1:] if latest.recorded_at - p.recorded_at >= window), points[-1])
+        hours = (latest.recorded_at - earlier.recorded_at) / 3600
+        return float(haversine_km(earlier.lat, earlier.lng, latest.lat, latest.lng)) / hours if hours else None
+
+    def needs_flush(self):
+        return len(self._pending) >= self.flush_at
+
+    def flush(self):
+        """Write queued history points with one bulk INSERT. Commits."""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if rows:
+            try:
+                db.session.execute(db.insert(BusPosition), rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                with self._lock:
+                    self._pending[:0] = rows
+                raise
+            self.saved += len(rows)
+        return len(rows)
+
+    def stats(self):
+        return {'buses': len(self._rings), 'accepted': self.accepted, 'stale': self.stale,
+                'pending': len(self._pending), 'saved': self.saved}
+
+position_store = PositionStore(
+    size=app.config['GPS_BUFFER_SIZE'],
+    history_seconds=app.config['GPS_HISTORY_SECONDS'],
+)
+
+def parse_gps_ping(ping, fleet):
+    """(bus_id, GpsPoint) from one posted ping, or None if it isn't usable."""
+    try:
+        bus_id = int(ping['bus_id'])
+        lat, lng = float(ping['lat']), float(ping['lng'])
+        recorded_at = float(ping.get('ts') or time.time())
+        speed = float(ping['speed']) if ping.get('speed') is not None else None
+        heading = float(ping['heading']) if ping.get('heading') is not None else None
+    except (KeyError, TypeError, ValueError):
+        return None
+    if bus_id not in fleet or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    # Clocks drift; anything claiming to be from the future is a bad ping
+    if recorded_at > time.time() + 60:
+        return None
+    return bus_id, GpsPoint(recorded_at, lat, lng, speed, heading)
+
+# Each process keeps its own buffer, so each one flushes its own history
+@scheduler.job(interval=10, exclusive=False, run_at_start=False)
+def flush_gps_history():
+    position_store.flush()
+
+# Route ETAs
+EARTH_RADIUS_KM = 6371.0
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km; works elementwise on NumPy arrays."""
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(h))
+
+def route_for_bus(bus):
+    """The Route Explorer route a bus drives: same bus number, else same endpoints."""
+    for route in ROUTE_EXPLORER_ROUTES:
+        if route['busNumber'] == bus.bus_number:
+            return route
+    for route in ROUTE_EXPLORER_ROUTES:
+        if (route['from'], route['to']) == (bus.from_location, bus.to_location):
+            return route
+    return None
+
+class RouteArrays(namedtuple('RouteArrays', 'route_of route_ids vertices cumulative length '
+                                             'stop_km stop_names scheduled_speed')):
+    """One build of the EtaEngine's route arrays.
+
+    route_of maps bus_id -> row, route_ids row -> Route Explorer route id,
+    scheduled_speed bus_id -> km/h implied by the timetable. A reload
+    builds a whole new RouteArrays and swaps it in with one assignment, so
+    readers holding the old one never see half of each.
+    """
+    __slots__ = ()
+
+    def snap(self, points, rows):
+        """For each position, the distance along its row's route of the nearest point on it,
+        how far off the route it is, and which segment that nearest point is on."""
+        ends = self.vertices[rows]
+        start, end = ends[:, :-1], ends[:, 1:]
+        # Flat projection with longitude scaled by cos(latitude): metres off at this scale
+        scale = np.cos(np.radians(points[:, 0]))[:, None]
+        px, py = points[:, 1:2] * scale, points[:, 0:1]
+        ax, ay = start[..., 1] * scale, start[..., 0]
+        dx, dy = end[..., 1] * scale - ax, end[..., 0] - ay
+        length2 = dx * dx + dy * dy
+        t = np.clip(((px - ax) * dx + (py - ay) * dy) / np.where(length2 > 0, length2, 1), 0, 1)
+        qx, qy = ax + t * dx, ay + t * dy
+        nearest = ((px - qx) ** 2 + (py - qy) ** 2).argmin(axis=1)
+
+        i = np.arange(len(rows))
+        cumulative = self.cumulative[rows]
+        along = cumulative[i, nearest] + t[i, nearest] * (cumulative[i, nearest + 1] - cumulative[i, nearest])
+        off = haversine_km(points[:, 0], points[:, 1], qy[i, nearest], qx[i, nearest] / scale[:, 0])
+        return along, off, nearest
+
+class EtaEngine:
+    """Snaps live positions onto route polylines and estimates arrival times.
+
+    Every route's vertices, cumulative distances and stop offsets live in
+    arrays padded to a common length, so the whole fleet is projected onto
+    its routes in one pass of array operations rather than a Python loop
+    per bus and segment. Buses further than `max_off_route_km` from their
+    route (or without one) get no ETA.
+    """
+
+    def __init__(self, max_off_route_km=1.0, min_speed_kmh=5.0, default_speed_kmh=30.0):
+        self.max_off_route_km = max_off_route_km
+        self.min_speed_kmh = min_speed_kmh
+        self.default_speed_kmh = default_speed_kmh
+        self.stale = True
+        self.routes = self.build([])
+
+    def load(self, buses):
+        self.routes = self.build(buses)
+
+    def build(self, buses):
+        """RouteArrays for the routes these buses drive."""
+        routes, rows = [], {}
+        route_of, scheduled_minutes = {}, {}
+        for bus in buses:
+            route = route_for_bus(bus)
+            if route is None or len(route['coordinates']) < 2:
+                continue
+            if route['id'] not in rows:
+                rows[route['id']] = len(routes)
+                routes.append(route)
+            route_of[bus.id] = rows[route['id']]
+            scheduled_minutes[bus.id] = bus.duration_minutes
+
+        vertex_count = max((len(route['coordinates']) for route in routes), default=2)
+        stop_count = max((len(route['stops_data']) for route in routes), default=1)
+        vertices = np.zeros((len(routes), vertex_count, 2))
+        cumulative = np.zeros((len(routes), vertex_count))
+        # Short routes repeat their last vertex; the padding segments have zero length
+        for row, route in enumerate(routes):
+            points = np.array(route['coordinates'], dtype=float)
+            vertices[row, :len(points)] = points
+            vertices[row, len(points):] = points[-1]
+            segments = haversine_km(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1])
+            cumulative[row, 1:len(points)] = np.cumsum(segments)
+            cumulative[row, len(points):] = cumulative[row, len(points) - 1]
+        length = cumulative[:, -1] if len(routes) else np.zeros(0)
+        arrays = RouteArrays(
+            route_of=route_of,
+            route_ids=[route['id'] for route in routes],
+            vertices=vertices,
+            cumulative=cumulative,
+            length=length,
+            stop_km=np.full((len(routes), stop_count), np.nan),  # NaN padding is never "ahead"
+            stop_names=[[stop['name'] for stop in route['stops_data']] or [route['to']] for route in routes],
+            scheduled_speed={
+                bus_id: length[route_of[bus_id]] * 60 / minutes if minutes else self.default_speed_kmh
+                for bus_id, minutes in scheduled_minutes.items()
+            },
+        )
+        for row, route in enumerate(routes):
+            stops = route['stops_data']
+            if stops:
+                points = np.array([stop['coordinates'] for stop in stops], dtype=float)
+                arrays.stop_km[row, :len(stops)], _, _ = arrays.snap(points, np.full(len(stops), row))
+        return arrays
+
+    def fleet_etas(self, locations, delays=None, now=None):
+        """{bus_id: ETA dict or None} for every bus in locations ({bus_id: {'lat', 'lng', 'speed'}})."""
+        delays = delays or {}
+        now = now or datetime.now()
+        routes = self.routes  # One consistent build, even if a reload swaps in another meanwhile
+        bus_ids = [bus_id for bus_id in locations if bus_id in routes.route_of]
+        etas = dict.fromkeys(locations)
+        if not bus_ids:
+            return etas
+
+        rows = np.array([routes.route_of[bus_id] for bus_id in bus_ids])
+        points = np.array([[locations[bus_id]['lat'], locations[bus_id]['lng']] for bus_id in bus_ids])
+        along, off, _ = routes.snap(points, rows)
+
+        # The next stop is the first one more than 50 m ahead; past the last, the destination
+        stop_km = routes.stop_km[rows]
+        ahead = stop_km > along[:, None] + 0.05
+        has_next = ahead.any(axis=1)
+        next_stop = ahead.argmax(axis=1)
+        length = routes.length[rows]
+        to_next = np.where(has_next, stop_km[np.arange(len(rows)), next_stop], length) - along
+        to_end = length - along
+
+        observed = np.array([locations[bus_id].get('speed') or np.nan for bus_id in bus_ids], dtype=float)
+        scheduled = np.array([routes.scheduled_speed[bus_id] for bus_id in bus_ids])
+        speed = np.maximum(np.where(np.isnan(observed), scheduled, observed), self.min_speed_kmh)
+        # An observed speed already reflects traffic; only timetable speeds need the delay added
+        delay = np.array([delays.get(bus_id, 0) for bus_id in bus_ids], dtype=float)
+        delay[~np.isnan(observed)] = 0
+        # Spread the traffic delay over the rest of the trip
+        share = np.divide(to_next, to_end, out=np.ones_like(to_end), where=to_end > 0)
+        next_minutes = to_next / speed * 60 + delay * share
+        end_minutes = to_end / speed * 60 + delay
+
+        clock = now.hour * 60 + now.minute
+        for k, bus_id in enumerate(bus_ids):
+            if off[k] > self.max_off_route_km:
+                continue
+            names = routes.stop_names[rows[k]]
+            etas[bus_id] = {
+                'next_stop': names[next_stop[k]] if has_next[k] else names[-1],
+                'next_stop_minutes': int(round(next_minutes[k])),
+                'arrival_minutes': int(round(end_minutes[k])),
+                'arrival_time': format_clock(clock + round(end_minutes[k])),
+                'remaining_km': round(float(to_end[k]), 1),
+                'progress': round(float(along[k] / length[k]), 3) if length[k] else 1.0,
+            }
+        return etas
+
+eta_engine = EtaEngine()
+
+@on_reference_data_change
+def _invalidate_eta_engine(changes):
+    if any(model == 'Bus' for model, _ in changes):
+        eta_engine.stale = True
+
+def ensure_eta_engine():
+    """Reload routes if buses changed since the last load. Needs an app context."""
+    if eta_engine.stale:
+        eta_engine.stale = False  # Cleared first, so a change landing mid-load marks it stale again
+        eta_engine.load(Bus.query.all())
+
+def live_etas(locations, delays=None):
+    """ETAs for the given positions. Needs an app context."""
+    ensure_eta_engine()
+    return eta_engine.fleet_etas(locations, delays)
+
+# Traffic model
+def traffic_level(delay_minutes):
+    if delay_minutes >= 15:
+        return "Heavy"
+    return "Moderate" if delay_minutes >= 5 else "Light"
+
+class TrafficModel:
+    """Per-segment speed estimates from GPS, turned into per-bus delays.
+
+    Each route segment keeps an exponential moving average of the speeds
+    buses were seen doing on it. A bus's delay is how much longer the rest
+    of its route takes at those speeds than at its timetable speed.
+    Segments ahead without a recent observation (within `stale_after`
+    seconds) are assumed to run at the route's recent average pace; routes
+    with no recent data at all count as on schedule. Delays are cached per
+    bus for `ttl` seconds, so every poller and tab sees the same answer.
+    """
+
+    def __init__(self, alpha=0.3, ttl=30, stale_after=900, max_speed_kmh=120):
+        self.alpha = alpha
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self.max_speed_kmh = max_speed_kmh
+        self.speeds = {}  # route id -> (average km/h per segment, unix time last observed)
+        self._delays = {}  # bus_id -> (traffic dict, expires at)
+        self._lock = threading.Lock()
+        self.observations = self.hits = self.misses = 0
+
+    def _segments(self, route_id, count):
+        ema, seen = self.speeds.get(route_id, (np.full(0, np.nan), np.zeros(0)))
+        if len(ema) < count:
+            # The longest route grew; pad rather than forget what we know
+            ema = np.concatenate([ema, np.full(count - len(ema), np.nan)])
+            seen = np.concatenate([seen, np.zeros(count - len(seen))])
+            self.speeds[route_id] = (ema, seen)
+        return ema, seen
+
+    def observe(self, moves):
+        """Learn from [(bus_id, previous GpsPoint, new GpsPoint)]. Needs an app context."""
+        ensure_eta_engine()
+        routes = eta_engine.routes
+        moves = [move for move in moves if move[0] in routes.route_of]
+        if not moves:
+            return
+        rows = np.array([routes.route_of[bus_id] for bus_id, _, _ in moves])
+        points = np.array([[point.lat, point.lng] for _, _, point in moves])
+        previous = np.array([[point.lat, point.lng] for _, point, _ in moves])
+        _, off, segment = routes.snap(points, rows)
+
+        # Prefer the speed the bus reported; otherwise distance over time since its last ping
+        hours = np.array([(point.recorded_at - before.recorded_at) / 3600 for _, before, point in moves])
+        reported = np.array([np.nan if point.speed is None else point.speed for _, _, point in moves], dtype=float)
+        travelled = haversine_km(previous[:, 0], previous[:, 1], points[:, 0], points[:, 1])
+        derived = np.divide(travelled, hours, out=np.full_like(hours, np.nan), where=hours >= 1 / 3600)
+        speed = np.where(np.isnan(reported), derived, reported)
+        usable = (off <= eta_engine.max_off_route_km) & (speed >= 0) & (speed <= self.max_speed_kmh)
+
+        count = routes.vertices.shape[1] - 1
+        with self._lock:
+            for k in np.flatnonzero(usable):
+                ema, seen = self._segments(routes.route_ids[rows[k]], count)
+                recorded_at = moves[k][2].recorded_at
+                i = segment[k]
+                if np.isnan(ema[i]) or recorded_at - seen[i] > self.stale_after:
+                    ema[i] = speed[k]
+                else:
+                    ema[i] += self.alpha * (speed[k] - ema[i])
+                seen[i] = recorded_at
+            self.observations += int(usable.sum())
+
+    def traffic(self, bus_ids):
+        """{bus_id: {'traffic_status', 'delay_minutes'}}, computed together for cache misses."""
+        now = time.time()
+        result, missing = {}, []
+        for bus_id in bus_ids:
+            cached = self._delays.get(bus_id)
+            if cached is not None and cached[1] > now:
+                result[bus_id] = cached[0]
+            else:
+                missing.append(bus_id)
+        self.hits += len(result)
+        if missing:
+            self.misses += len(missing)
+            for bus_id, traffic in self._compute(missing, now).items():
+                self._delays[bus_id] = (traffic, now + self.ttl)
+                result[bus_id] = traffic
+        return result
+
+    def _compute(self, bus_ids, now):
+        result = {bus_id: {'traffic_status': 'Unknown', 'delay_minutes': 0} for bus_id in bus_ids}
+        arrays = eta_engine.routes
+        live = []
+        for bus_id in bus_ids:
+            point = position_store.latest(bus_id)
+            if bus_id in arrays.route_of and point is not None and now - point.recorded_at < self.stale_after:
+                live.append((bus_id, point))
+        if not live:
+            return result
+
+        rows = np.array([arrays.route_of[bus_id] for bus_id, _ in live])
+        points = np.array([[point.lat, point.lng] for _, point in live])
+        _, off, segment = arrays.snap(points, rows)
+
+        # Per route, from each segment to the end: expected hours and the km they cover
+        routes, count = arrays.vertices.shape[:2]
+        expected_hours = np.zeros((routes, count))
+        expected_km = np.zeros((routes, count))
+        with self._lock:
+            for row, route_id in enumerate(arrays.route_ids):
+                if route_id not in self.speeds:
+                    continue
+                ema, seen = self._segments(route_id, count - 1)
+                ema, seen = ema[:count - 1], seen[:count - 1]
+                lengths = np.diff(arrays.cumulative[row])
+                known = ~np.isnan(ema) & (now - seen < self.stale_after) & (ema > 0)
+                if not known.any():
+                    continue
+                hours = np.where(known, lengths / np.where(known, ema, 1), 0)
+                # Unobserved segments go at the pace of the observed ones
+                pace = hours.sum() / lengths[known].sum() if lengths[known].sum() else 0
+                hours = np.where(known, hours, lengths * pace)
+                expected_hours[row, :-1] = np.cumsum(hours[::-1])[::-1]
+                expected_km[row, :-1] = np.cumsum(lengths[::-1])[::-1]
+
+        scheduled = np.array([arrays.scheduled_speed[bus_id] for bus_id, _ in live])
+        delay = 60 * (expected_hours[rows, segment] - expected_km[rows, segment] / scheduled)
+        for k, (bus_id, _) in enumerate(live):
+            if off[k] <= eta_engine.max_off_route_km:
+                minutes = max(int(round(delay[k])), 0)
+                result[bus_id] = {'traffic_status': traffic_level(minutes), 'delay_minutes': minutes}
+        return result
+
+    def stats(self):
+        return {'segments': int(sum((~np.isnan(ema)).sum() for ema, _ in self.speeds.values())),
+                'observations': self.observations, 'hits': self.hits, 'misses': self.misses}
+
+traffic_model = TrafficModel(ttl=app.config['TRAFFIC_CACHE_SECONDS'])
+
+@scheduler.job(interval=60)
+def update_bus_status():
+    """Set Bus.status from the traffic model for buses it has recent data on.
+
+    The traffic model only learns from pings that reached this process, so
+    with several workers statuses reflect the scheduler leader's share of
+    them (see GPS Ingestion in the README).
+    """
+    ensure_eta_engine()
+    traffic = traffic_model.traffic(fleet_ids())
+    for bus in Bus.query.filter(Bus.id.in_(list(traffic))):
+        if traffic[bus.id]['traffic_status'] == 'Unknown':
+            continue
+        status = 'Delayed' if traffic[bus.id]['delay_minutes'] >= app.config['DELAYED_AFTER_MINUTES'] else 'On Time'
+        if bus.status != status:
+            bus.status = status
+    db.session.commit()
+
+# Gallery photo uploads
+# Uploads are streamed straight to disk while being hashed, kept once per
+# content hash, and resized into GALLERY_PHOTO_WIDTHS (JPEG and WebP) by a
+# process pool. The upload request returns as soon as the original is saved.
+GALLERY_PHOTO_WIDTHS = (320, 640, 1280, 1920)
+GALLERY_UPLOAD_FORMATS = {'JPEG', 'MPO', 'PNG', 'WEBP'}  # MPO: phone JPEGs with extra frames
+CONTENT_HASH = re.compile(r'^[0-9a-f]{64}$')
+
+class IncomingUpload:
+    """Temporary file for an upload being received; hashes what is written to it."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(dir=directory, suffix='.part', delete=False)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+class PhotoStore:
+    """Content-addressed files under GALLERY_STORAGE_DIR.
+
+    originals/ab/<sha256>           the upload, byte for byte
+    variants/ab/<sha256>/<w>.<ext>  resized copies (photo_variants.FORMATS)
+    incoming/                       uploads still being received
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def incoming(self):
+        return IncomingUpload(os.path.join(self.root, 'incoming'))
+
+    def original_path(self, digest):
+        return os.path.join(self.root, 'originals', digest[:2], digest)
+
+    def variant_dir(self, digest):
+        return os.path.join(self.root, 'variants', digest[:2], digest)
+
+    def save(self, upload):
+        """Move a received upload to its content address; returns (digest, size).
+
+        Bytes already stored under the same hash are kept and the new copy dropped.
+        """
+        upload.file.close()
+        digest = upload.sha256.hexdigest()
+        path = self.original_path(digest)
+        if os.path.exists(path):
+            os.unlink(upload.name)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(upload.name, path)
+        return digest, upload.size
+
+    def discard(self, upload):
+        upload.file.close()
+        if os.path.exists(upload.name):
+            os.unlink(upload.name)
+
+photo_store = PhotoStore(app.config['GALLERY_STORAGE_DIR'])
+
+class UploadRequest(app.request_class):
+    """Streams gallery uploads into the photo store instead of a spooled temp file."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint == 'upload_gallery_photo':
+            return photo_store.incoming()
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+app.request_class = UploadRequest
+
+def probe_photo(stream):
+    """(format, width, height) as displayed, read from the image header only; None if not an image."""
+    try:
+        with Image.open(stream) as image:
+            width, height = image.size
+            # EXIF orientations 5-8 are rotated a quarter turn
+            if image.getexif().get(0x0112) in (5, 6, 7, 8):
+                width, height = height, width
+            return image.format, width, height
+    except (UnidentifiedImageError, OSError):
+        return None
+    finally:
+        stream.seek(0)
+
+class PhotoPipeline:
+    """Makes uploaded photos' resized copies in worker processes and marks them ready.
 
-# Initialize database
-db = SQLAlchemy(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+    Workers are spawned, not forked: a fork would copy this process with its
+    scheduler, bus feed and database pool threads mid-flight. A spawned
+    worker starts a fresh interpreter and runs photo_variants.render_variants.
+    Under `python app.py` it also re-imports this module as __mp_main__, so
+    the startup at the bottom of the module skips that case.
+    """
 
-# Google Maps API Key - Replace with your actual API key
-GOOGLE_MAPS_API_KEY = "YOUR_GOOGLE_MAPS_API_KEY"
-# OpenWeatherMap API Key - Replace with your actual API key
-WEATHER_API_KEY = "YOUR_OPENWEATHER_API_KEY"
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._in_flight = set()
+        self._renders = {}  # digest -> future of the render making its variants
+        self._lock = threading.Lock()
+        self.completed = self.failed = 0
 
-# Database Models
-class User(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    first_name = db.Column(db.String(50), nullable=False)
-    last_name = db.Column(db.String(50), nullable=False)
-    email = db.Column(db.String(100), unique=True, nullable=False)
-    phone = db.Column(db.String(20), nullable=False)
-    password_hash = db.Column(db.String(200), nullable=False)
-    bookings = db.relationship('Booking', backref='user', lazy=True)
+    def submit(self, photo_id, digest):
+        with self._lock:
+            if photo_id in self._in_flight:
+                return
+            self._in_flight.add(photo_id)
+            # Variants are stored by digest, so uploads of the same bytes share one render
+            future = self._renders.get(digest)
+            started = future is None
+            if started:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                         mp_context=multiprocessing.get_context('spawn'))
+                    atexit.register(self._executor.shutdown, wait=False)
+                future = self._executor.submit(photo_variants.render_variants, photo_store.original_path(digest),
+                                               photo_store.variant_dir(digest), GALLERY_PHOTO_WIDTHS)
+                self._renders[digest] = future
+        # Outside the lock: a render that already finished runs its callbacks right away
+        if started:
+            future.add_done_callback(lambda done: self._forget(digest, done))
+        future.add_done_callback(lambda done: self._finished(photo_id, done))
 
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+    def _forget(self, digest, future):
+        with self._lock:
+            if self._renders.get(digest) is future:
+                del self._renders[digest]
 
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+    def _finished(self, photo_id, future):
+        try:
+            widths = future.result()
+        except Exception as e:
+            widths = None
+            app.logger.warning('Resizing gallery photo %s failed: %s', photo_id, e)
+        try:
+            with app.app_context():
+                mark_photo_processed(photo_id, widths)
+        finally:
+            with self._lock:
+                self._in_flight.discard(photo_id)
+                if widths is None:
+                    self.failed += 1
+                else:
+                    self.completed += 1
 
-class Bus(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    bus_number = db.Column(db.String(20), nullable=False)
-    from_location = db.Column(db.String(100), nullable=False)
-    to_location = db.Column(db.String(100), nullable=False)
-    departure_time = db.Column(db.String(20), nullable=False)
-    arrival_time = db.Column(db.String(20), nullable=False)
-    status = db.Column(db.String(20), default='On Time')
-    capacity = db.Column(db.Integer, default=40)
-    price = db.Column(db.Float, nullable=False)
-    bus_type = db.Column(db.String(50), default='Standard')  # Standard, Deluxe, Premium
-    amenities = db.Column(db.String(200), default='Air Conditioning, Comfortable Seats')
-    bookings = db.relationship('Booking', backref='bus', lazy=True)
-    
-    def available_seats(self):
-        booked_seats = sum(booking.seats for booking in self.bookings if booking.status == 'Confirmed')
-        return self.capacity - booked_seats
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'in_flight': len(self._in_flight), 'renders': len(self._renders),
+                    'completed': self.completed, 'failed': self.failed}
 
-class BusStop(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    location = db.Column(db.String(200), nullable=False)
-    is_pickup = db.Column(db.Boolean, default=True)
-    is_dropoff = db.Column(db.Boolean, default=True)
-    city = db.Column(db.String(100), nullable=False)
+photo_pipeline = PhotoPipeline(app.config['GALLERY_IMAGE_WORKERS'])
 
-class Booking(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    bus_id = db.Column(db.Integer, db.ForeignKey('bus.id'), nullable=False)
-    booking_date = db.Column(db.DateTime, default=datetime.utcnow)
-    travel_date = db.Column(db.Date, nullable=False)
-    seats = db.Column(db.Integer, default=1)
-    total_price = db.Column(db.Float, nullable=False)
-    status = db.Column(db.String(20), default='Confirmed')
-    pickup_point = db.Column(db.String(100), nullable=True)
-    dropoff_point = db.Column(db.String(100), nullable=True)
-    seat_numbers = db.Column(db.String(100), nullable=True)  # Comma-separated seat numbers
-    payment_method = db.Column(db.String(50), nullable=True)
+def mark_photo_processed(photo_id, widths):
+    """Record a finished resize: ready with its variant widths, or failed."""
+    pending = GalleryPhoto.query.filter_by(id=photo_id, status='pending')
+    if widths is None:
+        pending.update({'status': 'failed'}, synchronize_session=False)
+    elif pending.update({'status': 'ready', 'variant_widths': ','.join(map(str, widths)),
+                         'ready_at': datetime.utcnow()}, synchronize_session=False):
+        # Only whoever flipped it to ready counts it, even if it was resized twice
+        count_gallery_photo(db.session.get(GalleryPhoto, photo_id))
+    db.session.commit()
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
+def finished_variants(digest):
+    """Widths already rendered for these bytes by an earlier upload, or None."""
+    ready = (GalleryPhoto.query.with_entities(GalleryPhoto.variant_widths)
+             .filter_by(content_hash=digest, status='ready').first())
+    return ready.variant_widths if ready else None
 
-# Helper function to get weather data
-def get_weather_data(city):
-    try:
-        url = f"https://api.openweathermap.org/data/2.5/weather?q={city}&units=metric&appid={WEATHER_API_KEY}"
-        response = requests.get(url)
-        data = response.json()
-        if data["cod"] == 200:
+def photo_variant_url(photo, width, ext):
+    return url_for('gallery_media', digest=photo.content_hash, width=width, ext=ext)
+
+def gallery_photo_card(photo):
+    """A ready photo as the travel gallery renders it; uploads also get srcsets."""
+    card = {
+        'id': photo.id, 'image': photo.image_url,
+        'location': photo.location or photo.caption, 'destination': photo.destination,
+        'type': photo.photo_type, 'season': photo.season,
+        'photographer': photo.photographer or (photo.user.first_name if photo.user else ''),
+        'date': photo.created_at.strftime('%Y-%m-%d'), 'likes': photo.likes, 'views': photo.views,
+    }
+    if photo.content_hash:
+        widths = [int(width) for width in photo.variant_widths.split(',')]
+        display = next((width for width in widths if width >= 640), widths[-1])
+        card.update(
+            image=photo_variant_url(photo, display, 'jpg'),
+            srcset=', '.join(f"{photo_variant_url(photo, width, 'jpg')} {width}w" for width in widths),
+            webp_srcset=', '.join(f"{photo_variant_url(photo, width, 'webp')} {width}w" for width in widths),
+            width=photo.width, height=photo.height)
+    return card
+
+# Gallery browsing
+# /api/gallery pages through ready photos newest, most liked or most viewed
+# first, seeking past the last photo shown (keyset pagination) on the
+# matching ix_gallery_photo_* index. Filter counts come from gallery_facet_count.
+GALLERY_PAGE_SIZE = 24
+GALLERY_FACETS = {'destination': 'destination', 'type': 'photo_type', 'season': 'season'}
+GALLERY_PHOTO_TYPES = ('landscape', 'people', 'bus', 'heritage')
+GALLERY_SEASONS = ('spring', 'summer', 'monsoon', 'autumn', 'winter')
+GALLERY_SORTS = {'latest': 'created_at', 'popular': 'likes', 'views': 'views'}
+
+def count_gallery_photo(photo, delta=1):
+    """Add a photo that just became ready to the facet counts and totals. Caller commits."""
+    stmt = _upsert(GalleryFacetCount).values([
+        {'facet': facet, 'value': getattr(photo, attribute), 'photos': delta}
+        for facet, attribute in GALLERY_FACETS.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['facet', 'value'],
+        set_={'photos': GalleryFacetCount.__table__.c.photos + stmt.excluded.photos},
+    )
+    db.session.execute(stmt)
+    # A new upload's likes and views are still None until it is flushed
+    stmt = _upsert(GalleryTotal).values([
+        {'name': 'likes', 'value': (photo.likes or 0) * delta},
+        {'name': 'views', 'value': (photo.views or 0) * delta},
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['name'],
+        set_={'value': GalleryTotal.__table__.c.value + stmt.excluded.value},
+    )
+    db.session.execute(stmt)
+
+def rebuild_gallery_facets():
+    """Recount gallery_facet_count and gallery_total from scratch (migrations only)."""
+    GalleryFacetCount.query.delete()
+    for facet, attribute in GALLERY_FACETS.items():
+        column = getattr(GalleryPhoto, attribute)
+        for value, photos in (db.session.query(column, func.count(GalleryPhoto.id))
+                              .filter(GalleryPhoto.status == 'ready').group_by(column)):
+            db.session.add(GalleryFacetCount(facet=facet, value=value, photos=photos))
+    GalleryTotal.query.delete()
+    likes, views = (db.session.query(func.sum(GalleryPhoto.likes), func.sum(GalleryPhoto.views))
+                    .filter(GalleryPhoto.status == 'ready').one())
+    db.session.add_all([GalleryTotal(name='likes', value=likes or 0), GalleryTotal(name='views', value=views or 0)])
+    db.session.commit()
+
+def gallery_facets():
+    """{facet: {value: ready photos}} for destination, type and season."""
+    facets = {facet: {} for facet in GALLERY_FACETS}
+    for row in GalleryFacetCount.query.filter(GalleryFacetCount.photos > 0):
+        facets[row.facet][row.value] = row.photos
+    return facets
+
+def gallery_totals():
+    """{'likes': ..., 'views': ...} over every ready photo."""
+    return {'likes': 0, 'views': 0, **dict(db.session.query(GalleryTotal.name, GalleryTotal.value))}
+
+def parse_gallery_cursor(sort, cursor):
+    """(sort value, id) of the last photo on the previous page; ValueError if malformed."""
+    value, photo_id = cursor.rsplit('_', 1)
+    return (datetime.fromisoformat(value) if sort == 'latest' else int(value)), int(photo_id)
+
+def gallery_page_query(filters=None, sort='latest', cursor=None):
+    """Ready photos in `sort` order, seeking past `cursor` along the matching index."""
+    column = getattr(GalleryPhoto, GALLERY_SORTS[sort])
+    query = (GalleryPhoto.query.options(joinedload(GalleryPhoto.user))
+             .filter(GalleryPhoto.status == 'ready')
+             .order_by(column.desc(), GalleryPhoto.id.desc()))
+    for facet, value in (filters or {}).items():
+        query = query.filter(getattr(GalleryPhoto, GALLERY_FACETS[facet]) == value)
+    if cursor:
+        query = query.filter(tuple_(column, GalleryPhoto.id) < parse_gallery_cursor(sort, cursor))
+    return query
+
+def gallery_page(filters=None, sort='latest', cursor=None, limit=GALLERY_PAGE_SIZE):
+    """One page of ready photo cards and the cursor for the next page (None on the last)."""
+    photos = gallery_page_query(filters, sort, cursor).limit(limit + 1).all()
+    next_cursor = None
+    if len(photos) > limit:
+        photos = photos[:limit]
+        last = photos[-1]
+        value = getattr(last, GALLERY_SORTS[sort])
+        next_cursor = '{}_{}'.format(value.isoformat() if sort == 'latest' else value, last.id)
+    return [gallery_photo_card(photo) for photo in photos], next_cursor
+
+@scheduler.job(interval=60)
+def resume_pending_photos():
+    """Requeue uploads stuck in pending (e.g. their process exited mid-resize) and clear abandoned partial uploads."""
+    stalled = datetime.utcnow() - timedelta(minutes=2)
+    for photo in GalleryPhoto.query.filter(GalleryPhoto.status == 'pending', GalleryPhoto.created_at < stalled):
+        photo_pipeline.submit(photo.id, photo.content_hash)
+    # Uploads cut off mid-transfer leave their partial file behind
+    incoming = os.path.join(photo_store.root, 'incoming')
+    if os.path.isdir(incoming):
+        for entry in os.scandir(incoming):
+            if entry.name.endswith('.part') and time.time() - entry.stat().st_mtime > 3600:
+                os.unlink(entry.path)
+
+# Live bus positions
+# Buses that report GPS are shown where they last were. For the demo the rest
+# drive their Route Explorer route at timetable speed, so they sit on the same
+# line the EtaEngine snaps to; a bus without a route has no position.
+DEMO_STEP_SECONDS = 30
+
+def sample_bus_location(bus_id):
+    """Demo position along the bus's route, or None if it has none. Needs an app context."""
+    ensure_eta_engine()
+    routes = eta_engine.routes
+    row = routes.route_of.get(bus_id)
+    if row is None:
+        return None
+
+    # Step to the next point every DEMO_STEP_SECONDS, staggered per bus, so
+    # each feed sample only has the few demo buses that actually moved to send
+    step = (time.time() + bus_id * 7) // DEMO_STEP_SECONDS
+    length = routes.length[row]
+    start = (bus_id * 0.618 % 1) * length  # buses sharing a route start spread out along it
+    km = (start + step * DEMO_STEP_SECONDS / 3600 * routes.scheduled_speed[bus_id]) % length if length else 0
+    cumulative, vertices = routes.cumulative[row], routes.vertices[row]
+    i = min(int(np.searchsorted(cumulative, km, side='right')) - 1, len(cumulative) - 2)
+    segment = cumulative[i + 1] - cumulative[i]
+    lat, lng = vertices[i] + (vertices[i + 1] - vertices[i]) * ((km - cumulative[i]) / segment if segment else 0)
+    # The same status the search results show, demo position or not
+    return {"lat": float(lat), "lng": float(lng), "status": live_bus_statuses().get(bus_id, "Unknown")}
+
+def current_bus_location(bus_id):
+    """Latest GPS point for the bus, else a demo position; None if there is neither."""
+    point = position_store.latest(bus_id)
+    if point is None:
+        return sample_bus_location(bus_id)
+    return {
+        "lat": point.lat,
+        "lng": point.lng,
+        "status": live_bus_statuses().get(bus_id, "Unknown"),
+        "recorded_at": datetime.utcfromtimestamp(point.recorded_at).isoformat(timespec='seconds') + 'Z',
+        "speed": point.speed if point.speed is not None else position_store.observed_speed(bus_id),
+        "heading": point.heading,
+    }
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+class FeedSubscriber:
+    """One stream listener: which bus it follows and its pending events."""
+    __slots__ = ('bus_id', 'queue', 'lagged')
+
+    def __init__(self, bus_id, queue_size):
+        self.bus_id = bus_id
+        self.queue = queue.Queue(queue_size)
+        self.lagged = False
+
+class BusFeed:
+    """One producer thread sampling the fleet, fanned out to every stream listener.
+
+    Only changes are published: a 'position' or 'traffic' event for the bus
+    that moved. Each subscriber has a bounded queue; one that can't keep up
+    is never allowed to block the producer or grow memory. Its backlog is
+    dropped and it is sent a fresh snapshot instead. The producer only runs
+    while someone is listening.
+    """
+
+    def __init__(self, interval=5, queue_size=64):
+        self.interval = interval
+        self.queue_size = queue_size
+        self.positions = {}  # bus_id -> {'bus_id', 'lat', 'lng', 'status'}
+        self.traffic = {}  # bus_id -> {'bus_id', 'traffic_status', 'delay_minutes'}
+        self._last_tick = None
+        self.version = 0  # bumped on every sample that moved something
+        self.epoch = uuid.uuid4().hex[:8]  # tells this process's versions apart from other workers' and restarts'
+        self.changed_at = {}  # bus_id -> version it last moved in
+        self.removed_at = {}  # bus_id -> version it left the fleet in
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.published = self.dropped = 0
+
+    def subscribe(self, bus_id=None):
+        """Listen to one bus, or the whole fleet when bus_id is None."""
+        subscriber = FeedSubscriber(bus_id, self.queue_size)
+        with self._lock:
+            if not self.positions:
+                self._tick()
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='bus-feed', daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def snapshot(self, bus_id=None):
+        # _tick mutates these dicts under the lock; read them under it too
+        with self._lock:
             return {
-                "temperature": data["main"]["temp"],
-                "description": data["weather"][0]["description"],
-                "icon": data["weather"][0]["icon"],
-                "humidity": data["main"]["humidity"],
-                "wind_speed": data["wind"]["speed"]
+                'positions': [p for p in self.positions.values() if bus_id in (None, p['bus_id'])],
+                'traffic': [t for t in self.traffic.values() if bus_id in (None, t['bus_id'])],
             }
-    except Exception as e:
-        print(f"Error fetching weather data: {e}")
-    return None
+
+    def position(self, bus_id):
+        with self._lock:
+            return self.positions.get(bus_id)
+
+    def bus_traffic(self, bus_id):
+        with self._lock:
+            return self.traffic.get(bus_id)
+
+    def events(self, subscriber, keepalive=15):
+        """Server-sent event text for one subscriber, starting with a snapshot."""
+        yield 'retry: 5000\n\n'
+        yield sse_event('snapshot', self.snapshot(subscriber.bus_id))
+        while True:
+            try:
+                event, data = subscriber.queue.get(timeout=keepalive)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            if subscriber.lagged:
+                subscriber.lagged = False
+                yield sse_event('snapshot', self.snapshot(subscriber.bus_id))
+                continue
+            yield sse_event(event, data)
+
+    def publish(self, event, data):
+        for subscriber in list(self._subscribers):
+            if subscriber.bus_id not in (None, data['bus_id']):
+                continue
+            try:
+                subscriber.queue.put_nowait((event, data))
+            except queue.Full:
+                # Too slow: forget what it missed and resync it from a snapshot
+                self.dropped += 1
+                subscriber.lagged = True
+                with subscriber.queue.mutex:
+                    subscriber.queue.queue.clear()
+                subscriber.queue.put_nowait(('snapshot', None))
+        self.published += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+                try:
+                    self._tick()
+                except Exception as e:
+                    print(f"Bus feed update failed: {e}")
+
+    def ensure_fresh(self):
+        """Sample now if nobody is streaming and the last sample is out of date."""
+        with self._lock:
+            if self._last_tick is None or time.monotonic() - self._last_tick >= self.interval:
+                self._tick()
+
+    def locations(self, since=None):
+        """Positions as parallel arrays; with since, only buses that moved after that version.
+
+        Versions look like '<epoch>-<counter>'. A `since` from another
+        process or from before a restart has a different epoch, so it gets
+        every position with full=True rather than a delta it can't apply.
+        """
+        epoch, _, counter = (since or '').partition('-')
+        after = int(counter) if epoch == self.epoch and counter.isdigit() else None
+        with self._lock:
+            positions = [p for bus_id, p in self.positions.items()
+                         if after is None or self.changed_at.get(bus_id, 0) > after]
+            removed = [bus_id for bus_id, version in self.removed_at.items()
+                       if after is not None and version > after]
+            version = self.version
+        return {
+            'version': f'{self.epoch}-{version}',
+            'full': after is None,
+            'ids': [p['bus_id'] for p in positions],
+            'lat': [p['lat'] for p in positions],
+            'lng': [p['lng'] for p in positions],
+            'status': [p['status'] for p in positions],
+            'arrival_minutes': [p['eta']['arrival_minutes'] if p['eta'] else None for p in positions],
+            'removed': removed,
+        }
+
+    def _tick(self):
+        with app.app_context():
+            bus_ids = fleet_ids()
+            locations = {bus_id: current_bus_location(bus_id) for bus_id in bus_ids}
+            # Buses with neither GPS nor a route to place them on aren't on the map
+            locations = {bus_id: location for bus_id, location in locations.items() if location is not None}
+            ensure_eta_engine()
+            traffic = traffic_model.traffic(bus_ids)
+            etas = live_etas(locations, {bus_id: t['delay_minutes'] for bus_id, t in traffic.items()})
+        self._last_tick = time.monotonic()
+        version = self.version + 1
+        for bus_id in bus_ids:
+            if bus_id in locations:
+                position = {'bus_id': bus_id, **locations[bus_id], 'eta': etas.get(bus_id)}
+                position['lat'], position['lng'] = round(position['lat'], 5), round(position['lng'], 5)
+                if self.positions.get(bus_id) != position:
+                    self.positions[bus_id] = position
+                    self.changed_at[bus_id] = self.version = version
+                    self.removed_at.pop(bus_id, None)
+                    self.publish('position', position)
+            bus_traffic = {'bus_id': bus_id, **traffic[bus_id]}
+            if self.traffic.get(bus_id) != bus_traffic:
+                self.traffic[bus_id] = bus_traffic
+                self.publish('traffic', bus_traffic)
+        for bus_id in set(self.positions) - set(locations):
+            del self.positions[bus_id]
+            self.changed_at.pop(bus_id, None)
+            self.removed_at[bus_id] = self.version = version
+        for bus_id in set(self.traffic) - set(bus_ids):
+            del self.traffic[bus_id]
+
+    def stats(self):
+        return {'subscribers': len(self._subscribers), 'published': self.published,
+                'dropped': self.dropped, 'running': self._thread is not None}
+
+bus_feed = BusFeed(interval=app.config['BUS_FEED_SECONDS'])
 
 # Add this code after your app configuration but before your routes
-with app.app_context():
-    db.create_all()
-    
-    # Check if we need to add sample data
-    if not Bus.query.first():
-        # Your sample data code here (buses, bus stops, etc.)
-        sample_buses = [
-            Bus(bus_number="HT-101", from_location="Dharampur", to_location="Solan", 
-                departure_time="08:00 AM", arrival_time="09:15 AM", status="On Time", price=150.00,
-                bus_type="Standard", amenities="Air Conditioning, Comfortable Seats, Water Bottle"),
-            Bus(bus_number="HT-102", from_location="Solan", to_location="Barog", 
-                departure_time="09:30 AM", arrival_time="10:15 AM", status="Delayed", price=100.00,
-                bus_type="Deluxe", amenities="Air Conditioning, Reclining Seats, WiFi, Snacks"),
-            Bus(bus_number="HT-103", from_location="Barog", to_location="Dagshai", 
-                departure_time="11:00 AM", arrival_time="12:00 PM", status="On Time", price=120.00,
-                bus_type="Premium", amenities="Air Conditioning, Luxury Seats, WiFi, Entertainment, Meals"),
-            Bus(bus_number="HT-104", from_location="Dagshai", to_location="Dharampur", 
-                departure_time="01:30 PM", arrival_time="02:45 PM", status="On Time", price=150.00,
-                bus_type="Standard", amenities="Air Conditioning, Comfortable Seats, Water Bottle"),
-            # Add duplicate buses with different times for the same routes
-            Bus(bus_number="HT-105", from_location="Dharampur", to_location="Solan", 
-                departure_time="10:00 AM", arrival_time="11:15 AM", status="On Time", price=160.00,
-                bus_type="Deluxe", amenities="Air Conditioning, Reclining Seats, WiFi, Snacks"),
-            Bus(bus_number="HT-106", from_location="Dharampur", to_location="Solan", 
-                departure_time="12:00 PM", arrival_time="01:15 PM", status="On Time", price=170.00,
-                bus_type="Premium", amenities="Air Conditioning, Luxury Seats, WiFi, Entertainment, Meals"),
-            Bus(bus_number="HT-107", from_location="Solan", to_location="Barog", 
-                departure_time="11:30 AM", arrival_time="12:15 PM", status="On Time", price=110.00,
-                bus_type="Standard", amenities="Air Conditioning, Comfortable Seats, Water Bottle"),
-            Bus(bus_number="HT-108", from_location="Barog", to_location="Dagshai", 
-                departure_time="02:00 PM", arrival_time="03:00 PM", status="Delayed", price=130.00,
-                bus_type="Deluxe", amenities="Air Conditioning, Reclining Seats, WiFi, Snacks"),
-        ]
+def init_database():
+    """Create tables, migrate, seed sample data and load the journey planner."""
+    with app.app_context():
+        db.create_all()
+        run_migrations()
+    
+        # Check if we need to add sample data
+        if not Bus.query.first():
+            # Your sample data code here (buses, bus stops, etc.)
+            sample_buses = [
+                Bus(bus_number="HT-101", from_location="Dharampur", to_location="Solan", 
+                    departure_time="08:00 AM", arrival_time="09:15 AM", status="On Time", price=150.00,
+                    bus_type="Standard", amenities="Air Conditioning, Comfortable Seats, Water Bottle"),
+                Bus(bus_number="HT-102", from_location="Solan", to_location="Barog", 
+                    departure_time="09:30 AM", arrival_time="10:15 AM", status="Delayed", price=100.00,
+                    bus_type="Deluxe", amenities="Air Conditioning, Reclining Seats, WiFi, Snacks"),
+                Bus(bus_number="HT-103", from_location="Barog", to_location="Dagshai", 
+                    departure_time="11:00 AM", arrival_time="12:00 PM", status="On Time", price=120.00,
+                    bus_type="Premium", amenities="Air Conditioning, Luxury Seats, WiFi, Entertainment, Meals"),
+                Bus(bus_number="HT-104", from_location="Dagshai", to_location="Dharampur", 
+                    departure_time="01:30 PM", arrival_time="02:45 PM", status="On Time", price=150.00,
+                    bus_type="Standard", amenities="Air Conditioning, Comfortable Seats, Water Bottle"),
+                # Add duplicate buses with different times for the same routes
+                Bus(bus_number="HT-105", from_location="Dharampur", to_location="Solan", 
+                    departure_time="10:00 AM", arrival_time="11:15 AM", status="On Time", price=160.00,
+                    bus_type="Deluxe", amenities="Air Conditioning, Reclining Seats, WiFi, Snacks"),
+                Bus(bus_number="HT-106", from_location="Dharampur", to_location="Solan", 
+                    departure_time="12:00 PM", arrival_time="01:15 PM", status="On Time", price=170.00,
+                    bus_type="Premium", amenities="Air Conditioning, Luxury Seats, WiFi, Entertainment, Meals"),
+                Bus(bus_number="HT-107", from_location="Solan", to_location="Barog", 
+                    departure_time="11:30 AM", arrival_time="12:15 PM", status="On Time", price=110.00,
+                    bus_type="Standard", amenities="Air Conditioning, Comfortable Seats, Water Bottle"),
+                Bus(bus_number="HT-108", from_location="Barog", to_location="Dagshai", 
+                    departure_time="02:00 PM", arrival_time="03:00 PM", status="Delayed", price=130.00,
+                    bus_type="Deluxe", amenities="Air Conditioning, Reclining Seats, WiFi, Snacks"),
+            ]
         
-        for bus in sample_buses:
-            db.session.add(bus)
+            for bus in sample_buses:
+                db.session.add(bus)
         
-        # Add bus stops
-        bus_stops = [
-            # Dharampur
-            BusStop(name="Dharampur Main Bus Stand", location="Central Dharampur", city="Dharampur", is_pickup=True, is_dropoff=True),
-            BusStop(name="Dharampur Railway Station", location="Near Railway Station", city="Dharampur", is_pickup=True, is_dropoff=True),
-            BusStop(name="Dharampur Market", location="Market Area", city="Dharampur", is_pickup=True, is_dropoff=True),
+            # Add bus stops
+            bus_stops = [
+                # Dharampur
+                BusStop(name="Dharampur Main Bus Stand", location="Central Dharampur", city="Dharampur", is_pickup=True, is_dropoff=True),
+                BusStop(name="Dharampur Railway Station", location="Near Railway Station", city="Dharampur", is_pickup=True, is_dropoff=True),
+                BusStop(name="Dharampur Market", location="Market Area", city="Dharampur", is_pickup=True, is_dropoff=True),
             
-            # Solan
-            BusStop(name="Solan Bus Terminal", location="Central Solan", city="Solan", is_pickup=True, is_dropoff=True),
-            BusStop(name="Solan Mall Road", location="Mall Road", city="Solan", is_pickup=True, is_dropoff=True),
-            BusStop(name="Solan University", location="Near University", city="Solan", is_pickup=True, is_dropoff=True),
+                # Solan
+                BusStop(name="Solan Bus Terminal", location="Central Solan", city="Solan", is_pickup=True, is_dropoff=True),
+                BusStop(name="Solan Mall Road", location="Mall Road", city="Solan", is_pickup=True, is_dropoff=True),
+                BusStop(name="Solan University", location="Near University", city="Solan", is_pickup=True, is_dropoff=True),
             
-            # Barog
-            BusStop(name="Barog Station", location="Near Railway Station", city="Barog", is_pickup=True, is_dropoff=True),
-            BusStop(name="Barog Market", location="Market Area", city="Barog", is_pickup=True, is_dropoff=True),
+                # Barog
+                BusStop(name="Barog Station", location="Near Railway Station", city="Barog", is_pickup=True, is_dropoff=True),
+                BusStop(name="Barog Market", location="Market Area", city="Barog", is_pickup=True, is_dropoff=True),
             
-            # Dagshai
-            BusStop(name="Dagshai Main Stand", location="Central Dagshai", city="Dagshai", is_pickup=True, is_dropoff=True),
-            BusStop(name="Dagshai Cantonment", location="Cantonment Area", city="Dagshai", is_pickup=True, is_dropoff=True),
-        ]
+                # Dagshai
+                BusStop(name="Dagshai Main Stand", location="Central Dagshai", city="Dagshai", is_pickup=True, is_dropoff=True),
+                BusStop(name="Dagshai Cantonment", location="Cantonment Area", city="Dagshai", is_pickup=True, is_dropoff=True),
+            ]
         
-        for stop in bus_stops:
-            db.session.add(stop)
+            for stop in bus_stops:
+                db.session.add(stop)
         
-        # Don't forget to commit
-        db.session.commit()
-        print("Database initialized with sample data!")
-    else:
-        print("Database already contains data.")
+            # Don't forget to commit
+            db.session.commit()
+            print("Database initialized with sample data!")
+        else:
+            print("Database already contains data.")
+    
+        journey_planner.load(Bus.query.all())
 
 # Routes
 @app.route('/')
@@ -262,12 +2734,25 @@ def logout():
     flash('You have been logged out', 'info')
     return redirect(url_for('index'))
 
+MAX_PASSENGERS = 10  # Same bound as the passengers input on the search form
+
+def parse_passengers(value):
+    """Passenger count from a form or query value; ValueError outside 1..MAX_PASSENGERS."""
+    passengers = int(value)
+    if not 1 <= passengers <= MAX_PASSENGERS:
+        raise ValueError(f"passengers must be between 1 and {MAX_PASSENGERS}")
+    return passengers
+
 @app.route('/search_buses', methods=['POST'])
 def search_buses():
     from_location = request.form.get('from')
     to_location = request.form.get('to')
     travel_date = request.form.get('date')
-    passengers = request.form.get('passengers', 1)
+    try:
+        passengers = parse_passengers(request.form.get('passengers', 1))
+    except ValueError:
+        flash(f'Please choose between 1 and {MAX_PASSENGERS} passengers', 'warning')
+        return redirect(url_for('index'))
     
     # Store search parameters in session
     session['search'] = {
@@ -279,6 +2764,39 @@ def search_buses():
     
     return redirect(url_for('bus_results'))
 
+BUS_TYPES = ['Standard', 'Deluxe', 'Premium']
+BUS_SORTS = {
+    'departure': Bus.departure_minutes,
+    'price': Bus.price,
+    'duration': Bus.duration_minutes,
+}
+
+def bus_search_query(from_location, to_location, depart_after=None, depart_before=None,
+                     max_duration=None, bus_type=None, sort='departure'):
+    """Direct buses for a city pair, filtered and sorted in SQL.
+
+    Each sort key has a (from_location, to_location, key) index, so the
+    database returns rows already in order.
+    """
+    if sort not in BUS_SORTS:
+        raise ValueError(f"Unknown sort {sort!r}")
+    query = Bus.query.filter_by(from_location=from_location, to_location=to_location)
+    if depart_after is not None:
+        query = query.filter(Bus.departure_minutes >= depart_after)
+    if depart_before is not None:
+        query = query.filter(Bus.departure_minutes <= depart_before)
+    if max_duration is not None:
+        query = query.filter(Bus.duration_minutes <= max_duration)
+    if bus_type:
+        query = query.filter(Bus.bus_type == bus_type)
+    return query.order_by(BUS_SORTS[sort], Bus.id)
+
+def cached_bus_search(from_location, to_location, **search_args):
+    """bus_search_query results as snapshots, served from reference_cache."""
+    key = ('buses', from_location, to_location, tuple(sorted(search_args.items())))
+    return reference_cache.get_or_load(key, lambda: tuple(
+        row_snapshot(bus) for bus in bus_search_query(from_location, to_location, **search_args)))
+
 @app.route('/bus_results')
 def bus_results():
     search = session.get('search', {})
@@ -290,20 +2808,128 @@ def bus_results():
         flash('Please provide all search details', 'warning')
         return redirect(url_for('index'))
     
-    buses = Bus.query.filter_by(
-        from_location=from_location,
-        to_location=to_location
-    ).all()
+    # Optional filters and sort from the results page filter bar
+    filters = {
+        'depart_after': request.args.get('depart_after', ''),
+        'depart_before': request.args.get('depart_before', ''),
+        'max_duration': request.args.get('max_duration', ''),
+        'bus_type': request.args.get('bus_type', ''),
+        'sort': request.args.get('sort', 'departure'),
+    }
+    try:
+        search_args = dict(
+            depart_after=parse_clock(filters['depart_after']) if filters['depart_after'] else None,
+            depart_before=parse_clock(filters['depart_before']) if filters['depart_before'] else None,
+            max_duration=int(filters['max_duration']) if filters['max_duration'] else None,
+            bus_type=filters['bus_type'] or None,
+            sort=filters['sort'],
+        )
+        buses = with_live_status(cached_bus_search(from_location, to_location, **search_args))
+    except ValueError:
+        flash('Please check the filter values', 'warning')
+        return redirect(url_for('bus_results'))
+    
+    # Availability for every bus on the chosen date in a single query
+    travel_date_obj = datetime.strptime(travel_date, '%Y-%m-%d').date()
+    availability = seats_available(buses, travel_date_obj)
+    
+    # No direct bus - offer connecting journeys instead
+    journeys = {}
+    filtering = any(filters[name] for name in ('depart_after', 'depart_before', 'max_duration', 'bus_type'))
+    if not buses and not filtering:
+        journeys = journey_planner.plan(from_location, to_location)
     
     return render_template('bus_results.html', 
                           buses=buses, 
+                          availability=availability,
+                          journeys=journeys,
+                          filters=filters,
+                          bus_types=BUS_TYPES,
                           travel_date=travel_date,
                           from_location=from_location,
                           to_location=to_location)
 
+def journey_json(journey):
+    if journey is None:
+        return None
+    return {
+        'departure_time': format_clock(journey['departure']),
+        'arrival_time': format_clock(journey['arrival']),
+        'duration_minutes': journey['arrival'] - journey['departure'],
+        'transfers': journey['transfers'],
+        'price': journey['price'],
+        'legs': [{
+            'bus_id': leg.bus_id,
+            'bus_number': leg.bus_number,
+            'from': leg.from_location,
+            'to': leg.to_location,
+            'departure_time': format_clock(leg.departure),
+            'arrival_time': format_clock(leg.arrival),
+            'price': leg.price,
+        } for leg in journey['legs']],
+    }
+
+@app.route('/api/journeys')
+def plan_journey():
+    origin = request.args.get('from')
+    destination = request.args.get('to')
+    if not origin or not destination:
+        return jsonify({'error': 'from and to are required'}), 400
+    try:
+        earliest_departure = parse_clock(request.args.get('after', '00:00'))
+    except ValueError:
+        return jsonify({'error': 'after must look like 08:00 AM or 14:30'}), 400
+    
+    journeys = journey_planner.plan(origin, destination, earliest_departure)
+    return jsonify({name: journey_json(journey) for name, journey in journeys.items()})
+
+@app.route('/api/search')
+def api_search():
+    """Direct buses with availability and prices as compact, revalidatable JSON."""
+    from_location = request.args.get('from')
+    to_location = request.args.get('to')
+    if not from_location or not to_location:
+        return jsonify({'error': 'from and to are required'}), 400
+    try:
+        travel_date = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d').date()
+        passengers = parse_passengers(request.args.get('passengers', 1))
+        buses = cached_bus_search(from_location, to_location,
+                                  sort=request.args.get('sort', 'departure'))
+    except ValueError:
+        return jsonify({'error': f'Use date=YYYY-MM-DD, passengers=1..{MAX_PASSENGERS} and sort=departure|price|duration'}), 400
+    
+    availability = seats_available(buses, travel_date)
+    statuses = live_bus_statuses()
+    body = json.dumps({
+        'from': from_location,
+        'to': to_location,
+        'date': travel_date.isoformat(),
+        'buses': [{
+            'id': bus.id,
+            'number': bus.bus_number,
+            'type': bus.bus_type,
+            'status': statuses.get(bus.id, bus.status),
+            'departure': bus.departure_time,
+            'arrival': bus.arrival_time,
+            'duration': bus.duration_minutes,
+            'price': bus.price,
+            'seats': availability[bus.id],
+            'bookable': availability[bus.id] >= passengers,
+        } for bus in buses],
+    }, separators=(',', ':'))
+    
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(hashlib.sha256(body.encode()).hexdigest()[:32])
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['SEARCH_CACHE_SECONDS']
+    return response.make_conditional(request)
+
 @app.route('/select_bus/<int:bus_id>')
 def select_bus(bus_id):
-    bus = Bus.query.get_or_404(bus_id)
+    bus = cached_bus(bus_id)
+    if bus is None:
+        abort(404)
+    bus = with_live_status([bus])[0]
     travel_date = session.get('search', {}).get('date')
     
     if not travel_date:
@@ -311,11 +2937,13 @@ def select_bus(bus_id):
         return redirect(url_for('index'))
     
     # Get pickup and dropoff points for this route
-    pickup_points = BusStop.query.filter_by(city=bus.from_location, is_pickup=True).all()
-    dropoff_points = BusStop.query.filter_by(city=bus.to_location, is_dropoff=True).all()
+    pickup_points = cached_stops(bus.from_location, 'is_pickup')
+    dropoff_points = cached_stops(bus.to_location, 'is_dropoff')
+    travel_date_obj = datetime.strptime(travel_date, '%Y-%m-%d').date()
     
     return render_template('select_bus.html', 
                           bus=bus, 
+                          seats_left=seats_available([bus], travel_date_obj)[bus.id],
                           travel_date=travel_date,
                           pickup_points=pickup_points,
                           dropoff_points=dropoff_points)
@@ -341,14 +2969,10 @@ def select_seats(bus_id):
         'dropoff_point': dropoff_point
     }
     
-    # Get already booked seats
-    booked_seats = []
+    # Get already booked seats as a bitmap - one row regardless of booking count
     travel_date_obj = datetime.strptime(travel_date, '%Y-%m-%d').date()
-    bookings = Booking.query.filter_by(bus_id=bus_id, travel_date=travel_date_obj, status='Confirmed').all()
-    
-    for booking in bookings:
-        if booking.seat_numbers:
-            booked_seats.extend(booking.seat_numbers.split(','))
+    booked_seats = seat_map_for(bus, travel_date_obj)
+    booked_seats.mark(held_seats(bus_id, travel_date_obj, exclude_user_id=current_user.id))
     
     return render_template('select_seats.html', 
                           bus=bus, 
@@ -371,6 +2995,23 @@ def payment(bus_id):
     
     # Get booking details from session
     booking_details = session.get('booking', {})
+    travel_date = booking_details.get('travel_date')
+    
+    if not travel_date or booking_details.get('bus_id') != bus_id:
+        flash('Please search for buses first', 'warning')
+        return redirect(url_for('index'))
+    
+    # Reserve the seats while the traveller pays
+    travel_date_obj = datetime.strptime(travel_date, '%Y-%m-%d').date()
+    seat_map = seat_map_for(bus, travel_date_obj)
+    if not all(is_valid_seat(seat, bus.capacity) and seat not in seat_map for seat in selected_seats):
+        flash('Some of those seats are no longer available', 'warning')
+        return redirect(url_for('select_bus', bus_id=bus_id))
+    if not acquire_seat_holds(bus_id, travel_date_obj, selected_seats, current_user.id):
+        flash('Another traveller is booking some of those seats, please pick again', 'warning')
+        return redirect(url_for('select_bus', bus_id=bus_id))
+    db.session.commit()
+    flash('Your seats are held for {} minutes'.format(app.config['SEAT_HOLD_MINUTES']), 'info')
     
     # Calculate total price
     total_price = len(selected_seats) * bus.price
@@ -427,6 +3068,23 @@ def confirm_booking():
     )
     
     db.session.add(booking)
+    db.session.flush()
+    
+    # Only sell the seats if this user's holds are still live
+    if not claim_seat_holds(bus_id, travel_date_obj, selected_seats.split(','),
+                            current_user.id, booking.id):
+        db.session.rollback()
+        flash('Your seat hold expired, please choose your seats again', 'warning')
+        return redirect(url_for('select_bus', bus_id=bus_id))
+    
+    try:
+        update_seat_inventory(bus_id, travel_date_obj, selected_seats.split(','))
+    except SeatInventoryBusy:
+        db.session.rollback()
+        # The holds survive the rollback, so the traveller can simply pay again
+        flash('This bus is busy right now, please retry', 'warning')
+        return render_template('payment.html', bus=bus, selected_seats=selected_seats.split(','),
+                               total_price=total_price, booking_details=booking_details)
     db.session.commit()
     
     # Clear booking session data
@@ -438,7 +3096,7 @@ def confirm_booking():
 @app.route('/booking_confirmation/<int:booking_id>')
 @login_required
 def booking_confirmation(booking_id):
-    booking = Booking.query.get_or_404(booking_id)
+    booking = Booking.query.options(joinedload(Booking.bus)).filter_by(id=booking_id).first_or_404()
     
     # Ensure user can only see their own bookings
     if booking.user_id != current_user.id:
@@ -447,11 +3105,44 @@ def booking_confirmation(booking_id):
     
     return render_template('booking_confirmation.html', booking=booking)
 
+MY_BOOKINGS_PAGE_SIZE = 20
+
+def my_bookings_page_query(user_id, before=None):
+    """Newest-first bookings for a user, with their buses joined in.
+
+    `before` is the (booking_date, id) of the last booking on the previous
+    page; seeking past it keeps every page as cheap as the first.
+    """
+    query = (
+        Booking.query.options(joinedload(Booking.bus))
+        .filter(Booking.user_id == user_id)
+        .order_by(Booking.booking_date.desc(), Booking.id.desc())
+    )
+    if before:
+        query = query.filter(tuple_(Booking.booking_date, Booking.id) < before)
+    return query
+
 @app.route('/my_bookings')
 @login_required
 def my_bookings():
-    bookings = Booking.query.filter_by(user_id=current_user.id).order_by(Booking.booking_date.desc()).all()
-    return render_template('my_bookings.html', bookings=bookings)
+    before = None
+    cursor = request.args.get('before')
+    if cursor:
+        try:
+            booking_date, booking_id = cursor.rsplit('_', 1)
+            before = (datetime.fromisoformat(booking_date), int(booking_id))
+        except ValueError:
+            return redirect(url_for('my_bookings'))
+    
+    bookings = my_bookings_page_query(current_user.id, before).limit(MY_BOOKINGS_PAGE_SIZE + 1).all()
+    next_cursor = None
+    if len(bookings) > MY_BOOKINGS_PAGE_SIZE:
+        bookings = bookings[:MY_BOOKINGS_PAGE_SIZE]
+        last = bookings[-1]
+        next_cursor = '{}_{}'.format(last.booking_date.isoformat(), last.id)
+    
+    return render_template('my_bookings.html', bookings=bookings,
+                          next_cursor=next_cursor, is_first_page=cursor is None)
 
 @app.route('/cancel_booking/<int:booking_id>', methods=['POST'])
 @login_required
@@ -462,6 +3153,16 @@ def cancel_booking(booking_id):
         flash('Unauthorized action', 'danger')
         return redirect(url_for('my_bookings'))
     
+    if booking.status == 'Confirmed':
+        try:
+            update_seat_inventory(booking.bus_id, booking.travel_date,
+                                  booking.seat_numbers.split(',') if booking.seat_numbers else [],
+                                  booked=False, seats=booking.seats)
+        except SeatInventoryBusy:
+            db.session.rollback()
+            flash('This bus is busy right now, please retry', 'warning')
+            return redirect(url_for('my_bookings'))
+        SeatHold.query.filter_by(booking_id=booking.id).delete(synchronize_session=False)
     booking.status = 'Cancelled'
     db.session.commit()
     
@@ -479,648 +3180,563 @@ def track_bus(bus_id):
 
 @app.route('/api/bus_location/<int:bus_id>')
 def bus_location(bus_id):
-    # In a real application, this would fetch real-time location data
-    # For demo purposes, we'll return mock data with slight variations each time
-    base_locations = {
-        1: {"lat": 30.7333, "lng": 76.7794, "status": "On Time"},  # Chandigarh
-        2: {"lat": 31.1048, "lng": 77.1734, "status": "Delayed"},  # Shimla
-        3: {"lat": 32.2396, "lng": 77.1887, "status": "On Time"},  # Manali
-        4: {"lat": 30.3398, "lng": 77.9601, "status": "On Time"},  # Dehradun
-    }
-    
-    # Get base location
-    location = base_locations.get(bus_id, {"lat": 30.7333, "lng": 76.7794, "status": "Unknown"})
+    """A bus's position, ETA and traffic, for pages that can't use /api/bus_stream.
+
+    The feed's latest sample already carries the fleet-wide ETA pass. Send
+    back the ETag as If-None-Match and an unchanged bus costs a 304.
+    """
+    bus_feed.ensure_fresh()
+    location = bus_feed.position(bus_id)
+    if location is None:
+        location = current_bus_location(bus_id)
+        if location is None:
+            return jsonify({'error': 'No position for this bus yet'}), 404
+        location = {**location, 'eta': None}
+    traffic = bus_feed.bus_traffic(bus_id)
+    response = jsonify({**{key: value for key, value in location.items() if key != 'bus_id'},
+                        'traffic': traffic and {key: value for key, value in traffic.items() if key != 'bus_id'}})
+    response.headers['Cache-Control'] = 'no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+@app.route('/api/gps/pings', methods=['POST'])
+def ingest_gps_pings():
+    """Batched GPS pings from buses: {"pings": [{"bus_id", "lat", "lng", "ts", "speed", "heading"}]}.
+
+    Authenticated with `Authorization: Bearer <GPS_INGEST_TOKEN>`. Points
+    land in memory; history is written in bulk in the background.
+    """
+    token = app.config['GPS_INGEST_TOKEN']
+    if not token:
+        return jsonify({'error': 'GPS ingestion is not configured'}), 503
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        return jsonify({'error': 'invalid token'}), 401
+    
+    payload = request.get_json(silent=True)
+    pings = payload.get('pings') if isinstance(payload, dict) else None
+    if not isinstance(pings, list):
+        return jsonify({'error': 'expected {"pings": [...]}'}), 400
+    
+    fleet = frozenset(fleet_ids())
+    parsed = [parse_gps_ping(ping, fleet) if isinstance(ping, dict) else None for ping in pings]
+    valid = sorted((p for p in parsed if p is not None), key=lambda p: p[1].recorded_at)
+    accepted, moves = 0, []
+    for bus_id, point in valid:
+        previous = position_store.latest(bus_id)
+        if position_store.add(bus_id, point):
+            accepted += 1
+            if previous is not None:
+                moves.append((bus_id, previous, point))
+    traffic_model.observe(moves)
+    if position_store.needs_flush():
+        position_store.flush()
+    
+    return jsonify({'accepted': accepted, 'stale': len(valid) - accepted,
+                    'rejected': len(pings) - len(valid)}), 202
+
+@app.route('/api/fleet_locations')
+def fleet_locations():
+    """Every bus's position in one columnar payload.
+
+    Pass back the returned version as ?since= to get only the buses that
+    moved (and the ids of any that left the fleet) after it. When this
+    process can't answer from that version, full is true and every bus is sent.
+    """
+    since = request.args.get('since')
+    bus_feed.ensure_fresh()
+    response = jsonify(bus_feed.locations(since))
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/bus_stream')
+def bus_stream():
+    """Server-sent events with live positions and traffic, e.g. ?bus_id=3.
+
+    Without bus_id the whole fleet is streamed. The first event is a snapshot,
+    then only changes follow.
+    """
+    if not app.config['BUS_STREAM_ENABLED']:
+        # EventSource gives up on a non-200 answer and the page falls back to polling
+        return jsonify({'error': 'Live streaming is off here, poll /api/bus_location instead'}), 503
+    bus_id = request.args.get('bus_id', type=int)
+    if bus_id is not None and cached_bus(bus_id) is None:
+        abort(404)
+    subscriber = bus_feed.subscribe(bus_id)
+    
+    def stream():
+        try:
+            yield from bus_feed.events(subscriber)
+        finally:
+            bus_feed.unsubscribe(subscriber)
+    
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let nginx buffer the stream
+    return response
+
+@app.route('/api/autocomplete')
+def autocomplete():
+    try:
+        limit = min(int(request.args.get('limit', 8)), 20)
+    except ValueError:
+        limit = 8
+    matches = location_autocomplete.search(request.args.get('q', ''), limit)
+    return jsonify([{'label': match['label'], 'city': match['city'], 'kind': match['kind']}
+                    for match in matches])
+
+@app.route('/api/weather')
+def api_weather():
+    """Current weather for several served cities in one response, e.g. ?cities=Solan,Barog.
+
+    Every city comes from the shared server-side cache, so upstream calls
+    grow with the number of cities rather than the number of visitors.
+    """
+    served = served_cities()
+    cities = [city.strip() for city in request.args.get('cities', '').split(',') if city.strip()]
+    unknown = [city for city in cities if city not in served]
+    if not cities or unknown:
+        return jsonify({'error': 'cities must list served cities: ' + ', '.join(sorted(served))}), 400
+    
+    response = jsonify({city: get_weather_data(city) for city in dict.fromkeys(cities)})
+    response.cache_control.public = True
+    response.cache_control.max_age = min(app.config['WEATHER_CACHE_TTL'], 300)
+    response.add_etag()
+    return response.make_conditional(request)
+
+@app.route('/api/cache_stats')
+def cache_stats():
+    return jsonify({'reference': reference_cache.stats(), 'weather': weather_cache.stats(),
+                    'upstreams': http_client.stats(), 'bus_feed': bus_feed.stats(),
+                    'gps': position_store.stats(), 'traffic': traffic_model.stats(),
+                    'pages': page_cache.stats(), 'photos': photo_pipeline.stats()})
+
+@app.route('/api/scheduler')
+def scheduler_status():
+    return jsonify(scheduler.status())
+
+@app.route('/api/seat_map/<int:bus_id>')
+def seat_map(bus_id):
+    bus = Bus.query.get_or_404(bus_id)
+    try:
+        travel_date = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
     
-    # Add small random variation to simulate movement
-    location["lat"] += random.uniform(-0.01, 0.01)
-    location["lng"] += random.uniform(-0.01, 0.01)
+    seat_map = seat_map_for(bus, travel_date)
+    seat_map.mark(held_seats(bus_id, travel_date,
+                             exclude_user_id=current_user.id if current_user.is_authenticated else None))
     
-    return jsonify(location)
+    return jsonify(seat_map.to_json())
 
 @app.route('/api/traffic_update/<int:bus_id>')
 def traffic_update(bus_id):
-    # Mock traffic data
-    traffic_conditions = ["Light", "Moderate", "Heavy"]
-    traffic_status = random.choice(traffic_conditions)
-    
-    delay_minutes = 0
-    if traffic_status == "Moderate":
-        delay_minutes = random.randint(5, 15)
-    elif traffic_status == "Heavy":
-        delay_minutes = random.randint(15, 30)
-    
-    return jsonify({
-        "traffic_status": traffic_status,
-        "delay_minutes": delay_minutes
-    })
+    if cached_bus(bus_id) is None:
+        abort(404)
+    ensure_eta_engine()
+    return jsonify(traffic_model.traffic([bus_id])[bus_id])
+
+# Page cache
+# Content pages only change on deploy, so their rendered HTML is kept and
+# served with validators; browsers revalidate and usually get a 304.
+page_cache = LRUCache(maxsize=1024, maxweight=app.config['PAGE_CACHE_BYTES'])
+
+def cached_page(anonymous_only=False, vary=None):
+    """Serve a view's rendered HTML from page_cache, with ETag/Last-Modified and 304s.
+
+    Entries are keyed by endpoint, URL and query arguments, login state and
+    vary() if given. Requests with flash messages waiting (they render into
+    the page) and, with anonymous_only, signed-in users bypass the cache.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            authenticated = current_user.is_authenticated
+            if request.method != 'GET' or '_flashes' in session or (anonymous_only and authenticated):
+                return view(*args, **kwargs)
+            
+            key = ('page', request.endpoint, tuple(sorted(kwargs.items())),
+                   tuple(sorted(request.args.items(multi=True))), authenticated, vary() if vary else None)
+            entry = page_cache.get(key)
+            if entry is None:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                entry = SimpleNamespace(body=body, mimetype=response.mimetype,
+                                        etag=hashlib.sha256(body).hexdigest()[:32],
+                                        last_modified=datetime.utcnow().replace(microsecond=0))
+                page_cache.set(key, entry, weight=len(body))
+            
+            response = Response(entry.body, mimetype=entry.mimetype)
+            response.set_etag(entry.etag)
+            response.last_modified = entry.last_modified
+            # Signing in or out changes the page, so browsers must check back every time
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+# Static assets
+# `python build_assets.py` writes minified, content-hashed copies of static/
+# (plus .gz/.br siblings) to static/dist with a manifest. When it has been
+# run, url_for('static', ...) points at the built copies, and since their
+# names change with their content they can be cached forever.
+ASSET_DIST = 'dist'
+
+def load_asset_manifest():
+    """{source path: built path} from the last asset build, or {} to serve sources as-is."""
+    path = os.path.join(app.static_folder, ASSET_DIST, 'manifest.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return MappingProxyType(json.load(f))
+
+asset_manifest = load_asset_manifest()
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    if endpoint == 'static' and values.get('filename') in asset_manifest:
+        values['filename'] = f"{ASSET_DIST}/{asset_manifest[values['filename']]}"
+
+def serve_static(filename):
+    """Flask's static view, plus precompressed, immutable responses for built assets."""
+    if not filename.startswith(ASSET_DIST + '/'):
+        return app.send_static_file(filename)
+    
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(app.static_folder, filename + suffix)):
+            response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype)
+            response.content_encoding = encoding
+            break
+    else:
+        response = app.send_static_file(filename)
+    response.vary.add('Accept-Encoding')
+    return cache_forever(response)
+
+app.view_functions['static'] = serve_static
+
+def cache_forever(response):
+    """Let anyone cache a sent file for good; for URLs that change with their content."""
+    response.headers.pop('Content-Disposition', None)  # may name the .br/.gz file, not the asset
+    response.cache_control.no_cache = None  # set because SEND_FILE_MAX_AGE_DEFAULT is None
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    response.cache_control.immutable = True
+    return response
+
+class AssetAwareSessionInterface(SecureCookieSessionInterface):
+    """Cookie sessions, except immutable responses never set the cookie or vary on it.
+
+    Flask-Login looks at the session after every request, which would add
+    Vary: Cookie and keep shared caches from storing them.
+    """
+
+    def save_session(self, app, session, response):
+        if response.cache_control.immutable:
+            return
+        super().save_session(app, session, response)
+
+app.session_interface = AssetAwareSessionInterface()
+
+# Static feature-page content
+# Poems, gallery photos and routes live in data/*.json. They are read and
+# checked once at startup and frozen, so requests share them without copying.
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+def freeze(value):
+    """Read-only copy: dicts become mappingproxies and lists tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def load_page_data(filename, required):
+    """Raw contents of data/<filename>, after checking each listed section's entries have their keys."""
+    path = os.path.join(DATA_DIR, filename)
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    for section, keys in required.items():
+        if not isinstance(data.get(section), list):
+            raise ValueError(f"{path}: '{section}' must be a list")
+        for i, entry in enumerate(data[section]):
+            missing = set(keys) - set(entry) if isinstance(entry, dict) else set(keys)
+            if missing:
+                raise ValueError(f"{path}: {section}[{i}] is missing {', '.join(sorted(missing))}")
+    return data
+
+POETRY_CORNER = freeze(load_page_data('poetry_corner.json', {
+    'travel_poems': ('title', 'author', 'lines'),
+    'quotes': ('quote', 'author'),
+    'community_poems': ('id', 'title', 'author', 'poem_text'),
+    'submission_themes': (),
+    'route_poems': ('route_name', 'poem_title', 'poem_excerpt'),
+    'blog_posts': ('id', 'title', 'author', 'date'),
+}))
+if not POETRY_CORNER['quotes']:
+    raise ValueError("poetry_corner.json: 'quotes' needs at least one quote")
+
+# Gallery destinations; the sample photos are copied into gallery_photo once (migration 6)
+TRAVEL_GALLERY = freeze(load_page_data('travel_gallery.json', {
+    'photos': ('image', 'location', 'destination', 'type', 'season', 'photographer', 'date', 'likes', 'views'),
+    'destinations': (),
+}))
+
+ROUTE_EXPLORER_DATA = load_page_data('route_explorer.json', {
+    'routes': ('id', 'busNumber', 'from', 'to', 'coordinates', 'stops_data'),
+    'destinations': (),
+})
+ROUTE_EXPLORER = freeze(ROUTE_EXPLORER_DATA)
+# Route Explorer sample routes (also used for stop autocomplete, ETAs and the GPS simulator)
+ROUTE_EXPLORER_ROUTES = ROUTE_EXPLORER['routes']
+
+# Route geometry
+# The Route Explorer page only embeds route summaries; lines and stops are
+# fetched per route from /api/routes/<id>/geometry as encoded polylines,
+# simplified (Douglas-Peucker) to what is visible at the map's zoom level.
+GEOMETRY_PRECISION = 5  # decimal places kept by the encoding, about 1 m
+GEOMETRY_ZOOMS = range(6, 19)  # Leaflet zoom levels simplified for; others are clamped
+GEOMETRY_TOLERANCE_PX = 1  # drop vertices that move the line less than this on screen
+
+def encode_polyline(points, precision=GEOMETRY_PRECISION):
+    """Google encoded-polyline string for [(lat, lng), ...]."""
+    factor = 10 ** precision
+    chunks = []
+    previous = (0, 0)
+    for lat, lng in points:
+        current = (int(round(lat * factor)), int(round(lng * factor)))
+        for delta in (current[0] - previous[0], current[1] - previous[1]):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous = current
+    return ''.join(chunks)
+
+def polyline_importance(xy):
+    """For each vertex, the largest Douglas-Peucker tolerance at which it is still kept.
+
+    The split points Douglas-Peucker picks don't depend on the tolerance, so
+    one pass with tolerance 0 ranks every vertex; simplifying to tolerance t
+    is then `importance > t`. A vertex is only reached if its parent split
+    happened, so it never ranks above it. Endpoints are always kept.
+    """
+    importance = np.zeros(len(xy))
+    importance[[0, -1]] = np.inf
+    stack = [(0, len(xy) - 1, np.inf)]
+    while stack:
+        first, last, ceiling = stack.pop()
+        if last - first < 2:
+            continue
+        segment = xy[last] - xy[first]
+        offsets = xy[first + 1:last] - xy[first]
+        length2 = segment @ segment
+        along = np.clip(offsets @ segment / length2, 0, 1) if length2 else np.zeros(len(offsets))
+        distance = np.hypot(*(offsets - along[:, None] * segment).T)
+        i = int(np.argmax(distance))
+        split = first + 1 + i
+        importance[split] = min(distance[i], ceiling)
+        stack.append((first, split, importance[split]))
+        stack.append((split, last, importance[split]))
+    return importance
+
+class RouteGeometry:
+    """One route's line, per-zoom simplifications and stops, stored encoded."""
+
+    def __init__(self, route):
+        points = np.asarray(route['coordinates'], dtype=float)
+        self.route_id = route['id']
+        self.points = len(points)
+        self.bounds = [points.min(axis=0).tolist(), points.max(axis=0).tolist()]
+        self.stops = [{'name': stop['name'], 'location': stop['location']} for stop in route['stops_data']]
+        self.stop_line = encode_polyline(stop['coordinates'] for stop in route['stops_data'])
+        
+        # Metres on a local flat projection, which is plenty at route scale
+        lat0 = np.radians(points[:, 0].mean())
+        xy = np.column_stack((points[:, 1] * 111320 * np.cos(lat0), points[:, 0] * 110540))
+        importance = polyline_importance(xy)
+        self.levels = {}
+        by_size = {}
+        for zoom in GEOMETRY_ZOOMS:
+            metres_per_px = 156543.03 * np.cos(lat0) / 2 ** zoom
+            keep = np.flatnonzero(importance > GEOMETRY_TOLERANCE_PX * metres_per_px)
+            # Higher zooms keep a superset, so equal sizes mean equal lines
+            if len(keep) not in by_size:
+                by_size[len(keep)] = (encode_polyline(points[keep].tolist()), len(keep))
+            self.levels[zoom] = by_size[len(keep)]
+
+    def payload(self, zoom):
+        zoom = min(max(zoom, GEOMETRY_ZOOMS[0]), GEOMETRY_ZOOMS[-1])
+        line, size = self.levels[zoom]
+        return {'id': self.route_id, 'zoom': zoom, 'precision': GEOMETRY_PRECISION,
+                'line': line, 'points': size, 'total_points': self.points, 'bounds': self.bounds,
+                'stops': self.stops, 'stop_line': self.stop_line}
+
+ROUTE_GEOMETRY = {route['id']: RouteGeometry(route) for route in ROUTE_EXPLORER_ROUTES}
+# Serialized once for the page's JavaScript: everything but the geometry
+ROUTE_EXPLORER_ROUTES_JSON = json.dumps([
+    dict({key: value for key, value in route.items() if key not in ('coordinates', 'stops_data')},
+         bounds=ROUTE_GEOMETRY[route['id']].bounds)
+    for route in ROUTE_EXPLORER_DATA['routes']
+])
 
 @app.route('/poetry-corner')
+@cached_page(anonymous_only=True, vary=date.today)  # greets signed-in users by name; daily quote
 def poetry_corner():
-    from datetime import date
-    
-    # Phase 1: Travel Poetry
-    travel_poems = [
-        {
-            'title': 'The Road Not Taken',
-            'author': 'Robert Frost',
-            'lines': [
-                'Two roads diverged in a yellow wood,',
-                'And sorry I could not travel both',
-                'And be one traveler, long I stood',
-                'And looked down one as far as I could',
-                'To where it bent in the undergrowth;'
-            ],
-            'theme': 'choices',
-            'image': 'https://images.unsplash.com/photo-1469474968028-56623f02e42e?w=800'
-        },
-        {
-            'title': 'Where the Road Meets the Sky',
-            'author': 'Kavlin',
-            'lines': [
-                'In every journey, a story unfolds,',
-                'Where asphalt meets dreams, and hearts grow bold.',
-                'The bus hums a tune of places unknown,',
-                'And every mile whispers, "You\'re not alone."'
-            ],
-            'theme': 'journey',
-            'image': 'https://images.unsplash.com/photo-1501594907352-04cda38ebc29?w=800',
-            'is_kavlin': True
-        },
-        {
-            'title': 'Windows to Wanderlust',
-            'author': 'Kavlin',
-            'lines': [
-                'Through windows wide, the world parades,',
-                'Mountains bow and valleys fade.',
-                'Each turn a verse, each stop a line,',
-                'Poetry in motion, beautifully divine.'
-            ],
-            'theme': 'wanderlust',
-            'image': 'https://images.unsplash.com/photo-1506905925346-21bda4d32df4?w=800',
-            'is_kavlin': True
-        },
-        {
-            'title': 'Song of the Open Road',
-            'author': 'Walt Whitman',
-            'lines': [
-                'Afoot and light-hearted I take to the open road,',
-                'Healthy, free, the world before me,',
-                'The long brown path before me leading wherever I choose.',
-            ],
-            'theme': 'freedom',
-            'image': 'https://images.unsplash.com/photo-1518173946687-a4c8892bbd9f?w=800'
-        },
-        {
-            'title': 'Ticket to Tomorrow',
-            'author': 'Kavlin',
-            'lines': [
-                'A ticket is more than paper and ink,',
-                'It\'s a promise, a dream, a hopeful link.',
-                'To sunrise views and evening gold,',
-                'To stories yet to be told.'
-            ],
-            'theme': 'hope',
-            'image': 'https://images.unsplash.com/photo-1527838832700-5059252407fa?w=800',
-            'is_kavlin': True
-        },
-        {
-            'title': 'The Bus Stop Philosopher',
-            'author': 'Kavlin',
-            'lines': [
-                'At the crossroads where strangers meet,',
-                'Time slows down, hearts skip a beat.',
-                'Stories shared in whispered tone,',
-                'In that moment, we\'re never alone.'
-            ],
-            'theme': 'connection',
-            'image': 'https://images.unsplash.com/photo-1523821741446-edb2b68bb7a0?w=800',
-            'is_kavlin': True
-        }
-    ]
+    poetry = POETRY_CORNER
     
     # Phase 2: Quote of the Day
-    quotes_collection = [
-        {
-            'quote': 'The journey of a thousand miles begins with a single step.',
-            'author': 'Lao Tzu',
-            'category': 'Journey',
-            'bg_image': 'https://images.unsplash.com/photo-1476514525535-07fb3b4ae5f1?w=1200',
-            'color_scheme': 'sunset'
-        },
-        {
-            'quote': 'Not all those who wander are lost.',
-            'author': 'J.R.R. Tolkien',
-            'category': 'Wanderlust',
-            'bg_image': 'https://images.unsplash.com/photo-1504280390367-361c6d9f38f4?w=1200',
-            'color_scheme': 'forest'
-        },
-        {
-            'quote': 'Travel is the only thing you buy that makes you richer.',
-            'author': 'Unknown',
-            'category': 'Wisdom',
-            'bg_image': 'https://images.unsplash.com/photo-1488646953014-85cb44e25828?w=1200',
-            'color_scheme': 'ocean'
-        },
-        {
-            'quote': 'Every ticket holds a sunrise, every departure a promise, every arrival a celebration.',
-            'author': 'Kavlin',
-            'category': 'Hope',
-            'bg_image': 'https://images.unsplash.com/photo-1495954484750-af469f2f9be5?w=1200',
-            'color_scheme': 'sunrise',
-            'is_kavlin': True
-        },
-        {
-            'quote': 'Adventures fill your soul with colors no palette can capture.',
-            'author': 'Kavlin',
-            'category': 'Adventure',
-            'bg_image': 'https://images.unsplash.com/photo-1507003211169-0a1dd7228f2d?w=1200',
-            'color_scheme': 'vibrant',
-            'is_kavlin': True
-        }
-    ]
-    
+    quotes_collection = poetry['quotes']
     day_of_year = date.today().timetuple().tm_yday
     today_quote = quotes_collection[day_of_year % len(quotes_collection)]
     recent_quotes = quotes_collection[:4]
     
-    # Phase 3: Community Poems
-    community_poems = [
-        {
-            'id': 1,
-            'title': 'Mountain Whispers',
-            'author': 'Sarah Chen',
-            'author_avatar': 'https://i.pravatar.cc/150?img=1',
-            'poem_text': 'Through winding roads, the mountains call,\nWhispers of adventure, standing tall.\nEach curve reveals a story new,\nIn every vista, dreams come true.',
-            'theme': 'Mountains',
-            'location': 'Himachal Pradesh',
-            'submitted_date': '2025-10-28',
-            'likes': 127,
-            'views': 543,
-            'is_featured': True
-        },
-        {
-            'id': 2,
-            'title': 'Bus Window Dreams',
-            'author': 'Raj Patel',
-            'author_avatar': 'https://i.pravatar.cc/150?img=12',
-            'poem_text': 'Frame by frame, the world goes by,\nClouds dancing in an endless sky.\nA traveler\'s heart beats with the road,\nCarrying memories as its load.',
-            'theme': 'Journey',
-            'location': 'Rajasthan',
-            'submitted_date': '2025-10-27',
-            'likes': 89,
-            'views': 421
-        },
-        {
-            'id': 3,
-            'title': 'Sunset Serendipity',
-            'author': 'Maya Krishnan',
-            'author_avatar': 'https://i.pravatar.cc/150?img=5',
-            'poem_text': 'Golden hours paint the sky,\nAs we watch the day say goodbye.\nStrangers become friends so fast,\nIn moments beautiful and vast.',
-            'theme': 'Friendship',
-            'location': 'Kerala',
-            'submitted_date': '2025-10-26',
-            'likes': 156,
-            'views': 678,
-            'is_featured': True
-        },
-        {
-            'id': 4,
-            'title': 'Station Soliloquy',
-            'author': 'Arjun Mehta',
-            'author_avatar': 'https://i.pravatar.cc/150?img=8',
-            'poem_text': 'In the chaos of arrivals and goodbyes,\nI found peace beneath open skies.\nEvery station holds a tale untold,\nOf brave hearts and spirits bold.',
-            'theme': 'Reflection',
-            'location': 'Delhi',
-            'submitted_date': '2025-10-25',
-            'likes': 92,
-            'views': 389
-        },
-        {
-            'id': 5,
-            'title': 'Monsoon Magic',
-            'author': 'Priya Sharma',
-            'author_avatar': 'https://i.pravatar.cc/150?img=9',
-            'poem_text': 'Raindrops race on window panes,\nWashing away life\'s mundane chains.\nThe bus sways through misty green,\nThe most beautiful ride I\'ve seen.',
-            'theme': 'Nature',
-            'location': 'Maharashtra',
-            'submitted_date': '2025-10-24',
-            'likes': 134,
-            'views': 567
-        },
-        {
-            'id': 6,
-            'title': 'Night Journey',
-            'author': 'Aditya Kumar',
-            'author_avatar': 'https://i.pravatar.cc/150?img=13',
-            'poem_text': 'Stars guide us through the night,\nHeadlights pierce the dark so bright.\nIn silence, thoughts begin to roam,\nEvery journey leads us home.',
-            'theme': 'Night',
-            'location': 'Punjab',
-            'submitted_date': '2025-10-23',
-            'likes': 78,
-            'views': 312
-        }
-    ]
-    
-    submission_themes = [
-        'Journey & Adventure',
-        'Mountains & Hills',
-        'Coastal & Beaches',
-        'Friendship & Connection',
-        'Solitude & Reflection',
-        'Nature & Seasons',
-        'City & Urban',
-        'Night Travel',
-        'First Journey',
-        'Coming Home'
-    ]
-    
-    # Phase 4: Route Poems
-    route_poems = [
-        {
-            'route_number': 'HT-101',
-            'route_name': 'Dharampur → Solan',
-            'from_location': 'Dharampur',
-            'to_location': 'Solan',
-            'poem_title': 'Where Pine Forests Whisper',
-            'poem_excerpt': 'Through pine-scented paths we glide,\nWhere mountains and memories collide.\nEach kilometer a verse unspoken,\nEach moment a promise unbroken.',
-            'image': 'https://images.unsplash.com/photo-1506905925346-21bda4d32df4?w=800',
-            'best_season': 'Spring',
-            'season_icon': 'fas fa-seedling',
-            'route_type': 'mountain',
-            'is_kavlin_favorite': True
-        },
-        {
-            'route_number': 'HT-102',
-            'route_name': 'Solan → Barog',
-            'from_location': 'Solan',
-            'to_location': 'Barog',
-            'poem_title': 'Through the Tunnel of Time',
-            'poem_excerpt': 'Darkness embraces, then light returns,\nThrough tunnels where history yearns.\nBarog calls with stories old,\nIn every arch, legends told.',
-            'image': 'https://images.unsplash.com/photo-1464037866556-6812c9d1c72e?w=800',
-            'best_season': 'Monsoon',
-            'season_icon': 'fas fa-cloud-rain',
-            'route_type': 'heritage',
-            'is_kavlin_favorite': True
-        },
-        {
-            'route_number': 'HT-103',
-            'route_name': 'Barog → Dagshai',
-            'from_location': 'Barog',
-            'to_location': 'Dagshai',
-            'poem_title': 'Cantonment Dreams',
-            'poem_excerpt': 'Colonial echoes in mountain air,\nDagshai stands with timeless care.\nBarracks whisper tales of yore,\nOn this route, history we explore.',
-            'image': 'https://images.unsplash.com/photo-1506905925346-21bda4d32df4?w=800',
-            'best_season': 'Winter',
-            'season_icon': 'fas fa-snowflake',
-            'route_type': 'historical',
-            'is_kavlin_favorite': False
-        },
-        {
-            'route_number': 'HT-104',
-            'route_name': 'Dagshai → Dharampur',
-            'from_location': 'Dagshai',
-            'to_location': 'Dharampur',
-            'poem_title': 'Coming Full Circle',
-            'poem_excerpt': 'The journey ends where it began,\nFull circle, as life\'s perfect plan.\nFrom Dagshai back to Dharampur\'s grace,\nEvery return, a warm embrace.',
-            'image': 'https://images.unsplash.com/photo-1527838832700-5059252407fa?w=800',
-            'best_season': 'Autumn',
-            'season_icon': 'fas fa-leaf',
-            'route_type': 'scenic',
-            'is_kavlin_favorite': True
-        },
-        {
-            'route_number': 'HT-105',
-            'route_name': 'Dharampur → Barog (Express)',
-            'from_location': 'Dharampur',
-            'to_location': 'Barog',
-            'poem_title': 'The Swift Sojourn',
-            'poem_excerpt': 'Express lanes through emerald hills,\nRapid hearts and adventure thrills.\nFrom Dharampur to Barog we fly,\nBeneath the ever-changing sky.',
-            'image': 'https://images.unsplash.com/photo-1469474968028-56623f02e42e?w=800',
-            'best_season': 'Summer',
-            'season_icon': 'fas fa-sun',
-            'route_type': 'express',
-            'is_kavlin_favorite': False
-        },
-        {
-            'route_number': 'HT-106',
-            'route_name': 'Solan → Dagshai (Scenic)',
-            'from_location': 'Solan',
-            'to_location': 'Dagshai',
-            'poem_title': 'Valley of Verses',
-            'poem_excerpt': 'Scenic detours through valleys deep,\nWhere nature\'s secrets softly sleep.\nFrom Solan\'s charm to Dagshai\'s pride,\nPoetry flows with every ride.',
-            'image': 'https://images.unsplash.com/photo-1501594907352-04cda38ebc29?w=800',
-            'best_season': 'All Seasons',
-            'season_icon': 'fas fa-infinity',
-            'route_type': 'scenic',
-            'is_kavlin_favorite': True
-        }
-    ]
-    
-    # Phase 5: Blog Posts
-    blog_posts = [
-        {
-            'id': 1,
-            'title': 'How Mountains Taught Me Poetry',
-            'author': 'Kavlin',
-            'author_avatar': './static/images/Kavlin Bitmoji.png',
-            'date': '2025-10-28',
-            'read_time': 8,
-            'category': 'poetry-process',
-            'category_label': 'Poetry Process',
-            'excerpt': 'The first time I saw the Himalayas, I didn\'t write a single word. I just stood there, humbled by their magnitude, realizing that sometimes silence is the loudest poetry. This is the story of how mountains taught me to listen before I learned to write.',
-            'image': 'https://images.unsplash.com/photo-1506905925346-21bda4d32df4?w=800',
-            'tags': ['Mountains', 'Writing', 'Inspiration', 'Himalayas'],
-            'likes': 234,
-            'comments': 45
-        },
-        {
-            'id': 2,
-            'title': 'The Bus Window Philosophy',
-            'author': 'Kavlin',
-            'author_avatar': './static/images/Kavlin Bitmoji.png',
-            'date': '2025-10-25',
-            'read_time': 6,
-            'category': 'travel-tales',
-            'category_label': 'Travel Tales',
-            'excerpt': 'Every bus window is a movie screen showing life\'s greatest film. Frame by frame, the world passes by, and in those fleeting moments, we find stories worth telling. Here\'s what I\'ve learned from thousands of hours gazing out windows.',
-            'image': 'https://images.unsplash.com/photo-1464037866556-6812c9d1c72e?w=800',
-            'tags': ['Travel', 'Philosophy', 'Observations'],
-            'likes': 189,
-            'comments': 32
-        },
-        {
-            'id': 3,
-            'title': 'Writing Between Stops: A Poet\'s Journey',
-            'author': 'Kavlin',
-            'author_avatar': './static/images/Kavlin Bitmoji.png',
-            'date': '2025-10-22',
-            'read_time': 10,
-            'category': 'poetry-process',
-            'category_label': 'Poetry Process',
-            'excerpt': 'They say the best poetry comes in quiet moments, but I\'ve found mine in the chaos of bus stations, the hum of engines, and the chatter of fellow travelers. This is my creative process, unconventional and beautiful.',
-            'image': 'https://images.unsplash.com/photo-1455849318743-b2233052fcff?w=800',
-            'tags': ['Writing Process', 'Creativity', 'Bus Travel'],
-            'likes': 267,
-            'comments': 58
-        },
-        {
-            'id': 4,
-            'title': 'A Traveler\'s Ode to Himachal',
-            'author': 'Priya Sharma',
-            'author_avatar': 'https://i.pravatar.cc/150?img=9',
-            'date': '2025-10-20',
-            'read_time': 7,
-            'category': 'guest-posts',
-            'category_label': 'Guest Post',
-            'excerpt': 'As a guest writer on Kavlin\'s blog, I wanted to share my love letter to Himachal Pradesh - the land that changed how I see travel, poetry, and life itself. Through Happy Trails, I found more than transportation; I found inspiration.',
-            'image': 'https://images.unsplash.com/photo-1506905925346-21bda4d32df4?w=800',
-            'tags': ['Himachal', 'Guest Post', 'Travel'],
-            'likes': 178,
-            'comments': 41
-        },
-        {
-            'id': 5,
-            'title': 'Why Every Route Needs a Poem',
-            'author': 'Kavlin',
-            'author_avatar': './static/images/Kavlin Bitmoji.png',
-            'date': '2025-10-18',
-            'read_time': 5,
-            'category': 'route-inspiration',
-            'category_label': 'Route Inspiration',
-            'excerpt': 'When I started Happy Trails, people thought pairing bus routes with poetry was quirky. Now they understand - every path has a story, every journey deserves to be honored with words that match its beauty.',
-            'image': 'https://images.unsplash.com/photo-1501594907352-04cda38ebc29?w=800',
-            'tags': ['Routes', 'Poetry', 'Happy Trails'],
-            'likes': 312,
-            'comments': 67
-        },
-        {
-            'id': 6,
-            'title': 'From Engineer to Poet: My Journey',
-            'author': 'Kavlin',
-            'author_avatar': './static/images/Kavlin Bitmoji.png',
-            'date': '2025-10-15',
-            'read_time': 12,
-            'category': 'travel-tales',
-            'category_label': 'Travel Tales',
-            'excerpt': 'Everyone asks how an engineer ends up running a bus service that prioritizes poetry. The answer is simple: I followed my heart on a journey that started with a single bus ride and ended with a dream called Happy Trails.',
-            'image': 'https://images.unsplash.com/photo-1469474968028-56623f02e42e?w=800',
-            'tags': ['Personal', 'Story', 'Career Change'],
-            'likes': 445,
-            'comments': 89
-        }
-    ]
-    
     return render_template('features/poetry_corner.html', 
-                          travel_poems=travel_poems,
+                          travel_poems=poetry['travel_poems'],
                           today_quote=today_quote,
                           recent_quotes=recent_quotes,
                           current_date=date.today(),
-                          community_poems=community_poems,
-                          submission_themes=submission_themes,
-                          route_poems=route_poems,
-                          blog_posts=blog_posts,  # Added Phase 5
+                          community_poems=poetry['community_poems'],
+                          submission_themes=poetry['submission_themes'],
+                          route_poems=poetry['route_poems'],
+                          blog_posts=poetry['blog_posts'],  # Added Phase 5
                           user_is_logged_in=current_user.is_authenticated)
 
+def latest_gallery_upload():
+    """When the newest upload became ready; the cached gallery page is keyed on it."""
+    return db.session.query(func.max(GalleryPhoto.ready_at)).filter(GalleryPhoto.status == 'ready').scalar()
+
 @app.route('/travel-gallery')
+@cached_page(vary=latest_gallery_upload)
 def travel_gallery():
-    """✨ Kavlin's Enchanted 3D Memory Gallery - Phase 1 & 2"""
-    
-    # Sample photo data with enhanced details
-    photos = [
-        {
-            'id': 1,
-            'image': 'https://images.unsplash.com/photo-1506905925346-21bda4d32df4?w=800',
-            'location': 'Dharampur Valley View',
-            'destination': 'Dharampur',
-            'type': 'landscape',
-            'season': 'spring',
-            'photographer': 'Kavlin',
-            'date': '2024-03-15',
-            'likes': 234,
-            'views': 1456
-        },
-        {
-            'id': 2,
-            'image': 'https://images.unsplash.com/photo-1464037866556-6812c9d1c72e?w=800',
-            'location': 'Solan Market Street',
-            'destination': 'Solan',
-            'type': 'people',
-            'season': 'summer',
-            'photographer': 'Priya Sharma',
-            'date': '2024-06-20',
-            'likes': 189,
-            'views': 1123
-        },
-        {
-            'id': 3,
-            'image': 'https://images.unsplash.com/photo-1544620347-c4fd4a3d5957?w=800',
-            'location': 'Happy Trails Bus at Sunrise',
-            'destination': 'Dharampur',
-            'type': 'bus',
-            'season': 'winter',
-            'photographer': 'Raj Kumar',
-            'date': '2024-01-10',
-            'likes': 312,
-            'views': 1890
-        },
-        {
-            'id': 4,
-            'image': 'https://images.unsplash.com/photo-1506905925346-21bda4d32df4?w=800',
-            'location': 'Barog Tunnel Heritage',
-            'destination': 'Barog',
-            'type': 'heritage',
-            'season': 'monsoon',
-            'photographer': 'Sarah Chen',
-            'date': '2024-07-25',
-            'likes': 267,
-            'views': 1678
-        },
-        {
-            'id': 5,
-            'image': 'https://images.unsplash.com/photo-1469474968028-56623f02e42e?w=800',
-            'location': 'Dagshai Cantonment',
-            'destination': 'Dagshai',
-            'type': 'heritage',
-            'season': 'autumn',
-            'photographer': 'Arjun Mehta',
-            'date': '2024-10-05',
-            'likes': 198,
-            'views': 1234
-        },
-        {
-            'id': 6,
-            'image': 'https://images.unsplash.com/photo-1501594907352-04cda38ebc29?w=800',
-            'location': 'Mountain Trails - Solan',
-            'destination': 'Solan',
-            'type': 'landscape',
-            'season': 'spring',
-            'photographer': 'Maya Krishnan',
-            'date': '2024-04-12',
-            'likes': 345,
-            'views': 2134
-        },
-        {
-            'id': 7,
-            'image': 'https://images.unsplash.com/photo-1527838832700-5059252407fa?w=800',
-            'location': 'Travelers at Barog Station',
-            'destination': 'Barog',
-            'type': 'people',
-            'season': 'summer',
-            'photographer': 'Kavlin',
-            'date': '2024-05-18',
-            'likes': 276,
-            'views': 1567
-        },
-        {
-            'id': 8,
-            'image': 'https://images.unsplash.com/photo-1469474968028-56623f02e42e?w=800',
-            'location': 'Monsoon Magic - Dharampur',
-            'destination': 'Dharampur',
-            'type': 'landscape',
-            'season': 'monsoon',
-            'photographer': 'Aditya Kumar',
-            'date': '2024-08-22',
-            'likes': 412,
-            'views': 2456
-        },
-        {
-            'id': 9,
-            'image': 'https://images.unsplash.com/photo-1506905925346-21bda4d32df4?w=800',
-            'location': 'Winter Wonderland - Dagshai',
-            'destination': 'Dagshai',
-            'type': 'landscape',
-            'season': 'winter',
-            'photographer': 'Neha Singh',
-            'date': '2024-12-05',
-            'likes': 389,
-            'views': 2234
-        },
-        {
-            'id': 10,
-            'image': 'https://images.unsplash.com/photo-1464037866556-6812c9d1c72e?w=800',
-            'location': 'Happy Trails Fleet - Solan',
-            'destination': 'Solan',
-            'type': 'bus',
-            'season': 'autumn',
-            'photographer': 'Vikram Patel',
-            'date': '2024-09-15',
-            'likes': 298,
-            'views': 1789
-        },
-        {
-            'id': 11,
-            'image': 'https://images.unsplash.com/photo-1501594907352-04cda38ebc29?w=800',
-            'location': 'Colonial Architecture - Barog',
-            'destination': 'Barog',
-            'type': 'heritage',
-            'season': 'spring',
-            'photographer': 'Kavlin',
-            'date': '2024-03-28',
-            'likes': 223,
-            'views': 1456
-        },
-        {
-            'id': 12,
-            'image': 'https://images.unsplash.com/photo-1506905925346-21bda4d32df4?w=800',
-            'location': 'Sunset at Dharampur Hills',
-            'destination': 'Dharampur',
-            'type': 'landscape',
-            'season': 'summer',
-            'photographer': 'Priya Sharma',
-            'date': '2024-06-30',
-            'likes': 456,
-            'views': 2890
-        }
-    ]
-    
-    # Unique destinations
-    destinations = ['Dharampur', 'Solan', 'Barog', 'Dagshai']
-    
-    # Calculate totals
-    total_views = sum(photo['views'] for photo in photos)
-    total_likes = sum(photo['likes'] for photo in photos)
+    """✨ Kavlin's Enchanted 3D Memory Gallery - Phase 1 & 2
+
+    Renders the first page of photos; filters, sorting and further pages
+    come from /api/gallery.
+    """
+    photos, next_cursor = gallery_page()
+    facets = gallery_facets()
+    totals = gallery_totals()
     
     return render_template('features/travel_gallery.html',
                           photos=photos,
-                          destinations=destinations,
-                          total_views=total_views,
-                          total_likes=total_likes)
+                          next_cursor=next_cursor,
+                          facets=facets,
+                          total_photos=sum(facets['destination'].values()),
+                          destinations=TRAVEL_GALLERY['destinations'],
+                          total_views=totals['views'],
+                          total_likes=totals['likes'])
+
+@app.route('/api/gallery')
+def gallery_api():
+    """A page of gallery photos.
+
+    ?destination=, ?type=, ?season= filter (omit or 'all' for any),
+    ?sort= is latest, popular or views, and ?cursor= is the previous page's
+    next_cursor. The first page also carries the facet counts.
+    """
+    sort = request.args.get('sort', 'latest')
+    if sort not in GALLERY_SORTS:
+        return jsonify({'error': 'sort must be one of ' + ', '.join(GALLERY_SORTS)}), 400
+    filters = {facet: request.args[facet] for facet in GALLERY_FACETS
+               if request.args.get(facet, 'all') != 'all'}
+    limit = min(max(request.args.get('limit', GALLERY_PAGE_SIZE, type=int), 1), 100)
+    cursor = request.args.get('cursor')
+    try:
+        photos, next_cursor = gallery_page(filters, sort, cursor, limit)
+    except ValueError:
+        return jsonify({'error': 'cursor is not valid for this sort'}), 400
+    
+    payload = {'photos': photos, 'next_cursor': next_cursor, 'sort': sort, 'filters': filters}
+    if not cursor:
+        payload['facets'] = gallery_facets()
+    response = jsonify(payload)
+    response.cache_control.public = True
+    response.cache_control.max_age = 30
+    response.add_etag()
+    return response.make_conditional(request)
 
-# PHASE 2: Upload endpoint (for future backend integration)
+# PHASE 2: Photo uploads
 @app.route('/travel-gallery/upload', methods=['POST'])
 @login_required
 def upload_gallery_photo():
-    """Handle photo upload submission"""
+    """Save an uploaded photo and queue its resizing; 202 as soon as the original is on disk."""
+    request.max_content_length = app.config['GALLERY_MAX_UPLOAD_MB'] * 1024 * 1024
     try:
-        # Get form data
         photo = request.files.get('photo')
-        destination = request.form.get('destination')
-        photo_type = request.form.get('photoType')
-        season = request.form.get('season')
-        caption = request.form.get('caption')
-        location = request.form.get('location')
-        
-        # Validate
-        if not photo or not destination or not photo_type or not season or not caption:
+        fields = {name: request.form.get(name, '').strip()
+                  for name in ('destination', 'photoType', 'season', 'caption', 'location')}
+    except RequestEntityTooLarge:
+        return jsonify({'success': False,
+                        'error': f"Photos can be at most {app.config['GALLERY_MAX_UPLOAD_MB']} MB"}), 413
+    
+    try:
+        if not photo or not isinstance(photo.stream, IncomingUpload) or not all(
+                fields[name] for name in ('destination', 'photoType', 'season', 'caption')):
             return jsonify({'success': False, 'error': 'Missing required fields'}), 400
+        # These become gallery filters, so only the listed choices are accepted
+        destinations = {destination.lower(): destination for destination in TRAVEL_GALLERY['destinations']}
+        fields['destination'] = destinations.get(fields['destination'].lower())
+        if (not fields['destination'] or fields['photoType'] not in GALLERY_PHOTO_TYPES
+                or fields['season'] not in GALLERY_SEASONS):
+            return jsonify({'success': False, 'error': 'Unknown destination, photo type or season'}), 400
+        probe = probe_photo(photo.stream)
+        if probe is None or probe[0] not in GALLERY_UPLOAD_FORMATS:
+            return jsonify({'success': False, 'error': 'Photos must be JPEG, PNG or WebP images'}), 400
         
-        # In production:
-        # 1. Save photo to cloud storage (AWS S3, Cloudinary, etc.)
-        # 2. Create database record with status='pending'
-        # 3. Send notification to moderators
-        # 4. Return success response
+        digest, size = photo_store.save(photo.stream)
+        # The same bytes uploaded before already have their sizes
+        widths = finished_variants(digest)
+        record = GalleryPhoto(user_id=current_user.id, content_hash=digest,
+                              destination=fields['destination'], photo_type=fields['photoType'],
+                              season=fields['season'], caption=fields['caption'],
+                              location=fields['location'] or None, width=probe[1], height=probe[2],
+                              size_bytes=size, status='ready' if widths else 'pending',
+                              variant_widths=widths, ready_at=datetime.utcnow() if widths else None)
+        db.session.add(record)
+        if widths:
+            count_gallery_photo(record)
+        db.session.commit()
+        if record.status == 'pending':
+            photo_pipeline.submit(record.id, digest)
         
-        # For now, simulate success
         return jsonify({
             'success': True,
             'message': 'Photo uploaded successfully!',
-            'photo_id': 999  # Would be actual DB ID
-        })
-        
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+            'photo_id': record.id,
+            'status': record.status,
+            'status_url': url_for('gallery_photo_status', photo_id=record.id),
+        }), 202
+    finally:
+        # Whatever wasn't saved (other file fields, rejected photos) is deleted
+        for upload in request.files.values():
+            if isinstance(upload.stream, IncomingUpload):
+                photo_store.discard(upload.stream)
+
+@app.route('/api/gallery/photos/<int:photo_id>')
+def gallery_photo_status(photo_id):
+    """An upload's status, with its gallery entry once ready."""
+    photo = db.session.get(GalleryPhoto, photo_id)
+    if photo is None:
+        return jsonify({'error': 'Photo not found'}), 404
+    if photo.status != 'ready':
+        return jsonify({'id': photo.id, 'status': photo.status})
+    return jsonify(dict(gallery_photo_card(photo), status=photo.status))
+
+@app.route('/travel-gallery/media/<digest>/<int:width>.<ext>')
+def gallery_media(digest, width, ext):
+    """A resized copy of an uploaded photo; addressed by content hash, so cached forever."""
+    if not CONTENT_HASH.match(digest) or ext not in photo_variants.FORMATS:
+        abort(404)
+    return cache_forever(send_from_directory(photo_store.variant_dir(digest), f'{width}.{ext}'))
 
 @app.route('/route-explorer')
+@cached_page()
 def route_explorer():
     """🗺️ Interactive Route Explorer - Phases 1, 2 & 3
     
@@ -1132,287 +3748,24 @@ def route_explorer():
     comparison, analysis tools, and real-time weather conditions.
     """
     
-    # Sample route data (same as Phase 2)
-    routes = [
-        {
-            'id': 1,
-            'name': 'Dharampur → Solan Express',
-            'busNumber': 'HT-101',
-            'from': 'Dharampur',
-            'to': 'Solan',
-            'type': 'Standard',
-            'distance': '25 km',
-            'duration': '1h 15m',
-            'stops': 8,
-            'color': '#FFD700',
-            'price': 150,
-            'departure_time': '08:00 AM',
-            'arrival_time': '09:15 AM',
-            'coordinates': [
-                [30.8750, 77.0500],  # Dharampur
-                [30.8800, 77.0700],
-                [30.8850, 77.0900],
-                [30.8900, 77.1100],
-                [30.8950, 77.1300],
-                [30.9000, 77.1500],
-                [30.9050, 77.1650],
-                [30.9100, 77.1734]   # Solan
-            ],
-            'stops_data': [
-                {'name': 'Dharampur Main Stand', 'location': 'Central Dharampur', 'coordinates': [30.8750, 77.0500]},
-                {'name': 'Dharampur Railway Station', 'location': 'Near Railway', 'coordinates': [30.8800, 77.0700]},
-                {'name': 'Dharampur Market', 'location': 'Market Area', 'coordinates': [30.8850, 77.0900]},
-                {'name': 'Highway Junction', 'location': 'NH-5', 'coordinates': [30.8900, 77.1100]},
-                {'name': 'Green Valley', 'location': 'Valley Point', 'coordinates': [30.8950, 77.1300]},
-                {'name': 'Pine Forest Stop', 'location': 'Forest Area', 'coordinates': [30.9000, 77.1500]},
-                {'name': 'Solan Outskirts', 'location': 'City Entry', 'coordinates': [30.9050, 77.1650]},
-                {'name': 'Solan Bus Terminal', 'location': 'Central Solan', 'coordinates': [30.9100, 77.1734]}
-            ]
-        },
-        {
-            'id': 2,
-            'name': 'Solan → Barog Scenic Route',
-            'busNumber': 'HT-102',
-            'from': 'Solan',
-            'to': 'Barog',
-            'type': 'Deluxe',
-            'distance': '18 km',
-            'duration': '45m',
-            'stops': 6,
-            'color': '#32CD32',
-            'price': 100,
-            'departure_time': '09:30 AM',
-            'arrival_time': '10:15 AM',
-            'coordinates': [
-                [30.9100, 77.1734],  # Solan
-                [30.9200, 77.1500],
-                [30.9300, 77.1300],
-                [30.9400, 77.1100],
-                [30.9500, 77.0900],
-                [30.9600, 77.0700]   # Barog
-            ],
-            'stops_data': [
-                {'name': 'Solan Bus Terminal', 'location': 'Central Solan', 'coordinates': [30.9100, 77.1734]},
-                {'name': 'Solan Mall Road', 'location': 'Mall Road', 'coordinates': [30.9200, 77.1500]},
-                {'name': 'University Junction', 'location': 'Near University', 'coordinates': [30.9300, 77.1300]},
-                {'name': 'Mountain View Point', 'location': 'Scenic Spot', 'coordinates': [30.9400, 77.1100]},
-                {'name': 'Tunnel Approach', 'location': 'Heritage Area', 'coordinates': [30.9500, 77.0900]},
-                {'name': 'Barog Station', 'location': 'Railway Station', 'coordinates': [30.9600, 77.0700]}
-            ]
-        },
-        {
-            'id': 3,
-            'name': 'Barog → Dagshai Heritage Trail',
-            'busNumber': 'HT-103',
-            'from': 'Barog',
-            'to': 'Dagshai',
-            'type': 'Premium',
-            'distance': '22 km',
-            'duration': '1h',
-            'stops': 7,
-            'color': '#FF6347',
-            'price': 120,
-            'departure_time': '11:00 AM',
-            'arrival_time': '12:00 PM',
-            'coordinates': [
-                [30.9600, 77.0700],  # Barog
-                [30.9650, 77.0550],
-                [30.9700, 77.0400],
-                [30.9750, 77.0250],
-                [30.9800, 77.0100],
-                [30.9850, 76.9950],
-                [30.9900, 76.9800]   # Dagshai
-            ],
-            'stops_data': [
-                {'name': 'Barog Station', 'location': 'Railway Station', 'coordinates': [30.9600, 77.0700]},
-                {'name': 'Barog Market', 'location': 'Market Area', 'coordinates': [30.9650, 77.0550]},
-                {'name': 'Heritage Point', 'location': 'Tourist Spot', 'coordinates': [30.9700, 77.0400]},
-                {'name': 'Pine Grove', 'location': 'Forest Area', 'coordinates': [30.9750, 77.0250]},
-                {'name': 'Military Road', 'location': 'Historical Route', 'coordinates': [30.9800, 77.0100]},
-                {'name': 'Dagshai Entry', 'location': 'Town Entry', 'coordinates': [30.9850, 76.9950]},
-                {'name': 'Dagshai Cantonment', 'location': 'Cantonment Area', 'coordinates': [30.9900, 76.9800]}
-            ]
-        },
-        {
-            'id': 4,
-            'name': 'Dagshai → Dharampur Circle Route',
-            'busNumber': 'HT-104',
-            'from': 'Dagshai',
-            'to': 'Dharampur',
-            'type': 'Standard',
-            'distance': '30 km',
-            'duration': '1h 30m',
-            'stops': 9,
-            'color': '#1E90FF',
-            'price': 150,
-            'departure_time': '01:30 PM',
-            'arrival_time': '03:00 PM',
-            'coordinates': [
-                [30.9900, 76.9800],  # Dagshai
-                [30.9800, 76.9900],
-                [30.9700, 77.0000],
-                [30.9600, 77.0100],
-                [30.9500, 77.0200],
-                [30.9400, 77.0300],
-                [30.9200, 77.0350],
-                [30.9000, 77.0400],
-                [30.8750, 77.0500]   # Dharampur
-            ],
-            'stops_data': [
-                {'name': 'Dagshai Cantonment', 'location': 'Cantonment', 'coordinates': [30.9900, 76.9800]},
-                {'name': 'Colonial Church', 'location': 'Heritage Site', 'coordinates': [30.9800, 76.9900]},
-                {'name': 'Valley Viewpoint', 'location': 'Scenic Point', 'coordinates': [30.9700, 77.0000]},
-                {'name': 'Tea Garden Stop', 'location': 'Plantation Area', 'coordinates': [30.9600, 77.0100]},
-                {'name': 'Village Junction', 'location': 'Rural Area', 'coordinates': [30.9500, 77.0200]},
-                {'name': 'Riverside Point', 'location': 'River Crossing', 'coordinates': [30.9400, 77.0300]},
-                {'name': 'Highway Junction', 'location': 'Main Road', 'coordinates': [30.9200, 77.0350]},
-                {'name': 'Dharampur Outskirts', 'location': 'Town Entry', 'coordinates': [30.9000, 77.0400]},
-                {'name': 'Dharampur Main Stand', 'location': 'Central', 'coordinates': [30.8750, 77.0500]}
-            ]
-        },
-        {
-            'id': 5,
-            'name': 'Dharampur → Solan Deluxe',
-            'busNumber': 'HT-105',
-            'from': 'Dharampur',
-            'to': 'Solan',
-            'type': 'Deluxe',
-            'distance': '25 km',
-            'duration': '1h 15m',
-            'stops': 7,
-            'color': '#9370DB',
-            'price': 160,
-            'departure_time': '10:00 AM',
-            'arrival_time': '11:15 AM',
-            'coordinates': [
-                [30.8750, 77.0500],
-                [30.8850, 77.0750],
-                [30.8950, 77.1000],
-                [30.9050, 77.1250],
-                [30.9100, 77.1450],
-                [30.9120, 77.1600],
-                [30.9100, 77.1734]
-            ],
-            'stops_data': [
-                {'name': 'Dharampur Main Stand', 'location': 'Central', 'coordinates': [30.8750, 77.0500]},
-                {'name': 'Garden Point', 'location': 'Park Area', 'coordinates': [30.8850, 77.0750]},
-                {'name': 'Shopping Complex', 'location': 'Commercial', 'coordinates': [30.8950, 77.1000]},
-                {'name': 'Hilltop View', 'location': 'Scenic', 'coordinates': [30.9050, 77.1250]},
-                {'name': 'Resort Area', 'location': 'Tourist Zone', 'coordinates': [30.9100, 77.1450]},
-                {'name': 'Solan University', 'location': 'Education Hub', 'coordinates': [30.9120, 77.1600]},
-                {'name': 'Solan Bus Terminal', 'location': 'Central', 'coordinates': [30.9100, 77.1734]}
-            ]
-        },
-        {
-            'id': 6,
-            'name': 'Dharampur → Solan Premium',
-            'busNumber': 'HT-106',
-            'from': 'Dharampur',
-            'to': 'Solan',
-            'type': 'Premium',
-            'distance': '25 km',
-            'duration': '1h',
-            'stops': 5,
-            'color': '#FF1493',
-            'price': 170,
-            'departure_time': '12:00 PM',
-            'arrival_time': '01:00 PM',
-            'coordinates': [
-                [30.8750, 77.0500],
-                [30.8900, 77.0850],
-                [30.9000, 77.1200],
-                [30.9080, 77.1500],
-                [30.9100, 77.1734]
-            ],
-            'stops_data': [
-                {'name': 'Dharampur Main Stand', 'location': 'Central', 'coordinates': [30.8750, 77.0500]},
-                {'name': 'Express Highway', 'location': 'Fast Route', 'coordinates': [30.8900, 77.0850]},
-                {'name': 'Premium Rest Stop', 'location': 'Facilities', 'coordinates': [30.9000, 77.1200]},
-                {'name': 'City Bypass', 'location': 'Direct Route', 'coordinates': [30.9080, 77.1500]},
-                {'name': 'Solan Bus Terminal', 'location': 'Central', 'coordinates': [30.9100, 77.1734]}
-            ]
-        },
-        {
-            'id': 7,
-            'name': 'Solan → Barog Standard',
-            'busNumber': 'HT-107',
-            'from': 'Solan',
-            'to': 'Barog',
-            'type': 'Standard',
-            'distance': '20 km',
-            'duration': '50m',
-            'stops': 7,
-            'color': '#20B2AA',
-            'price': 110,
-            'departure_time': '11:30 AM',
-            'arrival_time': '12:20 PM',
-            'coordinates': [
-                [30.9100, 77.1734],
-                [30.9180, 77.1550],
-                [30.9260, 77.1350],
-                [30.9340, 77.1150],
-                [30.9420, 77.0950],
-                [30.9500, 77.0800],
-                [30.9600, 77.0700]
-            ],
-            'stops_data': [
-                {'name': 'Solan Bus Terminal', 'location': 'Central', 'coordinates': [30.9100, 77.1734]},
-                {'name': 'Temple Road', 'location': 'Religious Site', 'coordinates': [30.9180, 77.1550]},
-                {'name': 'Market Square', 'location': 'Shopping', 'coordinates': [30.9260, 77.1350]},
-                {'name': 'School Junction', 'location': 'Education Zone', 'coordinates': [30.9340, 77.1150]},
-                {'name': 'Forest Entry', 'location': 'Nature Area', 'coordinates': [30.9420, 77.0950]},
-                {'name': 'Barog Approach', 'location': 'Town Entry', 'coordinates': [30.9500, 77.0800]},
-                {'name': 'Barog Station', 'location': 'Railway', 'coordinates': [30.9600, 77.0700]}
-            ]
-        },
-        {
-            'id': 8,
-            'name': 'Barog → Dagshai Deluxe',
-            'busNumber': 'HT-108',
-            'from': 'Barog',
-            'to': 'Dagshai',
-            'type': 'Deluxe',
-            'distance': '22 km',
-            'duration': '55m',
-            'stops': 6,
-            'color': '#FF8C00',
-            'price': 130,
-            'departure_time': '02:00 PM',
-            'arrival_time': '02:55 PM',
-            'coordinates': [
-                [30.9600, 77.0700],
-                [30.9680, 77.0520],
-                [30.9760, 77.0340],
-                [30.9840, 77.0160],
-                [30.9870, 76.9980],
-                [30.9900, 76.9800]
-            ],
-            'stops_data': [
-                {'name': 'Barog Station', 'location': 'Railway', 'coordinates': [30.9600, 77.0700]},
-                {'name': 'Tunnel Vista', 'location': 'Heritage View', 'coordinates': [30.9680, 77.0520]},
-                {'name': 'Mountain Pass', 'location': 'High Point', 'coordinates': [30.9760, 77.0340]},
-                {'name': 'Valley Bridge', 'location': 'Bridge Crossing', 'coordinates': [30.9840, 77.0160]},
-                {'name': 'Cantonment Gate', 'location': 'Entry Point', 'coordinates': [30.9870, 76.9980]},
-                {'name': 'Dagshai Cantonment', 'location': 'Central', 'coordinates': [30.9900, 76.9800]}
-            ]
-        }
-    ]
-    
-    # Destinations for filters
-    destinations = ['Dharampur', 'Solan', 'Barog', 'Dagshai']
-    
-    # Convert routes to JSON for JavaScript
-    import json
-    routes_json = json.dumps(routes)
-    
-    # Get Weather API key from environment
-    weather_api_key = os.getenv('WEATHER_API_KEY', '')
-    
     return render_template('features/route_explorer.html',
-                          routes=routes,
-                          routes_json=routes_json,
-                          destinations=destinations,
-                          weather_api_key=weather_api_key)
+                          routes=ROUTE_EXPLORER_ROUTES,
+                          routes_json=ROUTE_EXPLORER_ROUTES_JSON,
+                          destinations=ROUTE_EXPLORER['destinations'])
+
+@app.route('/api/routes/<int:route_id>/geometry')
+def route_geometry(route_id):
+    """A route's line (simplified for ?zoom=, default the most detailed) and stops as encoded polylines."""
+    geometry = ROUTE_GEOMETRY.get(route_id)
+    if geometry is None:
+        return jsonify({'error': 'Route not found'}), 404
+    
+    response = jsonify(geometry.payload(request.args.get('zoom', GEOMETRY_ZOOMS[-1], type=int)))
+    # Routes only change on deploy
+    response.cache_control.public = True
+    response.cache_control.max_age = 3600
+    response.add_etag()
+    return response.make_conditional(request)
 
 @app.route('/travel-companions')
 def travel_companions():
@@ -1427,35 +3780,54 @@ def travel_companions():
     return render_template('features/travel_companions.html')
 
 @app.route('/copyright')
+@cached_page()
 def copyright_notice():
     """Copyright notice page"""
     return render_template('footer/copyright.html')
 
 @app.route('/cookie-policy')
+@cached_page()
 def cookie_policy():
     """Cookie policy page"""
     return render_template('footer/cookie_policy.html')
 
 @app.route('/disclaimer')
+@cached_page()
 def disclaimer():
     """Disclaimer page"""
     return render_template('footer/disclaimer.html')
 
 @app.route('/terms')
+@cached_page()
 def terms_of_service():
     """Terms of service page"""
     return render_template('footer/terms.html')
 
 @app.route('/privacy')
+@cached_page()
 def privacy_policy():
     """Privacy policy page"""
     return render_template('footer/privacy.html')
 
 @app.route('/newsletter')
+@cached_page()
 def newsletter():
     """Newsletter signup page"""
     return render_template('footer/newsletter.html')
 
+# Startup. Spawned photo workers re-import the main module as __mp_main__
+# when the app is run as `python app.py`; they only render variants, so the
+# database setup, autocomplete build and background jobs stay in the real app
+# process. Background jobs start last, once everything they use (Route
+# Explorer data, poetry, the autocomplete index) is defined.
+if __name__ != '__mp_main__':
+    init_database()
+    # Autocomplete also lists Route Explorer stops, so its first build waits for them
+    with app.app_context():
+        location_autocomplete.rebuild()
+    if app.config['SCHEDULER_ENABLED']:
+        scheduler.start()
+
 # Run the application
 if __name__ == '__main__':
     # Use SQLite for local development
@@ -0,0 +1,123 @@
+"""Build fingerprinted, minified and precompressed copies of the static assets.
+
+CSS and JavaScript under static/ are minified, every asset is copied to
+static/dist/ under a content-hashed name, and text assets get .gz and .br
+siblings. static/dist/manifest.json maps each source path to its built name;
+the app reads it at startup so url_for('static', ...) points at the built
+files, which are then served with long-lived immutable caching:
+
+    pip install -r requirements.txt
+    python build_assets.py
+
+Rerun after changing anything under static/ (or delete static/dist to go
+back to serving the source files).
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+import brotli
+import rcssmin
+import rjsmin
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(ROOT, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+
+MINIFIERS = {'.css': rcssmin.cssmin, '.js': rjsmin.jsmin}
+# Images and fonts are already compressed; only these get .gz/.br siblings
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.map'}
+
+# Relative url(...) references inside stylesheets, rewritten to built names
+CSS_URL = re.compile(r"""url\(\s*(['"]?)(?!data:|https?:|//|/)([^'")?#]+)([^'")]*)\1\s*\)""")
+
+
+def source_files():
+    """Paths under static/ (relative, with forward slashes), skipping dist/ itself."""
+    for folder, dirs, files in os.walk(STATIC_DIR):
+        dirs[:] = sorted(d for d in dirs if os.path.join(folder, d) != DIST_DIR)
+        for name in sorted(files):
+            if not name.startswith('.'):
+                yield os.path.relpath(os.path.join(folder, name), STATIC_DIR).replace(os.sep, '/')
+
+
+def fingerprinted(path, content):
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def rewrite_css_urls(css, path, manifest):
+    """Point url(...) references at the built copies of the files they name."""
+    folder = os.path.dirname(path)
+
+    def replace(match):
+        quote, target, suffix = match.groups()
+        resolved = os.path.normpath(os.path.join(folder, target)).replace(os.sep, '/')
+        if resolved not in manifest:
+            return match.group(0)
+        built = os.path.relpath(manifest[resolved], folder or '.').replace(os.sep, '/')
+        return f"url({quote}{built}{suffix}{quote})"
+    return CSS_URL.sub(replace, css)
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def build(compress=True):
+    """Rebuild static/dist; returns {source path: (source bytes, built bytes)}."""
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    manifest, sizes = {}, {}
+    # Stylesheets last, so the files they reference already have built names
+    paths = sorted(source_files(), key=lambda path: path.endswith('.css'))
+    for path in paths:
+        with open(os.path.join(STATIC_DIR, path), 'rb') as f:
+            original = f.read()
+        ext = os.path.splitext(path)[1].lower()
+        content = original
+        if ext in MINIFIERS:
+            text = MINIFIERS[ext](original.decode('utf-8'))
+            if ext == '.css':
+                text = rewrite_css_urls(text, path, manifest)
+            content = text.encode('utf-8')
+
+        built = fingerprinted(path, content)
+        target = os.path.join(DIST_DIR, built)
+        write(target, content)
+        if compress and ext in COMPRESSIBLE:
+            # Siblings are only worth serving when they are actually smaller
+            for suffix, packed in (('.gz', gzip.compress(content, 9, mtime=0)),
+                                   ('.br', brotli.compress(content, quality=11))):
+                if len(packed) < len(content):
+                    write(target + suffix, packed)
+        manifest[path] = built
+        sizes[path] = (len(original), len(content))
+
+    write(os.path.join(DIST_DIR, 'manifest.json'),
+          json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--no-compress', action='store_true', help='skip the .gz/.br siblings')
+    args = parser.parse_args()
+
+    sizes = build(compress=not args.no_compress)
+    for path, (before, after) in sizes.items():
+        if before != after:
+            print(f"{path}: {before / 1024:.1f} KB -> {after / 1024:.1f} KB")
+    before = sum(size for size, _ in sizes.values())
+    after = sum(size for _, size in sizes.values())
+    print(f"built {len(sizes)} assets into {os.path.relpath(DIST_DIR, ROOT)}: "
+          f"{before / 1024:.0f} KB -> {after / 1024:.0f} KB before compression")
+
+
+if __name__ == '__main__':
+    main()
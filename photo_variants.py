@@ -0,0 +1,49 @@
+"""Resize uploaded gallery photos into the sizes the travel gallery serves.
+
+This runs in freshly spawned worker processes (see PhotoPipeline in
+app.py). It imports nothing from the app, so it only needs Pillow.
+"""
+import os
+import uuid
+
+from PIL import Image, ImageOps
+
+# Extension -> (Pillow format, save options)
+FORMATS = {
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+}
+
+
+def render_variants(original, out_dir, widths):
+    """Write <width>.jpg and <width>.webp into out_dir for each of `widths`.
+
+    Photos narrower than a width get one variant at their own width
+    instead of being upscaled. Returns the widths written, smallest first.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    with Image.open(original) as image:
+        # Let the JPEG decoder downscale while decoding, big enough for either orientation
+        largest = max(widths)
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        written = []
+        for width in sorted({min(width, image.width) for width in widths}):
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            for ext, (fmt, options) in FORMATS.items():
+                path = os.path.join(out_dir, f'{width}.{ext}')
+                # A unique temp name, since another worker may be rendering the same photo
+                temp = f'{path}.{uuid.uuid4().hex}.tmp'
+                try:
+                    resized.save(temp, fmt, **options)
+                    os.replace(temp, path)  # readers never see half-written files
+                except BaseException:
+                    if os.path.exists(temp):
+                        os.unlink(temp)
+                    raise
+            written.append(width)
+        return written
@@ -0,0 +1,140 @@
+"""Replay GPS pings along the Route Explorer polylines against /api/gps/pings.
+
+Every bus drives its route back and forth at --speed, and pings are posted
+in batches from several threads so ingestion can be load tested locally:
+
+    GPS_INGEST_TOKEN=dev flask --app app run
+    GPS_INGEST_TOKEN=dev python simulate_gps.py --rate 5000 --duration 30
+
+Bus ids are read from the same database the app uses (DATABASE_URL).
+"""
+import argparse
+import math
+import os
+import queue
+import threading
+import time
+
+import requests
+
+os.environ['HAPPYTRAILS_SCHEDULER'] = '0'  # only the server should run background jobs
+from app import app, Bus, route_for_bus  # noqa: E402
+
+
+def haversine_km(a, b):
+    lat1, lng1, lat2, lng2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371 * math.asin(math.sqrt(h))
+
+
+class RouteWalker:
+    """Position and heading of a bus `km` along a polyline, bouncing at the ends."""
+
+    def __init__(self, coordinates):
+        self.coordinates = coordinates
+        self.offsets = [0.0]
+        for a, b in zip(coordinates, coordinates[1:]):
+            self.offsets.append(self.offsets[-1] + haversine_km(a, b))
+        self.length = self.offsets[-1]
+
+    def at(self, km):
+        km %= 2 * self.length
+        forward = km <= self.length
+        km = km if forward else 2 * self.length - km
+        for i in range(1, len(self.offsets)):
+            if km <= self.offsets[i] or i == len(self.offsets) - 1:
+                break
+        (lat1, lng1), (lat2, lng2) = self.coordinates[i - 1], self.coordinates[i]
+        span = self.offsets[i] - self.offsets[i - 1] or 1
+        t = (km - self.offsets[i - 1]) / span
+        heading = math.degrees(math.atan2(lng2 - lng1, lat2 - lat1)) % 360
+        return lat1 + (lat2 - lat1) * t, lng1 + (lng2 - lng1) * t, heading if forward else (heading + 180) % 360
+
+
+def fleet_routes():
+    """[(bus_id, RouteWalker)] for every bus that has a route."""
+    with app.app_context():
+        buses = Bus.query.order_by(Bus.id).all()
+        fleet = []
+        for bus in buses:
+            route = route_for_bus(bus)
+            if route:
+                fleet.append((bus.id, RouteWalker(route['coordinates'])))
+    return fleet
+
+
+def post_batches(url, token, batches, results):
+    session = requests.Session()
+    session.headers['Authorization'] = f'Bearer {token}'
+    while True:
+        batch = batches.get()
+        if batch is None:
+            return
+        started = time.perf_counter()
+        try:
+            response = session.post(url, json={'pings': batch}, timeout=10)
+            body = response.json() if response.status_code == 202 else {}
+        except requests.RequestException as e:
+            body = {'error': str(e)}
+        results.append((time.perf_counter() - started, len(batch), body))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000/api/gps/pings')
+    parser.add_argument('--token', default=os.getenv('GPS_INGEST_TOKEN', ''))
+    parser.add_argument('--rate', type=int, default=1000, help='pings per second across the fleet')
+    parser.add_argument('--batch', type=int, default=200, help='pings per request')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent senders')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--speed', type=float, default=40, help='bus speed in km/h')
+    args = parser.parse_args()
+
+    fleet = fleet_routes()
+    if not fleet:
+        raise SystemExit('No buses match a route; start the app once to seed the database.')
+
+    batches = queue.Queue(maxsize=args.workers * 4)
+    results = []
+    senders = [threading.Thread(target=post_batches, args=(args.url, args.token, batches, results))
+               for _ in range(args.workers)]
+    for sender in senders:
+        sender.start()
+
+    start = time.time()
+    sent = 0
+    batch = []
+    while time.time() - start < args.duration:
+        # Hold the overall rate: sleep until the next ping is due
+        delay = start + sent / args.rate - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        now = time.time()
+        bus_id, walker = fleet[sent % len(fleet)]
+        lat, lng, heading = walker.at(args.speed * (now - start) / 3600 + bus_id)
+        batch.append({'bus_id': bus_id, 'lat': round(lat, 6), 'lng': round(lng, 6), 'ts': now,
+                      'speed': args.speed, 'heading': round(heading, 1)})
+        sent += 1
+        if len(batch) >= args.batch:
+            batches.put(batch)
+            batch = []
+    if batch:
+        batches.put(batch)
+    for _ in senders:
+        batches.put(None)
+    for sender in senders:
+        sender.join()
+
+    elapsed = time.time() - start
+    latencies = sorted(latency for latency, _, _ in results)
+    accepted = sum(body.get('accepted', 0) for _, _, body in results)
+    failed = sum(1 for _, _, body in results if 'accepted' not in body)
+    print(f"sent {sent} pings in {len(results)} requests over {elapsed:.1f}s "
+          f"({sent / elapsed:.0f}/s), accepted {accepted}, failed requests {failed}")
+    if latencies:
+        print(f"request latency p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
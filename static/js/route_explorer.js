@@ -19,6 +19,7 @@ let markerLayers = [];
 let allRoutes = [];
 let filteredRoutes = [];
 let activeRouteId = null;
+const routeGeometryCache = new Map(); // "routeId:zoom" -> Promise of decoded geometry
 
 // Map center (approximate center of Himachal Pradesh region)
 const MAP_CENTER = [30.9010, 77.1734]; // Near Solan
@@ -69,6 +70,9 @@ function initializeMap() {
     // Add fullscreen control (custom)
     addFullscreenControl();
 
+    // Route lines are simplified per zoom level, so fetch the matching detail
+    map.on('zoomend', refreshRouteLines);
+
     console.log('🗺️ Map initialized');
 }
 
@@ -130,6 +134,73 @@ function loadRoutes() {
     console.log(`📍 Loaded ${allRoutes.length} routes`);
 }
 
+// ============================================
+// ROUTE GEOMETRY
+// ============================================
+
+// Decode a Google encoded polyline into [[lat, lng], ...]
+function decodePolyline(encoded, precision = 5) {
+    const factor = Math.pow(10, precision);
+    const points = [];
+    let index = 0, lat = 0, lng = 0;
+
+    while (index < encoded.length) {
+        const deltas = [];
+        for (let i = 0; i < 2; i++) {
+            let shift = 0, result = 0, byte;
+            do {
+                byte = encoded.charCodeAt(index++) - 63;
+                result |= (byte & 0x1f) << shift;
+                shift += 5;
+            } while (byte >= 0x20);
+            deltas.push(result & 1 ? ~(result >> 1) : result >> 1);
+        }
+        lat += deltas[0];
+        lng += deltas[1];
+        points.push([lat / factor, lng / factor]);
+    }
+    return points;
+}
+
+// Fetch a route's line (simplified for the zoom level) and stops, once per zoom
+function fetchRouteGeometry(routeId, zoom) {
+    const key = `${routeId}:${zoom}`;
+    if (!routeGeometryCache.has(key)) {
+        const request = fetch(`/api/routes/${routeId}/geometry?zoom=${zoom}`)
+            .then(response => {
+                if (!response.ok) throw new Error(`Geometry request failed: ${response.status}`);
+                return response.json();
+            })
+            .then(data => ({
+                line: decodePolyline(data.line, data.precision),
+                stops: decodePolyline(data.stop_line, data.precision).map((coordinates, index) => ({
+                    ...data.stops[index],
+                    coordinates
+                }))
+            }))
+            .catch(error => {
+                routeGeometryCache.delete(key);
+                throw error;
+            });
+        routeGeometryCache.set(key, request);
+    }
+    return routeGeometryCache.get(key);
+}
+
+function refreshRouteLines() {
+    const zoom = map.getZoom();
+    routeLayers.forEach(routeLayer => {
+        fetchRouteGeometry(routeLayer.id, zoom)
+            .then(geometry => {
+                // Skip lines removed (or zoomed past) while the request was in flight
+                if (routeLayers.includes(routeLayer) && map.getZoom() === zoom) {
+                    routeLayer.layer.setLatLngs(geometry.line);
+                }
+            })
+            .catch(error => console.error('Error loading route geometry:', error));
+    });
+}
+
 // ============================================
 // MAP RENDERING
 // ============================================
@@ -138,9 +209,14 @@ function renderRoutesOnMap() {
     // Clear existing layers
     clearMapLayers();
     
+    // Fit map to show all routes (before loading lines, so they load at the final zoom)
+    if (filteredRoutes.length > 0) {
+        map.fitBounds(L.latLngBounds(filteredRoutes.flatMap(route => route.bounds)).pad(0.1));
+    }
+    
     filteredRoutes.forEach(route => {
-        // Draw route polyline
-        const polyline = L.polyline(route.coordinates, {
+        // Draw route polyline (its points arrive from the geometry API)
+        const polyline = L.polyline([], {
             color: route.color,
             weight: 5,
             opacity: 0.7,
@@ -181,58 +257,64 @@ function renderRoutesOnMap() {
             selectRoute(route.id);
         });
         
-        routeLayers.push({
+        const routeLayer = {
             id: route.id,
             layer: polyline
-        });
+        };
+        routeLayers.push(routeLayer);
         
-        // Add markers for stops
-        route.stops_data.forEach((stop, index) => {
-            const isStart = index === 0;
-            const isEnd = index === route.stops_data.length - 1;
-            
-            let iconHtml = '';
-            let iconColor = route.color;
-            
-            if (isStart) {
-                iconHtml = '<i class="fas fa-circle" style="color: #32CD32;"></i>';
-            } else if (isEnd) {
-                iconHtml = '<i class="fas fa-flag-checkered" style="color: #FF6347;"></i>';
-            } else {
-                iconHtml = '<i class="fas fa-map-pin" style="color: ' + iconColor + ';"></i>';
-            }
-            
-            const marker = L.marker(stop.coordinates, {
-                icon: L.divIcon({
-                    html: iconHtml,
-                    className: 'custom-marker',
-                    iconSize: [30, 30],
-                    iconAnchor: [15, 30]
-                })
-            }).addTo(map);
-            
-            marker.bindPopup(`
-                <div class="marker-popup">
-                    <div class="marker-popup-title">
-                        ${isStart ? '🚀 ' : isEnd ? '🏁 ' : ''}
-                        ${stop.name}
-                    </div>
-                    <div class="marker-popup-details">
-                        ${stop.location}<br>
-                        <small>Stop ${index + 1} of ${route.stops_data.length}</small>
-                    </div>
+        const zoom = map.getZoom();
+        fetchRouteGeometry(route.id, zoom)
+            .then(geometry => {
+                if (!routeLayers.includes(routeLayer)) return; // map was redrawn meanwhile
+                if (map.getZoom() === zoom) polyline.setLatLngs(geometry.line);
+                addStopMarkers(route, geometry.stops);
+            })
+            .catch(error => console.error('Error loading route geometry:', error));
+    });
+}
+
+function addStopMarkers(route, stops) {
+    // Add markers for stops
+    stops.forEach((stop, index) => {
+        const isStart = index === 0;
+        const isEnd = index === stops.length - 1;
+        
+        let iconHtml = '';
+        let iconColor = route.color;
+        
+        if (isStart) {
+            iconHtml = '<i class="fas fa-circle" style="color: #32CD32;"></i>';
+        } else if (isEnd) {
+            iconHtml = '<i class="fas fa-flag-checkered" style="color: #FF6347;"></i>';
+        } else {
+            iconHtml = '<i class="fas fa-map-pin" style="color: ' + iconColor + ';"></i>';
+        }
+        
+        const marker = L.marker(stop.coordinates, {
+            icon: L.divIcon({
+                html: iconHtml,
+                className: 'custom-marker',
+                iconSize: [30, 30],
+                iconAnchor: [15, 30]
+            })
+        }).addTo(map);
+        
+        marker.bindPopup(`
+            <div class="marker-popup">
+                <div class="marker-popup-title">
+                    ${isStart ? '🚀 ' : isEnd ? '🏁 ' : ''}
+                    ${stop.name}
                 </div>
-            `);
-            
-            markerLayers.push(marker);
-        });
+                <div class="marker-popup-details">
+                    ${stop.location}<br>
+                    <small>Stop ${index + 1} of ${stops.length}</small>
+                </div>
+            </div>
+        `);
+        
+        markerLayers.push(marker);
     });
-    
-    // Fit map to show all routes
-    if (filteredRoutes.length > 0 && routeLayers.length > 0) {
-        const group = L.featureGroup(routeLayers.map(r => r.layer));
-        map.fitBounds(group.getBounds().pad(0.1));
-    }
 }
 
 function clearMapLayers() {
@@ -327,7 +409,8 @@ function selectRoute(routeId) {
             });
             
             // Zoom to route
-            map.fitBounds(routeLayer.layer.getBounds().pad(0.2));
+            const route = allRoutes.find(r => r.id === routeId);
+            map.fitBounds(L.latLngBounds(route.bounds).pad(0.2));
             
             // Open popup
             routeLayer.layer.openPopup();
@@ -1391,19 +1474,21 @@ async function fetchWeatherData(isRefresh = false) {
     }
     
     const destinations = ['Dharampur', 'Solan', 'Barog', 'Dagshai'];
-    const promises = [];
-    
-    // Fetch weather for each destination
-    for (const destination of destinations) {
-        promises.push(fetchCityWeather(destination));
-    }
     
     try {
-        const results = await Promise.all(promises);
+        // One request for every destination, answered from the server's weather cache
+        const response = await fetch(`/api/weather?cities=${destinations.map(encodeURIComponent).join(',')}`);
+        
+        if (!response.ok) {
+            throw new Error(`Weather API error: ${response.status}`);
+        }
+        
+        const results = await response.json();
         
-        results.forEach((data, index) => {
+        destinations.forEach(destination => {
+            const data = results[destination];
             if (data) {
-                weatherData[destinations[index]] = data;
+                weatherData[destination] = toWeatherCard(destination, data);
             }
         });
         
@@ -1429,48 +1514,21 @@ async function fetchWeatherData(isRefresh = false) {
     }
 }
 
-async function fetchCityWeather(city) {
-    // Use approximate coordinates for Himachal Pradesh cities
-    const cityCoords = {
-        'Dharampur': { lat: 30.8750, lon: 77.0500 },
-        'Solan': { lat: 30.9100, lon: 77.1734 },
-        'Barog': { lat: 30.9600, lon: 77.0700 },
-        'Dagshai': { lat: 30.9900, lon: 76.9800 }
+function toWeatherCard(city, data) {
+    return {
+        city: city,
+        temp: Math.round(data.temperature),
+        feels_like: Math.round(data.feels_like ?? data.temperature),
+        condition: data.condition,
+        description: data.description,
+        humidity: data.humidity,
+        wind_speed: data.wind_speed,
+        pressure: data.pressure,
+        visibility: (data.visibility ?? 10000) / 1000, // Convert to km
+        sunrise: new Date(data.sunrise * 1000),
+        sunset: new Date(data.sunset * 1000),
+        icon: weatherIcons[data.condition] || '🌤️'
     };
-    
-    const coords = cityCoords[city];
-    if (!coords) return null;
-    
-    try {
-        const response = await fetch(
-            `https://api.openweathermap.org/data/2.5/weather?lat=${coords.lat}&lon=${coords.lon}&appid=${WEATHER_API_KEY}&units=metric`
-        );
-        
-        if (!response.ok) {
-            throw new Error(`Weather API error: ${response.status}`);
-        }
-        
-        const data = await response.json();
-        
-        return {
-            city: city,
-            temp: Math.round(data.main.temp),
-            feels_like: Math.round(data.main.feels_like),
-            condition: data.weather[0].main,
-            description: data.weather[0].description,
-            humidity: data.main.humidity,
-            wind_speed: data.wind.speed,
-            pressure: data.main.pressure,
-            visibility: data.visibility / 1000, // Convert to km
-            sunrise: new Date(data.sys.sunrise * 1000),
-            sunset: new Date(data.sys.sunset * 1000),
-            icon: weatherIcons[data.weather[0].main] || '🌤️'
-        };
-        
-    } catch (error) {
-        console.error(`Error fetching weather for ${city}:`, error);
-        return null;
-    }
 }
 
 // ============================================
@@ -2458,12 +2516,16 @@ function initializePOIMap() {
     
     // Add route lines (lighter)
     allRoutes.forEach(route => {
-        L.polyline(route.coordinates, {
-            color: route.color,
-            weight: 3,
-            opacity: 0.3,
-            smoothFactor: 1
-        }).addTo(poiMap);
+        fetchRouteGeometry(route.id, poiMap.getZoom())
+            .then(geometry => {
+                L.polyline(geometry.line, {
+                    color: route.color,
+                    weight: 3,
+                    opacity: 0.3,
+                    smoothFactor: 1
+                }).addTo(poiMap);
+            })
+            .catch(error => console.error('Error loading route geometry:', error));
     });
     
     // Add POI markers
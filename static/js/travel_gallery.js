@@ -19,6 +19,8 @@ let allPhotos = [];
 let particleCanvas, particleCtx;
 let particles = [];
 let mouseX = 0, mouseY = 0;
+let nextGalleryCursor = null;
+let galleryRequest = 0; // ignores responses to superseded filter/sort requests
 
 // ============================================
 // INITIALIZATION
@@ -36,10 +38,16 @@ function initializeEnchantedGallery() {
     initializeBackToTop();
     addConstellationLines();
     
-    // Store all photos for filtering
+    // Store the first page of photos; filters, sorting and more pages come from /api/gallery
     allPhotos = Array.from(document.querySelectorAll('.photo-card'));
     visiblePhotos = [...allPhotos];
     
+    const galleryGrid = document.querySelector('.gallery-grid');
+    if (galleryGrid) {
+        nextGalleryCursor = galleryGrid.dataset.nextCursor || null;
+        updateFacetCounts(JSON.parse(galleryGrid.dataset.facets || '{}'));
+    }
+    
     console.log('💖 Enchanted Gallery initialized successfully!');
 }
 
@@ -155,9 +163,7 @@ function animateParticles() {
 // 3D PARALLAX EFFECT
 // ============================================
 
-function setupParallaxEffect() {
-    const cards = document.querySelectorAll('.photo-card');
-    
+function setupParallaxEffect(cards = document.querySelectorAll('.photo-card')) {
     cards.forEach(card => {
         card.addEventListener('mousemove', (e) => {
             const rect = card.getBoundingClientRect();
@@ -259,59 +265,197 @@ function setupFilters() {
 }
 
 function applyFilters() {
-    const destinationFilter = document.querySelector('[data-filter-type="destination"].active').getAttribute('data-filter');
-    const typeFilter = document.querySelector('[data-filter-type="type"].active').getAttribute('data-filter');
-    const seasonFilter = document.querySelector('[data-filter-type="season"].active').getAttribute('data-filter');
-    
-    visiblePhotos = allPhotos.filter(photo => {
-        const photoDestination = photo.getAttribute('data-destination');
-        const photoType = photo.getAttribute('data-type');
-        const photoSeason = photo.getAttribute('data-season');
-        
-        const matchDestination = destinationFilter === 'all' || photoDestination === destinationFilter;
-        const matchType = typeFilter === 'all' || photoType === typeFilter;
-        const matchSeason = seasonFilter === 'all' || photoSeason === seasonFilter;
-        
-        return matchDestination && matchType && matchSeason;
+    loadGalleryPage(false).then(photos => {
+        if (photos && photos.length === 0) {
+            showGalleryToast('No photos found. Try different filters! 🔍', 3000);
+        }
+    });
+}
+
+// The filters and sort order currently chosen, as /api/gallery parameters
+function galleryQuery() {
+    const params = new URLSearchParams();
+    ['destination', 'type', 'season'].forEach(facet => {
+        const active = document.querySelector(`[data-filter-type="${facet}"].active`);
+        const value = active ? active.getAttribute('data-filter') : 'all';
+        if (value !== 'all') params.set(facet, value);
     });
+    const sortSelect = document.getElementById('sortSelect');
+    params.set('sort', sortSelect ? sortSelect.value : 'latest');
+    return params;
+}
+
+// Fetch a page of photos: the first one (replacing the grid) or the next one (appended)
+function loadGalleryPage(append) {
+    const params = galleryQuery();
+    if (append) {
+        if (!nextGalleryCursor) return Promise.resolve([]);
+        params.set('cursor', nextGalleryCursor);
+    }
+    const request = ++galleryRequest;
+    
+    return fetch(`/api/gallery?${params}`)
+        .then(response => {
+            if (!response.ok) throw new Error(`Gallery request failed: ${response.status}`);
+            return response.json();
+        })
+        .then(data => {
+            if (request !== galleryRequest) return null;
+            nextGalleryCursor = data.next_cursor;
+            if (data.facets) updateFacetCounts(data.facets);
+            renderGalleryPhotos(data.photos, append);
+            return data.photos;
+        })
+        .catch(error => {
+            console.error('Error loading photos:', error);
+            showGalleryToast('❌ Could not load photos. Please try again.', 3000);
+            return null;
+        });
+}
+
+function renderGalleryPhotos(photos, append) {
+    const galleryGrid = document.querySelector('.gallery-grid');
+    const offset = append ? allPhotos.length : 0;
     
-    // Update display with animation
-    allPhotos.forEach(photo => {
-        photo.style.opacity = '0';
-        photo.style.transform = 'scale(0.8)';
+    if (!append) {
+        galleryGrid.innerHTML = '';
+        allPhotos = [];
+    }
+    
+    const template = document.createElement('template');
+    template.innerHTML = photos.map((photo, index) => renderPhotoCard(photo, offset + index)).join('');
+    const cards = Array.from(template.content.children);
+    cards.forEach((card, index) => {
+        card.style.opacity = '0';
+        card.style.transform = 'scale(0.8)';
+        galleryGrid.appendChild(card);
         setTimeout(() => {
-            photo.classList.add('hidden');
-        }, 300);
+            card.style.opacity = '1';
+            card.style.transform = '';
+        }, index * 50);
     });
     
-    setTimeout(() => {
-        visiblePhotos.forEach((photo, index) => {
-            photo.classList.remove('hidden');
-            setTimeout(() => {
-                photo.style.opacity = '1';
-                photo.style.transform = '';
-            }, index * 50);
-        });
-    }, 350);
+    setupParallaxEffect(cards);
+    allPhotos = allPhotos.concat(cards);
+    visiblePhotos = [...allPhotos];
+    
+    document.querySelector('.load-more-wrapper').style.display = nextGalleryCursor ? '' : 'none';
     
     // Redraw constellation lines
     setTimeout(() => {
         document.querySelectorAll('.constellation-line').forEach(line => line.remove());
         addConstellationLines();
     }, 400);
-    
-    updateResultsCount();
 }
 
-function updateResultsCount() {
-    const count = visiblePhotos.length;
-    const total = allPhotos.length;
+// Same markup as the cards rendered by travel_gallery.html
+function renderPhotoCard(photo, index) {
+    const flowers = ['🌸', '🌺', '🌼', '🌻', '🌷'];
+    const stamps = ['VISITED', 'MEMORIES', 'JOURNEY', 'ADVENTURE'];
+    const capitalize = text => text.charAt(0).toUpperCase() + text.slice(1);
+    const location = escapeHtmlAttribute(photo.location);
+    const sizes = '(max-width: 576px) 100vw, 400px';
     
-    if (count === 0) {
-        showGalleryToast('No photos found. Try different filters! 🔍', 3000);
-    } else if (count < total) {
-        showGalleryToast(`Showing ${count} of ${total} photos 📸`, 2000);
-    }
+    const image = photo.srcset ? `
+        <picture>
+            <source type="image/webp" srcset="${escapeHtmlAttribute(photo.webp_srcset)}" sizes="${sizes}">
+            <img src="${escapeHtmlAttribute(photo.image)}" srcset="${escapeHtmlAttribute(photo.srcset)}" sizes="${sizes}"
+                 width="${photo.width}" height="${photo.height}" loading="lazy"
+                 alt="${location}" class="photo-image">
+        </picture>
+    ` : `<img src="${escapeHtmlAttribute(photo.image)}" alt="${location}" class="photo-image" loading="lazy">`;
+    
+    return `
+        <div class="photo-card" 
+             data-destination="${escapeHtmlAttribute(photo.destination)}"
+             data-type="${escapeHtmlAttribute(photo.type)}"
+             data-season="${escapeHtmlAttribute(photo.season)}"
+             data-date="${escapeHtmlAttribute(photo.date)}"
+             data-likes="${photo.likes}"
+             data-views="${photo.views}"
+             data-photo-id="${photo.id}">
+            <span class="pressed-flower">${flowers[index % 5]}</span>
+            <span class="travel-stamp">${stamps[index % 4]}</span>
+            <span class="coffee-stain"></span>
+            
+            <div class="photo-image-wrapper">
+                ${image}
+                <div class="watercolor-overlay"></div>
+            </div>
+            
+            <div class="photo-info">
+                <div class="photo-location">${location}</div>
+                <div class="photo-photographer">
+                    <i class="fas fa-camera me-1"></i>${escapeHtmlAttribute(photo.photographer)}
+                </div>
+                
+                <div class="photo-tags">
+                    <span class="photo-tag">📍 ${escapeHtmlAttribute(photo.destination)}</span>
+                    <span class="photo-tag">${escapeHtmlAttribute(capitalize(photo.type))}</span>
+                    <span class="photo-tag">${escapeHtmlAttribute(capitalize(photo.season))}</span>
+                </div>
+                
+                <div class="photo-actions">
+                    <div class="photo-stats">
+                        <span class="stat likes">
+                            <i class="fas fa-heart"></i>
+                            <span>${photo.likes}</span>
+                        </span>
+                        <span class="stat">
+                            <i class="fas fa-eye"></i>
+                            <span>${photo.views}</span>
+                        </span>
+                    </div>
+                    
+                    <div class="photo-action-btns">
+                        <button class="photo-action-btn" 
+                                onclick="likePhoto(this, '${photo.id}')"
+                                title="Like this photo">
+                            <i class="far fa-heart"></i>
+                        </button>
+                        <button class="photo-action-btn" 
+                                onclick="sharePhoto('${photo.id}', photoCardLocation(this))"
+                                title="Share">
+                            <i class="fas fa-share-alt"></i>
+                        </button>
+                        <button class="photo-action-btn" 
+                                onclick="viewOnMap(photoCardLocation(this))"
+                                title="View on map">
+                            <i class="fas fa-map-marker-alt"></i>
+                        </button>
+                    </div>
+                </div>
+            </div>
+            
+            <span class="handwritten-note">${escapeHtmlAttribute(photo.date)}</span>
+        </div>
+    `;
+}
+
+// Location of the card a button sits in (read from the page, so it never passes through inline JS)
+function photoCardLocation(element) {
+    return element.closest('.photo-card').querySelector('.photo-location').textContent;
+}
+
+function escapeHtmlAttribute(text) {
+    return String(text).replace(/[&<>"']/g, char => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    })[char]);
+}
+
+// Show how many photos each filter button matches
+function updateFacetCounts(facets) {
+    document.querySelectorAll('.filter-btn').forEach(button => {
+        const facet = button.getAttribute('data-filter-type');
+        const value = button.getAttribute('data-filter');
+        const counts = facets[facet];
+        if (!counts) return;
+        
+        // Shown by CSS (::after), so the button's own text stays as it was
+        button.dataset.count = value === 'all'
+            ? Object.values(counts).reduce((total, n) => total + n, 0)
+            : counts[value] || 0;
+    });
 }
 
 // ============================================
@@ -393,62 +537,14 @@ function setupSort() {
 }
 
 function sortPhotos(sortBy) {
-    const galleryGrid = document.querySelector('.gallery-grid');
-    let sortedPhotos = [...visiblePhotos];
-    
-    switch(sortBy) {
-        case 'latest':
-            sortedPhotos.sort((a, b) => {
-                const dateA = new Date(a.getAttribute('data-date'));
-                const dateB = new Date(b.getAttribute('data-date'));
-                return dateB - dateA;
-            });
-            showGalleryToast('Sorted by: Latest First 📅');
-            break;
-            
-        case 'popular':
-            sortedPhotos.sort((a, b) => {
-                const likesA = parseInt(a.getAttribute('data-likes'));
-                const likesB = parseInt(b.getAttribute('data-likes'));
-                return likesB - likesA;
-            });
-            showGalleryToast('Sorted by: Most Popular ❤️');
-            break;
-            
-        case 'views':
-            sortedPhotos.sort((a, b) => {
-                const viewsA = parseInt(a.getAttribute('data-views'));
-                const viewsB = parseInt(b.getAttribute('data-views'));
-                return viewsB - viewsA;
-            });
-            showGalleryToast('Sorted by: Most Viewed 👁️');
-            break;
-    }
-    
-    // Re-append sorted photos with animation
-    sortedPhotos.forEach((photo, index) => {
-        photo.style.opacity = '0';
-        photo.style.transform = 'scale(0.8)';
-    });
+    const labels = {
+        latest: 'Sorted by: Latest First 📅',
+        popular: 'Sorted by: Most Popular ❤️',
+        views: 'Sorted by: Most Viewed 👁️'
+    };
     
-    setTimeout(() => {
-        sortedPhotos.forEach(photo => {
-            galleryGrid.appendChild(photo);
-        });
-        
-        setTimeout(() => {
-            sortedPhotos.forEach((photo, index) => {
-                setTimeout(() => {
-                    photo.style.opacity = '1';
-                    photo.style.transform = '';
-                }, index * 50);
-            });
-            
-            // Redraw constellation lines
-            document.querySelectorAll('.constellation-line').forEach(line => line.remove());
-            addConstellationLines();
-        }, 100);
-    }, 300);
+    loadGalleryPage(false);
+    if (labels[sortBy]) showGalleryToast(labels[sortBy]);
 }
 
 // ============================================
@@ -631,10 +727,9 @@ function viewOnMap(location) {
 // ============================================
 
 function loadMorePhotos() {
+    if (!nextGalleryCursor) return;
     showGalleryToast('Loading more enchanted memories... ✨');
-    setTimeout(() => {
-        showGalleryToast('More photos coming soon! Stay tuned 🎉', 3000);
-    }, 1500);
+    loadGalleryPage(true);
 }
 
 // ============================================
@@ -983,7 +1078,6 @@ function uploadFile(file, metadata, index) {
     `;
     progressSection.appendChild(progressItem);
     
-    // Simulate upload with FormData
     const formData = new FormData();
     formData.append('photo', file);
     formData.append('destination', metadata.destination);
@@ -992,48 +1086,53 @@ function uploadFile(file, metadata, index) {
     formData.append('caption', metadata.caption);
     formData.append('location', metadata.location);
     
-    // Simulate progress (in real app, use xhr.upload.onprogress)
-    let progress = 0;
-    const progressInterval = setInterval(() => {
-        progress += Math.random() * 15;
-        if (progress >= 100) {
-            progress = 100;
-            clearInterval(progressInterval);
-            
-            // Mark as complete
-            setTimeout(() => {
-                progressItem.style.background = 'linear-gradient(135deg, #d4edda, #c3e6cb)';
-                progressItem.querySelector('.progress-percentage').innerHTML = '✓ Done';
-                
-                // Check if all done
-                checkAllUploadsComplete();
-            }, 500);
-        }
-        
-        const progressBar = progressItem.querySelector('.progress-bar');
-        const progressPercentage = progressItem.querySelector('.progress-percentage');
-        
+    const progressBar = progressItem.querySelector('.progress-bar');
+    const progressPercentage = progressItem.querySelector('.progress-percentage');
+    
+    // XHR rather than fetch, for upload progress events
+    const xhr = new XMLHttpRequest();
+    xhr.open('POST', '/travel-gallery/upload');
+    xhr.setRequestHeader('Accept', 'application/json');
+    
+    xhr.upload.onprogress = function(event) {
+        if (!event.lengthComputable) return;
+        const progress = event.loaded / event.total * 100;
         progressBar.style.width = `${progress}%`;
         progressPercentage.textContent = `${Math.floor(progress)}%`;
-    }, 200);
+    };
     
-    // In production, use actual fetch/axios:
-    /*
-    fetch('/travel-gallery/upload', {
-        method: 'POST',
-        body: formData
-    })
-    .then(response => response.json())
-    .then(data => {
-        if (data.success) {
-            // Handle success
+    xhr.onload = function() {
+        let data = null;
+        try {
+            data = JSON.parse(xhr.responseText);
+        } catch (error) {
+            // Signed-out visitors get the login page instead of JSON
         }
-    })
-    .catch(error => {
-        console.error('Upload error:', error);
-        showGalleryToast('❌ Upload failed. Please try again.', 4000);
-    });
-    */
+        
+        if (data && data.success) {
+            // The server resizes the photo in the background; it shows up in the gallery once ready
+            progressBar.style.width = '100%';
+            progressItem.style.background = 'linear-gradient(135deg, #d4edda, #c3e6cb)';
+            progressPercentage.innerHTML = '✓ Done';
+        } else {
+            markUploadFailed(progressItem, data && data.error ? data.error : 'Please log in to upload photos.');
+        }
+        checkAllUploadsComplete();
+    };
+    
+    xhr.onerror = function() {
+        console.error('Upload error:', file.name);
+        markUploadFailed(progressItem, 'Upload failed. Please try again.');
+        checkAllUploadsComplete();
+    };
+    
+    xhr.send(formData);
+}
+
+function markUploadFailed(progressItem, message) {
+    progressItem.style.background = 'linear-gradient(135deg, #f8d7da, #f5c6cb)';
+    progressItem.querySelector('.progress-percentage').innerHTML = '✗ Failed';
+    showGalleryToast(`❌ ${message}`, 4000);
 }
 
 function checkAllUploadsComplete() {
@@ -1041,8 +1140,18 @@ function checkAllUploadsComplete() {
     const completedItems = Array.from(allProgressItems).filter(item => 
         item.querySelector('.progress-percentage').textContent.includes('Done')
     );
+    const failedItems = Array.from(allProgressItems).filter(item => 
+        item.querySelector('.progress-percentage').textContent.includes('Failed')
+    );
     
-    if (completedItems.length === allProgressItems.length) {
+    if (completedItems.length + failedItems.length === allProgressItems.length) {
+        if (completedItems.length === 0) {
+            // Nothing went through; keep the selection so it can be retried
+            const submitBtn = document.getElementById('submitUploadBtn');
+            submitBtn.disabled = false;
+            submitBtn.innerHTML = '<i class="fas fa-cloud-upload me-2"></i>Upload Photos';
+            return;
+        }
         setTimeout(() => {
             showUploadSuccess();
         }, 1000);
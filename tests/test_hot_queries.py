@@ -0,0 +1,31 @@
+"""Every query in HOT_QUERIES is served by an index on a freshly migrated database."""
+import os
+import tempfile
+import unittest
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db'))
+os.environ.setdefault('HAPPYTRAILS_SCHEDULER', '0')
+
+import app  # noqa: E402
+
+
+class HotQueriesTest(unittest.TestCase):
+    def test_no_full_scans_or_sorts(self):
+        with app.app.app_context():
+            try:
+                for name, build_query in app.HOT_QUERIES.items():
+                    with self.subTest(query=name):
+                        plan = app.explain_query(build_query())
+                        self.assertTrue(plan)
+                        self.assertEqual(app.plan_problems(plan), [], ' | '.join(plan))
+            finally:
+                app.db.session.rollback()
+
+    def test_detects_full_scan(self):
+        self.assertTrue(app.plan_problems(['SCAN booking']))
+        self.assertTrue(app.plan_problems(['USE TEMP B-TREE FOR ORDER BY']))
+        self.assertFalse(app.plan_problems(['SCAN gallery_photo USING INDEX ix_gallery_photo_latest']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+"""Outbound HTTP client, circuit breaker and weather cache against a local stub server."""
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db'))
+os.environ.setdefault('HAPPYTRAILS_SCHEDULER', '0')
+
+import requests  # noqa: E402
+
+import app  # noqa: E402
+
+
+class StubUpstream:
+    """HTTP server answering from a script of (delay, status, body) replies.
+
+    The last reply repeats once the script runs out. Every request's
+    arrival time is recorded in `calls`.
+    """
+
+    def __init__(self):
+        self.replies = [(0, 200, {'ok': True})]
+        self.calls = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.calls.append(time.monotonic())
+                delay, status, body = stub.replies.pop(0) if len(stub.replies) > 1 else stub.replies[0]
+                time.sleep(delay)
+                payload = json.dumps(body).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # The client gave up waiting
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}/weather'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reply(self, *replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class OutboundClientTest(unittest.TestCase):
+    def setUp(self):
+        self.upstream = StubUpstream()
+        self.addCleanup(self.upstream.close)
+
+    def client(self, **options):
+        options.setdefault('connect_timeout', 1)
+        options.setdefault('read_timeout', 1)
+        options.setdefault('backoff', 0)
+        return app.OutboundClient(**options)
+
+    def test_returns_json(self):
+        self.upstream.reply((0, 200, {'temp': 21}))
+        self.assertEqual(self.client().get_json(self.upstream.url), {'temp': 21})
+
+    def test_read_timeout_is_retried_then_raised(self):
+        self.upstream.reply((0.5, 200, {}))
+        client = self.client(read_timeout=0.1, retries=2)
+        with self.assertRaises(requests.Timeout):
+            client.get_json(self.upstream.url)
+        self.assertEqual(len(self.upstream.calls), 3)
+
+    def test_server_errors_are_retried_with_backoff(self):
+        self.upstream.reply((0, 503, {}), (0, 503, {}), (0, 200, {'temp': 21}))
+        client = self.client(retries=2, backoff=0.1)
+        # Take the top of each jitter range so the waits are predictable
+        with mock.patch.object(app.random, 'uniform', lambda low, high: high):
+            self.assertEqual(client.get_json(self.upstream.url), {'temp': 21})
+        first, second, third = self.upstream.calls
+        self.assertGreaterEqual(second - first, 0.1)
+        self.assertGreaterEqual(third - second, 0.2)
+        self.assertEqual(client.stats()[self.upstream.url.split('/')[2]], {'state': 'closed', 'failures': 0})
+
+    def test_total_timeout_caps_retries(self):
+        self.upstream.reply((2, 200, {}))
+        client = self.client(read_timeout=1, total_timeout=0.3, retries=5)
+        started = time.monotonic()
+        with self.assertRaises(requests.RequestException):
+            client.get_json(self.upstream.url)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(len(self.upstream.calls), 1)
+
+    def test_breaker_opens_on_failed_attempts_and_fails_fast(self):
+        self.upstream.reply((0, 500, {}))
+        client = self.client(retries=5, failure_threshold=3, reset_timeout=60)
+        with self.assertRaises(requests.HTTPError):
+            client.get_json(self.upstream.url)
+        # The breaker opened mid-call, cutting the retries short
+        self.assertEqual(len(self.upstream.calls), 3)
+        with self.assertRaises(app.CircuitOpenError):
+            client.get_json(self.upstream.url)
+        self.assertEqual(len(self.upstream.calls), 3)
+
+    def test_breaker_closes_after_successful_trial(self):
+        self.upstream.reply((0, 500, {}))
+        client = self.client(retries=0, failure_threshold=1, reset_timeout=0.2)
+        with self.assertRaises(requests.HTTPError):
+            client.get_json(self.upstream.url)
+        breaker = client.breaker(self.upstream.url.split('/')[2])
+        self.assertEqual(breaker.state, 'open')
+
+        time.sleep(0.25)
+        self.assertEqual(breaker.state, 'half-open')
+        self.upstream.reply((0, 200, {'temp': 21}))
+        self.assertEqual(client.get_json(self.upstream.url), {'temp': 21})
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_failed_trial_reopens_breaker(self):
+        self.upstream.reply((0, 500, {}))
+        client = self.client(retries=3, failure_threshold=1, reset_timeout=0.2)
+        with self.assertRaises(requests.HTTPError):
+            client.get_json(self.upstream.url)
+        time.sleep(0.25)
+        with self.assertRaises(requests.HTTPError):
+            client.get_json(self.upstream.url)
+        # One trial request, no retries behind it
+        self.assertEqual(len(self.upstream.calls), 2)
+        self.assertEqual(client.breaker(self.upstream.url.split('/')[2]).state, 'open')
+
+
+class WeatherCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.upstream = StubUpstream()
+        self.addCleanup(self.upstream.close)
+        self.client = app.OutboundClient(connect_timeout=1, read_timeout=1, retries=0, backoff=0)
+
+    def cache(self, **options):
+        return app.WeatherCache(lambda city: self.client.get_json(self.upstream.url, {'q': city}), **options)
+
+    def wait_for(self, condition):
+        for _ in range(100):
+            if condition():
+                return
+            time.sleep(0.02)
+        self.fail('condition never became true')
+
+    def test_concurrent_misses_share_one_upstream_call(self):
+        self.upstream.reply((0.2, 200, {'temp': 21}))
+        cache = self.cache()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('Solan'))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [{'temp': 21}] * 5)
+        self.assertEqual(len(self.upstream.calls), 1)
+
+    def test_stale_value_is_served_while_refreshing(self):
+        self.upstream.reply((0, 200, {'temp': 21}))
+        cache = self.cache(ttl=0.1, stale_ttl=60)
+        cache.get('Solan')
+        time.sleep(0.15)
+
+        self.upstream.reply((0.2, 200, {'temp': 25}))
+        started = time.monotonic()
+        self.assertEqual(cache.get('Solan'), {'temp': 21})
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.wait_for(lambda: cache.get('Solan') == {'temp': 25})
+        self.assertEqual(len(self.upstream.calls), 1)
+
+    def test_failures_are_cached_briefly(self):
+        self.upstream.reply((0, 500, {}))
+        cache = self.cache(error_ttl=60)
+        self.assertIsNone(cache.get('Solan'))
+        self.assertIsNone(cache.get('Solan'))
+        self.assertEqual(len(self.upstream.calls), 1)
+        self.assertEqual(cache.stats()['errors'], 1)
+
+    def test_failed_refresh_keeps_previous_value(self):
+        self.upstream.reply((0, 200, {'temp': 21}))
+        cache = self.cache(ttl=0.05, stale_ttl=60, error_ttl=60)
+        cache.get('Solan')
+        time.sleep(0.1)
+
+        self.upstream.reply((0, 500, {}))
+        self.assertEqual(cache.get('Solan'), {'temp': 21})
+        self.wait_for(lambda: cache.stats()['errors'] == 1)
+        self.assertEqual(cache.get('Solan'), {'temp': 21})
+        self.assertEqual(len(self.upstream.calls), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()